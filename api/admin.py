@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+/admin/* endpoints for the precomputed forecasts, the model registry
+and the history cache. Shadow mode has its own (shadow.router).
+
+When ADMIN_TOKEN is set, every route requires it in the X-Admin-Token
+header.
+"""
+import asyncio
+import os
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+
+from model_registry import activate, list_versions, read_manifest, verify
+from model_service import MODEL_REGISTRY, model_info
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    token = os.getenv("ADMIN_TOKEN")
+    if token and x_admin_token != token:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+async def verify_version(version: str):
+    """
+    Raise FileNotFoundError / ValueError unless registry version
+    `version` exists and matches its manifest.
+    """
+    manifest = await asyncio.to_thread(read_manifest, MODEL_REGISTRY, version)
+    await asyncio.to_thread(verify, MODEL_REGISTRY, manifest)
+
+
+def router(refresh_forecasts, refresh_models, history_cache) -> APIRouter:
+    """
+    refresh_forecasts(force) and refresh_models(version, force) are the
+    app's coroutines (main.refresh_forecast_table, main.refresh_models).
+    """
+    api = APIRouter(prefix="/admin", dependencies=[Depends(require_admin)])
+
+    @api.post("/forecasts/refresh")
+    async def admin_refresh_forecasts(force: bool = True):
+        """
+        Rebuild the precomputed forecast table (force=false only rebuilds
+        when the artifacts or data changed).
+        """
+        try:
+            table = await refresh_forecasts(force=force)
+        except RuntimeError as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        if table is None:
+            raise HTTPException(
+                status_code=500,
+                detail="DATABASE_URL is not configured on the server.",
+            )
+        return table.info()
+
+    @api.get("/models")
+    async def admin_models():
+        """
+        The served model version and every version in the registry.
+        """
+        versions = await asyncio.to_thread(list_versions, MODEL_REGISTRY)
+        return {
+            "served": await asyncio.to_thread(model_info),
+            "versions": [
+                {
+                    k: m[k]
+                    for k in ("version", "created_at", "best_lc_model_type",
+                              "best_gen_model_type")
+                }
+                for m in versions
+            ],
+        }
+
+    @api.post("/models/reload")
+    async def admin_reload_models(version: Optional[str] = None, force: bool = False):
+        """
+        Hot-swap the served models. With ?version= that registry version is
+        made CURRENT first (so other workers' watchers follow); without it,
+        whatever CURRENT names is loaded.
+        """
+        try:
+            if version is not None:
+                # refuse a broken version before other workers follow CURRENT
+                await verify_version(version)
+                await asyncio.to_thread(activate, MODEL_REGISTRY, version)
+            return await refresh_models(version, force=force)
+        except (FileNotFoundError, ValueError) as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except RuntimeError as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    @api.get("/history-cache")
+    def admin_history_cache_stats():
+        """
+        Hit/miss/eviction counters for the history cache.
+        """
+        return history_cache.stats()
+
+    @api.delete("/history-cache")
+    def admin_invalidate_history_cache(iso3: Optional[str] = None):
+        """
+        Drop one country (?iso3=DEU) or the whole history cache, e.g. after
+        running the ETL.
+        """
+        key = iso3.strip().upper() if iso3 else None
+        removed = history_cache.invalidate(key)
+        return {"invalidated": key or "all", "removed": removed}
+
+    return api
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Async engines for the API's Postgres connections, and pool usage for
+/metrics.
+
+The API can read from a replica (DATABASE_READ_URL) while its few
+writes (FORECAST_PERSIST=postgres) and the ETL scripts use the primary
+(DATABASE_URL); see Database. Each engine has its own QueuePool of
+pool_size connections plus up to max_overflow extra ones, per uvicorn
+worker.
+
+The asyncpg dialect prepares every statement server-side and keeps the
+prepared statements per connection in an LRU of
+prepared_statement_cache_size, keyed by the SQL text, so queries that
+are executed from one module-level text() construct are parsed and
+planned once per connection. Set the size to 0 behind PgBouncer in
+transaction mode, where a statement prepared on one server connection
+is not there on the next.
+"""
+import collections
+import os
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from metrics import DB_POOL_CONNECTIONS, DB_POOL_PEAK_SATURATION, DB_POOL_SATURATION
+
+
+def async_url(url: str) -> str:
+    # Force asyncpg dialect
+    url = url.replace("postgres://", "postgresql://")
+    return url.replace("postgresql://", "postgresql+asyncpg://")
+
+
+def create_engine(url: str, pool_size: int = 5, max_overflow: int = 10,
+                  pool_timeout: float = 30.0, pool_recycle: int = 1800,
+                  pool_pre_ping: bool = True, statement_cache_size: int = 100):
+    return create_async_engine(
+        async_url(url),
+        future=True,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=pool_timeout,
+        # drop connections older than this before a server or proxy
+        # timeout does it mid-request
+        pool_recycle=pool_recycle,
+        pool_pre_ping=pool_pre_ping,
+        connect_args={"prepared_statement_cache_size": statement_cache_size},
+    )
+
+
+class PoolMonitor:
+    """
+    Connections checked out of an engine's pool, now and at peak over
+    the last `window` seconds. The peak catches bursts that a scrape
+    every few seconds would miss; reading it does not reset it, so any
+    number of scrapers (or /metrics in several tabs) see the same value.
+
+    The level is recorded per second, on checkout and (before the drop)
+    on checkin, so a level held from before the window until inside it
+    still counts.
+    """
+
+    def __init__(self, engine, pool_size: int, max_overflow: int,
+                 window: float = 60.0, clock=time.monotonic):
+        self.capacity = pool_size + max(max_overflow, 0)
+        self.window = window
+        self._clock = clock
+        self._pool = engine.sync_engine.pool
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self._levels = collections.deque()  # [second, highest level in it]
+        event.listen(engine.sync_engine, "checkout", self._checkout)
+        event.listen(engine.sync_engine, "checkin", self._checkin)
+
+    def _record(self, level: int):
+        now = int(self._clock())
+        if self._levels and self._levels[-1][0] == now:
+            self._levels[-1][1] = max(self._levels[-1][1], level)
+        else:
+            self._levels.append([now, level])
+        self._expire(now)
+
+    def _expire(self, now: float):
+        cutoff = now - self.window
+        while self._levels and self._levels[0][0] < cutoff:
+            self._levels.popleft()
+
+    def _checkout(self, dbapi_conn, record, proxy):
+        with self._lock:
+            self.in_use += 1
+            self._record(self.in_use)
+
+    def _checkin(self, dbapi_conn, record):
+        with self._lock:
+            self._record(self.in_use)
+            self.in_use = max(self.in_use - 1, 0)
+
+    @property
+    def peak(self) -> int:
+        with self._lock:
+            self._expire(self._clock())
+            return max([self.in_use] + [level for _, level in self._levels])
+
+    def snapshot(self) -> dict:
+        in_use, peak = self.in_use, self.peak
+        return {
+            "in_use": in_use,
+            "peak": peak,
+            "open": self._pool.checkedin() + self._pool.checkedout(),
+            "capacity": self.capacity,
+            "saturation": in_use / self.capacity if self.capacity else 0.0,
+            "peak_saturation": peak / self.capacity if self.capacity else 0.0,
+        }
+
+
+class Database:
+    """
+    The API's engines: `read_session` for reads (the replica when
+    `read_url` differs from `url`) and `write_session` on the primary,
+    each None without a URL, and a PoolMonitor per engine.
+    """
+
+    def __init__(self, url: str = None, read_url: str = None,
+                 peak_window: float = 60.0, **pool):
+        read_url = read_url or url
+        self.engine = create_engine(url, **pool) if url else None
+        if read_url and read_url != url:
+            self.read_engine = create_engine(read_url, **pool)
+        else:
+            self.read_engine = self.engine
+
+        self.read_session = self.write_session = None
+        self.monitors = {}  # "read" / "write" -> PoolMonitor
+        size = pool.get("pool_size", 5)
+        overflow = pool.get("max_overflow", 10)
+        if self.read_engine is not None:
+            self.read_session = sessionmaker(
+                self.read_engine, expire_on_commit=False, class_=AsyncSession
+            )
+            self.monitors["read"] = PoolMonitor(
+                self.read_engine, size, overflow, peak_window
+            )
+        if self.engine is not None:
+            self.write_session = sessionmaker(
+                self.engine, expire_on_commit=False, class_=AsyncSession
+            )
+            if self.engine is not self.read_engine:
+                self.monitors["write"] = PoolMonitor(
+                    self.engine, size, overflow, peak_window
+                )
+
+    @classmethod
+    def from_env(cls) -> "Database":
+        return cls(
+            os.getenv("DATABASE_URL"),
+            # the API's reads can go to a replica; its writes
+            # (FORECAST_PERSIST=postgres) and the ETL scripts use
+            # DATABASE_URL, the primary
+            os.getenv("DATABASE_READ_URL"),
+            # seconds over which /metrics reports the peak pool saturation
+            peak_window=float(os.getenv("DB_POOL_PEAK_WINDOW", "60")),
+            # per engine and uvicorn worker
+            pool_size=int(os.getenv("DB_POOL_SIZE", "5")),
+            max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+            pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+            pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+            pool_pre_ping=os.getenv("DB_POOL_PRE_PING", "1") not in ("0", "false", "no"),
+            # prepared statements kept per connection (0 behind PgBouncer
+            # in transaction mode)
+            statement_cache_size=int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100")),
+        )
+
+    def export_metrics(self):
+        """
+        Set the DB_POOL_* gauges from the monitors, before a scrape.
+        """
+        for name, monitor in self.monitors.items():
+            pool = monitor.snapshot()
+            for state in ("in_use", "open", "capacity"):
+                DB_POOL_CONNECTIONS.set(pool[state], pool=name, state=state)
+            DB_POOL_SATURATION.set(pool["saturation"], pool=name)
+            DB_POOL_PEAK_SATURATION.set(pool["peak_saturation"], pool=name)
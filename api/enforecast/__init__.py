@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+"""
+Feature code shared by the API, the ETL and the offline ml/ scripts.
+
+- features: share/lag feature engineering (training and serving)
+- state: EngineState, the per-country forecast starting point
+- feature_store: country_features rows and the FeatureStore built from
+  them
+
+The package only uses relative imports, so the API imports it as
+``enforecast`` (from api/, where it is deployed) and the ETL as
+``api.enforecast`` when run as ``python -m etl.load_owid_energy`` from
+the repository root.
+"""
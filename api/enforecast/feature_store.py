@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""
+Latest forecast input per country (the country_features table).
+
+A forecast only uses a country's last usable history row as model
+input, plus the lagged columns of the N_LAGS rows before it and the
+levels the recursion starts from; together that is an EngineState.
+Instead of rebuilding it from the full history on every request, it is
+computed once per data load for all countries and kept
+
+- in Postgres (country_features), rewritten by etl/load_owid_energy.py
+  and ml/build_dataset.py through refresh_country_features()
+- in memory as a FeatureStore, which the API loads from that table (or
+  builds from the in-memory panel) and starts forecasts from
+
+Rows carry the energy_yearly data version they were built from and a
+key of the column layout (feature_config.json order, ForecastEngine
+state columns, LAG_COLS), so the API never uses vectors built from
+older data or for a model with different features; those countries go
+through the history path instead.
+
+Feature vectors are stored unscaled: the GEN model takes raw features
+and the LC model's scaling is one vectorized step inside the engine.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from .features import LAG_COLS, N_LAGS, forecast_rows
+from .state import EngineState, state_columns
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FEATURE_CONFIG_PATH = os.path.join(API_DIR, "models", "feature_config.json")
+
+# countries ⋈ energy_yearly, as the API and build_dataset.py read it
+HISTORY_COLS = [
+    "country_id",
+    "iso3",
+    "name",
+    "region",
+    "subregion",
+    "income_group",
+    "population_millions",
+    "gdp_billions_usd",
+    "year",
+    "electricity_generation_twh",
+    "coal_twh",
+    "oil_twh",
+    "gas_twh",
+    "nuclear_twh",
+    "hydro_twh",
+    "solar_twh",
+    "wind_twh",
+    "other_renewables_twh",
+    "low_carbon_share_pct",
+    "fossil_share_pct",
+]
+
+HISTORY_SELECT = """
+    SELECT
+        c.country_id,
+        c.iso3,
+        c.name,
+        c.region,
+        c.subregion,
+        c.income_group,
+        c.population_millions,
+        c.gdp_billions_usd,
+        e.year,
+        e.electricity_generation_twh,
+        e.coal_twh,
+        e.oil_twh,
+        e.gas_twh,
+        e.nuclear_twh,
+        e.hydro_twh,
+        e.solar_twh,
+        e.wind_twh,
+        e.other_renewables_twh,
+        e.low_carbon_share_pct,
+        e.fossil_share_pct
+    FROM energy_yearly e
+    JOIN countries c ON c.country_id = e.country_id
+"""
+
+# cheap fingerprint of energy_yearly, see data_version()
+DATA_VERSION_SQL = (
+    "SELECT COUNT(*), MAX(year), MAX(GREATEST(created_at, updated_at)) "
+    "FROM energy_yearly"
+)
+
+
+def data_version(count, max_year, max_changed) -> str:
+    """
+    Format the DATA_VERSION_SQL result row: row count, newest year and
+    newest insert/update time of energy_yearly.
+    """
+    return f"{count}:{max_year}:{max_changed}"
+
+
+def load_feature_cols(path: str = FEATURE_CONFIG_PATH) -> list:
+    with open(path, "r") as f:
+        return json.load(f)["feature_cols"]
+
+
+def layout_key(feature_cols) -> str:
+    """
+    Hash of the order of the stored vectors for a model with these
+    feature columns.
+    """
+    layout = {
+        "features": list(feature_cols),
+        "state": state_columns(feature_cols),
+        "lags": LAG_COLS,
+        "n_lags": N_LAGS,
+    }
+    return hashlib.md5(json.dumps(layout).encode()).hexdigest()
+
+
+def prepare_panel(panel: pd.DataFrame) -> pd.DataFrame:
+    """
+    forecast_rows of a history panel (rows of HISTORY_SELECT), sorted by
+    (iso3, year) with a fresh RangeIndex.
+    """
+    panel = panel.assign(iso3=panel["iso3"].astype(str).str.strip())
+    return forecast_rows(panel, group_col="iso3").reset_index(drop=True)
+
+
+def state_arrays(hist: pd.DataFrame, rows: np.ndarray, feature_cols):
+    """
+    Stacked EngineState fields (features, current, past) for forecasts
+    starting at positions `rows` of a prepare_panel() frame. Row i only
+    depends on rows of the same country up to it, so this equals
+    ForecastEngine.initial_state on that country's history cut at row i.
+    """
+    feature_cols = list(feature_cols)
+    rows = np.asarray(rows, dtype=np.intp)
+    first = rows - hist.groupby("iso3", sort=False).cumcount().to_numpy()[rows]
+    at = hist.iloc[rows]
+
+    features = (
+        at.reindex(columns=feature_cols).astype(float).fillna(0.0).to_numpy()
+    )
+    current = (
+        at.reindex(columns=state_columns(feature_cols)).astype(float).to_numpy()
+    )
+    lagged = hist.reindex(columns=LAG_COLS).astype(float).to_numpy()
+    past = np.full((len(rows), N_LAGS, len(LAG_COLS)), np.nan)
+    for lag in range(1, N_LAGS + 1):
+        ok = rows - lag >= first
+        past[ok, N_LAGS - lag] = lagged[rows[ok] - lag]
+    return features, current, past
+
+
+def build_states(panel: pd.DataFrame, feature_cols) -> dict:
+    """
+    iso3 -> EngineState for every country of a history panel (rows of
+    HISTORY_SELECT), equal to what ForecastEngine.initial_state builds
+    from each country's history on its own.
+    """
+    if panel.empty:
+        return {}
+    hist = prepare_panel(panel)
+    if hist.empty:
+        return {}
+
+    iso = hist["iso3"].to_numpy()
+    last = np.flatnonzero(np.r_[iso[1:] != iso[:-1], True])
+    features, current, past = state_arrays(hist, last, feature_cols)
+    years = hist["year"].to_numpy()[last]
+
+    return {
+        iso[row]: EngineState(features[i], current[i], past[i], int(years[i]))
+        for i, row in enumerate(last)
+    }
+
+
+class FeatureStore:
+    def __init__(self, key: str, states: dict, data_version: str = None):
+        self.key = key  # layout_key() of the vectors
+        self.states = states  # iso3 -> EngineState
+        self.data_version = data_version
+
+    @classmethod
+    def from_panel(cls, panel: pd.DataFrame, feature_cols,
+                   data_version: str = None) -> "FeatureStore":
+        return cls(
+            layout_key(feature_cols),
+            build_states(panel, feature_cols),
+            data_version,
+        )
+
+    @classmethod
+    def from_rows(cls, key: str, data_version: str, rows) -> "FeatureStore":
+        """
+        Build from country_features rows
+        (iso3, base_year, features, state, lags).
+        """
+        states = {}
+        for iso3, base_year, features, state, lags in rows:
+            states[iso3.strip()] = EngineState(
+                np.asarray(features, dtype=float),
+                np.asarray(state, dtype=float),
+                np.asarray(lags, dtype=float).reshape(N_LAGS, len(LAG_COLS)),
+                int(base_year),
+            )
+        return cls(key, states, data_version)
+
+    def is_fresh(self, key: str, data_version: str) -> bool:
+        return self.key == key and self.data_version == data_version
+
+    def get(self, iso3: str):
+        return self.states.get(iso3.upper())
+
+    def rows(self) -> list:
+        return [
+            (
+                iso3,
+                s.base_year,
+                s.features.tolist(),
+                s.current.tolist(),
+                s.past.ravel().tolist(),
+                self.key,
+                self.data_version,
+            )
+            for iso3, s in self.states.items()
+        ]
+
+    def info(self) -> dict:
+        return {
+            "layout_key": self.key,
+            "data_version": self.data_version,
+            "countries": len(self.states),
+        }
+
+
+def refresh_country_features(conn, feature_cols=None) -> FeatureStore:
+    """
+    Rebuild the country_features table from energy_yearly over a
+    psycopg2 connection and commit. feature_cols defaults to those of
+    the deployed models (api/models/feature_config.json); an API
+    serving a registry version with other features builds its own
+    vectors instead (main.refresh_feature_store).
+    """
+    from psycopg2.extras import execute_values
+
+    if feature_cols is None:
+        feature_cols = load_feature_cols()
+
+    with conn.cursor() as cur:
+        cur.execute(DATA_VERSION_SQL)
+        version = data_version(*cur.fetchone())
+        cur.execute(HISTORY_SELECT + "ORDER BY c.iso3, e.year;")
+        panel = pd.DataFrame(cur.fetchall(), columns=HISTORY_COLS)
+
+        store = FeatureStore.from_panel(panel, feature_cols, version)
+        cur.execute("DELETE FROM country_features")
+        execute_values(
+            cur,
+            """
+            INSERT INTO country_features (
+                iso3, base_year, features, state, lags,
+                layout_key, data_version
+            ) VALUES %s
+            """,
+            store.rows(),
+        )
+    conn.commit()
+    return store
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Feature engineering shared by training (ml/build_dataset.py) and
+serving (model_service.py, forecast_engine.py).
+
+On top of the raw yearly columns the models see:
+
+- generation shares: ``{src}_share = {src}_twh / max(generation, EPS)``
+- lags 1..N_LAGS of LAG_COLS within each country: ``{col}_lag{k}``
+
+These compute them:
+
+- build_features: a whole (country, year) panel at once, with shifted
+  NumPy arrays instead of a groupby per column
+- forecast_rows: build_features minus the rows a forecast cannot start
+  from
+- append_year: the next year's feature rows from each country's latest
+  feature row, without touching the rest of the history
+- LagRing: the array form of the lag window, advanced in place by the
+  forecast recursion
+"""
+import numpy as np
+import pandas as pd
+
+SHARE_SOURCES = [
+    "coal",
+    "oil",
+    "gas",
+    "nuclear",
+    "hydro",
+    "solar",
+    "wind",
+    "other_renewables",
+]
+
+LAG_COLS = [
+    "low_carbon_share_pct",
+    "electricity_generation_twh",
+    "solar_share",
+    "wind_share",
+    "fossil_share_pct",
+]
+
+N_LAGS = 3
+
+# forecasts start from rows of this year on that have every lag
+HISTORY_MIN_YEAR = 2000
+
+EPS = 1e-9
+LOG_EPS = 1e-6
+
+TWH_COLS = [f"{src}_twh" for src in SHARE_SOURCES]
+SHARE_COLS = [f"{src}_share" for src in SHARE_SOURCES]
+LAG_FEATURE_COLS = [
+    f"{col}_lag{lag}" for col in LAG_COLS for lag in range(1, N_LAGS + 1)
+]
+
+
+def clip_generation(gen: np.ndarray) -> np.ndarray:
+    """
+    max(gen, EPS) elementwise, passing NaN through like Series.clip.
+    """
+    return np.where(EPS > gen, EPS, gen)
+
+
+def _with_columns(df: pd.DataFrame, columns: dict) -> pd.DataFrame:
+    """
+    `df` with `columns` (name -> array) attached in one concat, replacing
+    columns of the same name; setting them one by one copies the frame's
+    blocks on every insert. The input is not modified.
+    """
+    new = pd.DataFrame(columns, index=df.index)
+    return pd.concat([df.drop(columns=new.columns, errors="ignore"), new], axis=1)
+
+
+def add_shares(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    `df` with its {src}_share columns set.
+    """
+    gen = clip_generation(df["electricity_generation_twh"].to_numpy(dtype=float))
+    shares = df[TWH_COLS].to_numpy(dtype=float) / gen[:, None]
+    return _with_columns(df, {col: shares[:, j] for j, col in enumerate(SHARE_COLS)})
+
+
+def _positions_in_group(keys: np.ndarray) -> np.ndarray:
+    """
+    Index of each row within its run of equal consecutive keys.
+    """
+    n = len(keys)
+    rows = np.arange(n)
+    if n == 0:
+        return rows
+    starts = np.r_[True, keys[1:] != keys[:-1]]
+    return rows - np.maximum.accumulate(np.where(starts, rows, 0))
+
+
+def add_lags(df: pd.DataFrame, group_col: str = None) -> pd.DataFrame:
+    """
+    `df` with its {col}_lag{k} columns set. Rows must already be sorted
+    by (group_col, year); a lag is NaN where the group has fewer than k
+    earlier rows.
+    """
+    n = len(df)
+    if group_col is None:
+        pos = np.arange(n)
+    else:
+        pos = _positions_in_group(df[group_col].to_numpy())
+
+    lags = {}
+    for col in LAG_COLS:
+        values = df[col].to_numpy(dtype=float)
+        for lag in range(1, N_LAGS + 1):
+            shifted = np.full(n, np.nan)
+            shifted[lag:] = values[:n - lag]
+            shifted[pos < lag] = np.nan
+            lags[f"{col}_lag{lag}"] = shifted
+    return _with_columns(df, lags)
+
+
+def build_features(df: pd.DataFrame, group_col: str = None) -> pd.DataFrame:
+    """
+    Shares and lags for a panel of raw yearly rows (one country when
+    group_col is None). Returns a new frame sorted by (group_col, year);
+    the input is not modified.
+    """
+    keys = [group_col, "year"] if group_col is not None else ["year"]
+    df = df.sort_values(keys, kind="stable")
+    return add_lags(add_shares(df), group_col)
+
+
+def forecast_rows(df: pd.DataFrame, group_col: str = None) -> pd.DataFrame:
+    """
+    build_features restricted to rows a forecast may start from: years
+    from HISTORY_MIN_YEAR on with all N_LAGS lags present.
+    """
+    df = build_features(df, group_col)
+    keep = (
+        (df["year"] >= HISTORY_MIN_YEAR)
+        & df[f"{LAG_COLS[0]}_lag{N_LAGS}"].notnull()
+    )
+    return df[keep]
+
+
+def append_year(latest: pd.DataFrame, new_rows: pd.DataFrame,
+                group_col: str = "iso3") -> pd.DataFrame:
+    """
+    Feature rows for one more year per country.
+
+    latest:   each country's most recent feature row (build_features
+              output, one row per group_col value)
+    new_rows: raw rows for the following year, one per country
+
+    Lag k of a new row is lag k-1 of the country's previous row, so
+    only the new rows are computed. Countries missing from `latest`
+    get NaN lags.
+    """
+    out = add_shares(new_rows)
+    prev = latest.set_index(group_col).reindex(out[group_col].to_numpy())
+    lags = {}
+    for col in LAG_COLS:
+        lags[f"{col}_lag1"] = prev[col].to_numpy(dtype=float)
+        for lag in range(2, N_LAGS + 1):
+            lags[f"{col}_lag{lag}"] = prev[f"{col}_lag{lag - 1}"].to_numpy(dtype=float)
+    return _with_columns(out, lags)
+
+
+class LagRing:
+    """
+    The last N_LAGS values of LAG_COLS for n series, as a ring buffer
+    of shape (n, N_LAGS, len(LAG_COLS)). push() appends a row for every
+    series in O(1); lag(k) is the row pushed k steps ago.
+    """
+
+    def __init__(self, past: np.ndarray):
+        # past: (n, N_LAGS, len(LAG_COLS)), oldest first; used in place
+        self.buf = past
+        self.head = N_LAGS - 1
+
+    def push(self, values: np.ndarray):
+        self.head = (self.head + 1) % N_LAGS
+        self.buf[:, self.head, :] = values
+
+    def lag(self, k: int) -> np.ndarray:
+        return self.buf[:, (self.head - k + 1) % N_LAGS, :]
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""
+Per-country starting point of a recursive forecast, as ForecastEngine
+and the country_features table (feature_store.py) lay it out.
+"""
+from collections import namedtuple
+
+from .features import LAG_COLS, N_LAGS, SHARE_COLS, TWH_COLS
+
+# Per-country starting point for a run:
+#   features:  model input for the first step (last history row)
+#   current:   last history row over engine.state_cols (NaN kept)
+#   past:      lagged columns of the rows before it, oldest first
+#   base_year: last actual year
+EngineState = namedtuple(
+    "EngineState", ["features", "current", "past", "base_year"]
+)
+
+
+def lag_names() -> dict:
+    # lag feature name -> (LAG_COLS index, lag)
+    return {
+        f"{col}_lag{lag}": (i, lag)
+        for i, col in enumerate(LAG_COLS)
+        for lag in range(1, N_LAGS + 1)
+    }
+
+
+def state_columns(feature_cols) -> list:
+    """
+    Columns of EngineState.current for a model with these feature
+    columns: its non-lag features, then whatever the recursion updates.
+    """
+    lags = lag_names()
+    state_cols = []
+    for col in feature_cols:
+        if col not in lags and col not in state_cols:
+            state_cols.append(col)
+    extra = TWH_COLS + SHARE_COLS + LAG_COLS
+    extra += ["low_carbon_share_pct", "electricity_generation_twh"]
+    for col in extra:
+        if col not in state_cols:
+            state_cols.append(col)
+    return state_cols
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+NumPy-backed recursive forecast engine.
+
+The recursion in predict_horizon_from_df only ever needs the latest
+row of each country plus the previous three years of the lagged
+columns, so instead of appending a row to a DataFrame and recomputing
+shares/lags over the whole history at every step, the engine keeps:
+
+- ``current``: the latest row of every state column (n, n_state)
+- ``past``:    a features.LagRing over the lagged columns (n, 3, n_lag)
+
+and updates both in place from index maps precomputed from
+``feature_cols``. All countries in a run advance in lockstep, so the
+models are called once per step on an (n, n_features) matrix.
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from enforecast.features import (
+    LAG_COLS,
+    LOG_EPS,
+    N_LAGS,
+    SHARE_COLS,
+    TWH_COLS,
+    LagRing,
+    clip_generation,
+)
+from enforecast.state import EngineState, lag_names, state_columns
+from metrics import observe_stage
+
+
+class ForecastEngine:
+    """
+    Recursive LC/GEN forecaster over stacked per-country state arrays.
+
+    Produces the same numbers as the original pandas loop: the share,
+    clamp and log/exp updates use the same float64 operations in the
+    same order, only applied to whole arrays.
+    """
+
+    def __init__(self, feature_cols, scaler_mean, scaler_scale, lc_model, gen_model,
+                 lc_scaled: bool = True, gen_scaled: bool = False, residuals=None):
+        self.feature_cols = list(feature_cols)
+        self.means = np.asarray(scaler_mean, dtype=float)
+        self.scales = np.asarray(scaler_scale, dtype=float)
+        self.lc_model = lc_model
+        self.gen_model = gen_model
+        # whether each model takes standardized or raw features
+        self.lc_scaled = lc_scaled
+        self.gen_scaled = gen_scaled
+        # one-step (delta_lc, delta_log_gen) errors, shape (m, 2), that
+        # run_paths resamples; None when the models ship without them
+        self.residuals = None if residuals is None else np.asarray(residuals, dtype=float)
+
+        lags = lag_names()
+        state_cols = state_columns(self.feature_cols)
+        self.state_cols = state_cols
+        idx = {col: i for i, col in enumerate(state_cols)}
+
+        # feature position <- state column, for non-lag features
+        base = [
+            (j, idx[col])
+            for j, col in enumerate(self.feature_cols)
+            if col not in lags
+        ]
+        self._base_pos = np.array([j for j, _ in base], dtype=np.intp)
+        self._base_src = np.array([s for _, s in base], dtype=np.intp)
+
+        # feature position <- ring column, one map per lag
+        self._lag_maps = []
+        for lag in range(1, N_LAGS + 1):
+            pairs = [
+                (j, lags[col][0])
+                for j, col in enumerate(self.feature_cols)
+                if col in lags and lags[col][1] == lag
+            ]
+            self._lag_maps.append(
+                (
+                    np.array([j for j, _ in pairs], dtype=np.intp),
+                    np.array([s for _, s in pairs], dtype=np.intp),
+                )
+            )
+
+        self._twh_idx = np.array([idx[col] for col in TWH_COLS], dtype=np.intp)
+        self._share_idx = np.array([idx[col] for col in SHARE_COLS], dtype=np.intp)
+        self._lag_state_idx = np.array(
+            [idx[col] for col in LAG_COLS], dtype=np.intp
+        )
+        self._lc_idx = idx["low_carbon_share_pct"]
+        self._gen_idx = idx["electricity_generation_twh"]
+
+    def initial_state(self, hist: pd.DataFrame) -> EngineState:
+        """
+        Build the starting state from a prepared history frame
+        (output of _prepare_history_for_features).
+        """
+        last = hist.iloc[[-1]]
+        features = (
+            last.reindex(columns=self.feature_cols)
+            .astype(float)
+            .fillna(0.0)
+            .to_numpy()[0]
+        )
+        current = last.reindex(columns=self.state_cols).astype(float).to_numpy()[0]
+
+        prev = hist.iloc[-(N_LAGS + 1):-1].reindex(columns=LAG_COLS)
+        past = np.full((N_LAGS, len(LAG_COLS)), np.nan)
+        if len(prev):
+            past[N_LAGS - len(prev):] = prev.astype(float).to_numpy()
+
+        return EngineState(features, current, past, int(last["year"].iloc[0]))
+
+    def _fill_features(self, X, current, ring):
+        X[:, self._base_pos] = current[:, self._base_src]
+        for lag, (pos, src) in enumerate(self._lag_maps, start=1):
+            X[:, pos] = ring.lag(lag)[:, src]
+        X[np.isnan(X)] = 0.0
+
+    def run(self, states, horizon: int):
+        """
+        Advance every state `horizon` steps.
+
+        Returns (lc, gen), two float arrays of shape (n_states, horizon).
+        """
+        return self.run_arrays(
+            np.vstack([s.features for s in states]),
+            np.vstack([s.current for s in states]),
+            np.stack([s.past for s in states]),
+            horizon,
+        )
+
+    def run_paths(self, states, horizon: int, n_paths: int, rng=None):
+        """
+        Residual-bootstrap simulation: besides the point forecast, run
+        `n_paths` paths per state, each adding a (delta_lc,
+        delta_log_gen) pair drawn from self.residuals to the model
+        output at every step. Point rows and all paths form one stacked
+        matrix, so every step is still a single LC and GEN model call.
+
+        Returns (lc, gen, lc_paths, gen_paths) with shapes (n, horizon)
+        and (n, n_paths, horizon).
+        """
+        if self.residuals is None or not len(self.residuals):
+            raise ValueError("No residuals available for these models")
+        rng = np.random.default_rng(rng)
+
+        features = np.vstack([s.features for s in states])
+        current = np.vstack([s.current for s in states])
+        past = np.stack([s.past for s in states])
+        n = len(features)
+
+        # rows 0..n-1: point forecasts; then n_paths rows per state
+        noise = np.zeros((n + n * n_paths, horizon, 2))
+        draws = rng.integers(0, len(self.residuals), size=(n * n_paths, horizon))
+        noise[n:] = self.residuals[draws]
+
+        lc, gen = self.run_arrays(
+            np.concatenate([features, np.repeat(features, n_paths, axis=0)]),
+            np.concatenate([current, np.repeat(current, n_paths, axis=0)]),
+            np.concatenate([past, np.repeat(past, n_paths, axis=0)]),
+            horizon,
+            noise=noise,
+        )
+        return (
+            lc[:n],
+            gen[:n],
+            lc[n:].reshape(n, n_paths, horizon),
+            gen[n:].reshape(n, n_paths, horizon),
+        )
+
+    def run_arrays(self, features, current, past, horizon: int, noise=None):
+        """
+        run() on already stacked EngineState fields: features (n,
+        n_features), current (n, n_state), past (n, N_LAGS, n_lag).
+        The arrays are copied, not modified. `noise` (n, horizon, 2) is
+        added to the predicted (delta_lc, delta_log_gen) of each step.
+        """
+        n = len(features)
+        X = np.array(features, dtype=float)
+        current = np.array(current, dtype=float)
+        ring = LagRing(np.array(past, dtype=float))
+
+        lc = current[:, self._lc_idx].copy()
+        gen = current[:, self._gen_idx].copy()
+        log_gen = np.log(np.where(LOG_EPS > gen, LOG_EPS, gen))
+
+        out_lc = np.empty((n, horizon))
+        out_gen = np.empty((n, horizon))
+
+        for step in range(horizon):
+            t_step = time.perf_counter()
+            if step:
+                self._fill_features(X, current, ring)
+
+            X_scaled = (X - self.means) / self.scales
+            X_lc = X_scaled if self.lc_scaled else X
+            X_gen = X_scaled if self.gen_scaled else X
+            delta_lc = np.asarray(self.lc_model.predict(X_lc), dtype=float)
+            delta_log_gen = np.asarray(self.gen_model.predict(X_gen), dtype=float)
+            if noise is not None:
+                delta_lc = delta_lc + noise[:, step, 0]
+                delta_log_gen = delta_log_gen + noise[:, step, 1]
+
+            # same semantics as max(0.0, min(100.0, lc)) on Python floats
+            lc = lc + delta_lc
+            lc = np.where(lc < 100.0, lc, 100.0)
+            lc = np.where(lc > 0.0, lc, 0.0)
+            log_gen = log_gen + delta_log_gen
+            gen = np.exp(log_gen)
+
+            out_lc[:, step] = lc
+            out_gen[:, step] = gen
+
+            # push the row just used as input, then roll it forward
+            ring.push(current[:, self._lag_state_idx])
+
+            g = clip_generation(gen)
+            twh = current[:, self._share_idx] * g[:, None]
+            current[:, self._twh_idx] = twh
+            current[:, self._lc_idx] = lc
+            current[:, self._gen_idx] = gen
+            current[:, self._share_idx] = twh / g[:, None]
+            observe_stage("inference_step", time.perf_counter() - t_step)
+
+        return out_lc, out_gen
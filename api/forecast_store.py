@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+Precomputed forecast table.
+
+Forecasts only change when the model artifacts or energy_yearly change,
+so every country is forecast once at MAX_HORIZON and requests for any
+shorter horizon are served by slicing that result. The table remembers
+the artifact hash and data version it was built from, which is what
+the staleness check compares against.
+
+ForecastPersistence keeps tables across restarts, in a JSON file or the
+Postgres `forecasts` table.
+"""
+import asyncio
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+MAX_HORIZON = 10
+
+
+class ForecastTable:
+    def __init__(self, artifact_hash: str, data_version: str, forecasts: dict,
+                 horizon: int = MAX_HORIZON, model_version: str = None):
+        self.artifact_hash = artifact_hash
+        self.data_version = data_version
+        self.horizon = horizon
+        # model_service model version the artifacts belong to
+        self.model_version = model_version
+        # iso3 -> {"iso3", "base_year", "forecasts": [...horizon rows]}
+        self.forecasts = forecasts
+
+    def is_fresh(self, artifact_hash: str, data_version: str) -> bool:
+        return (
+            self.artifact_hash == artifact_hash
+            and self.data_version == data_version
+        )
+
+    def get(self, iso3: str, horizon: int):
+        """
+        Forecast for `iso3` truncated to `horizon` years, or None if the
+        country is not in the table or the horizon is too long.
+        """
+        fc = self.forecasts.get(iso3.upper())
+        if fc is None or horizon > self.horizon:
+            return None
+        return {
+            "iso3": fc["iso3"],
+            "base_year": fc["base_year"],
+            "forecasts": fc["forecasts"][:horizon],
+            "model_version": self.model_version,
+        }
+
+    def info(self) -> dict:
+        return {
+            "artifact_hash": self.artifact_hash,
+            "data_version": self.data_version,
+            "model_version": self.model_version,
+            "horizon": self.horizon,
+            "countries": len(self.forecasts),
+        }
+
+    # ---- local file persistence ----
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        payload = dict(self.info(), forecasts=self.forecasts)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str):
+        if not os.path.exists(path):
+            return None
+        with open(path, "r") as f:
+            payload = json.load(f)
+        return cls(
+            payload["artifact_hash"],
+            payload["data_version"],
+            payload["forecasts"],
+            horizon=payload["horizon"],
+            model_version=payload.get("model_version"),
+        )
+
+    # ---- row form, for the Postgres `forecasts` table ----
+
+    def rows(self) -> list:
+        return [
+            {
+                "iso3": fc["iso3"],
+                "base_year": fc["base_year"],
+                "year": r["year"],
+                "low_carbon_share_pct": r["low_carbon_share_pct"],
+                "electricity_generation_twh": r["electricity_generation_twh"],
+                "artifact_hash": self.artifact_hash,
+                "data_version": self.data_version,
+            }
+            for fc in self.forecasts.values()
+            for r in fc["forecasts"]
+        ]
+
+    @classmethod
+    def from_rows(cls, artifact_hash: str, data_version: str, rows,
+                  model_version: str = None) -> "ForecastTable":
+        """
+        Rebuild from (iso3, base_year, year, lc, gen) rows ordered by
+        iso3, year.
+        """
+        forecasts = {}
+        for iso3, base_year, year, lc, gen in rows:
+            iso3 = iso3.strip()
+            fc = forecasts.setdefault(
+                iso3, {"iso3": iso3, "base_year": int(base_year), "forecasts": []}
+            )
+            fc["forecasts"].append(
+                {
+                    "year": int(year),
+                    "low_carbon_share_pct": float(lc),
+                    "electricity_generation_twh": float(gen),
+                }
+            )
+        horizon = min((len(fc["forecasts"]) for fc in forecasts.values()),
+                      default=MAX_HORIZON)
+        return cls(artifact_hash, data_version, forecasts, horizon=horizon,
+                   model_version=model_version)
+
+
+SELECT_FORECASTS_SQL = """
+    SELECT iso3, base_year, year,
+           low_carbon_share_pct, electricity_generation_twh
+    FROM forecasts
+    WHERE artifact_hash = :h AND data_version = :v
+    ORDER BY iso3, year;
+"""
+
+# upsert only this table's (artifact_hash, data_version) rows: other
+# workers and model versions keep theirs, and a refresh racing another
+# one for the same key does not conflict
+UPSERT_FORECASTS_SQL = """
+    INSERT INTO forecasts (
+        iso3, base_year, year,
+        low_carbon_share_pct, electricity_generation_twh,
+        artifact_hash, data_version
+    ) VALUES (
+        :iso3, :base_year, :year,
+        :low_carbon_share_pct, :electricity_generation_twh,
+        :artifact_hash, :data_version
+    )
+    ON CONFLICT (artifact_hash, data_version, iso3, year)
+    DO UPDATE SET
+        base_year = EXCLUDED.base_year,
+        low_carbon_share_pct = EXCLUDED.low_carbon_share_pct,
+        electricity_generation_twh = EXCLUDED.electricity_generation_twh,
+        created_at = NOW()
+"""
+
+PRUNE_FORECASTS_SQL = """
+    DELETE FROM forecasts
+    WHERE (artifact_hash, data_version) NOT IN (
+        SELECT artifact_hash, data_version
+        FROM forecasts
+        GROUP BY artifact_hash, data_version
+        ORDER BY max(created_at) DESC
+        LIMIT :keep
+    )
+"""
+
+
+class ForecastPersistence:
+    """
+    Where materialized tables outlive the process (FORECAST_PERSIST):
+
+    ""          nowhere
+    "file"      ForecastTable.save/load at `path`
+    "postgres"  the forecasts table, read through `read_session` and
+                written through `write_session` (async sessionmakers);
+                the `keep` most recently written (artifact_hash,
+                data_version) tables are kept
+    """
+
+    def __init__(self, mode: str = "", path: str = None, keep: int = 4,
+                 read_session=None, write_session=None):
+        self.mode = mode
+        self.path = path
+        self.keep = keep
+        self.read_session = read_session
+        self.write_session = write_session
+
+    async def load(self, artifact_hash: str, data_version: str,
+                   model_version: str = None):
+        """
+        The persisted table for this key, or None.
+        """
+        if self.mode == "file":
+            table = await asyncio.to_thread(ForecastTable.load, self.path)
+            if table is not None and table.is_fresh(artifact_hash, data_version):
+                table.model_version = model_version
+                return table
+        elif self.mode == "postgres":
+            # only here: ml/backtest.py imports this module without the
+            # database stack
+            from sqlalchemy import text
+
+            async with self.read_session() as session:
+                result = await session.execute(
+                    text(SELECT_FORECASTS_SQL), {"h": artifact_hash, "v": data_version}
+                )
+                rows = result.fetchall()
+            if rows:
+                return ForecastTable.from_rows(
+                    artifact_hash, data_version, rows, model_version
+                )
+        return None
+
+    async def save(self, table: ForecastTable):
+        if self.mode == "file":
+            await asyncio.to_thread(table.save, self.path)
+        elif self.mode == "postgres":
+            from sqlalchemy import text
+
+            if self.write_session is None:
+                raise RuntimeError("FORECAST_PERSIST=postgres needs DATABASE_URL")
+            async with self.write_session() as session:
+                async with session.begin():
+                    await session.execute(text(UPSERT_FORECASTS_SQL), table.rows())
+                async with session.begin():
+                    result = await session.execute(
+                        text(PRUNE_FORECASTS_SQL), {"keep": self.keep}
+                    )
+            if result.rowcount:
+                logger.info("Pruned %d persisted forecast rows", result.rowcount)
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Bounded LRU/TTL cache for per-country history frames.
+
+History only changes when the ETL runs, so fetch_history_df results are
+kept in memory keyed by iso3. Concurrent misses for the same key wait on
+the single in-flight query instead of each hitting Postgres.
+
+Cached frames are shared between requests and must not be mutated.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+
+from metrics import CACHE_LOOKUPS
+
+MISSING = object()
+
+
+class HistoryCache:
+    """
+    maxsize: number of countries kept (0 disables caching)
+    ttl:     seconds an entry stays valid (0 = until evicted/invalidated)
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float = 3600.0, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._inflight = {}  # key -> asyncio.Future
+        # bumped on invalidation so loads started before it are not stored
+        self._generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.coalesced = 0
+
+    def lookup(self, key):
+        """
+        Return the cached value for `key`, or MISSING. Counts a hit or miss.
+        """
+        entry = self._data.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at is None or expires_at > self._clock():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._data[key]
+            self.expirations += 1
+        self.misses += 1
+        return MISSING
+
+    def generation(self) -> int:
+        """
+        Token to pass to put() for a value loaded from now on: the put
+        is dropped if the cache is invalidated in between.
+        """
+        return self._generation
+
+    def put(self, key, value, generation: int = None):
+        if self.maxsize <= 0:
+            return
+        if generation is not None and generation != self._generation:
+            # loaded before an invalidation: may be stale
+            return
+        expires_at = self._clock() + self.ttl if self.ttl > 0 else None
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    async def get(self, key, loader):
+        """
+        Return the cached value for `key`, calling `await loader()` on a
+        miss. Concurrent misses for the same key share one loader call.
+        """
+        while True:
+            fut = self._inflight.get(key)
+            if fut is not None:
+                self.coalesced += 1
+                try:
+                    return await asyncio.shield(fut)
+                except asyncio.CancelledError:
+                    if fut.cancelled():
+                        # the loading request went away; try again
+                        continue
+                    raise
+
+            value = self.lookup(key)
+            if value is not MISSING:
+                return value
+            return await self._load(key, loader)
+
+    async def _load(self, key, loader):
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        generation = self.generation()
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except BaseException as e:
+            fut.set_exception(e)
+            fut.exception()  # mark retrieved when nobody else is waiting
+            raise
+        else:
+            self.put(key, value, generation)
+            fut.set_result(value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def invalidate(self, key=None) -> int:
+        """
+        Drop one key (or everything when key is None). Returns the
+        number of entries removed.
+        """
+        self._generation += 1
+        if key is None:
+            removed = len(self._data)
+            self._data.clear()
+            return removed
+        return 1 if self._data.pop(key, None) is not None else 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "coalesced": self.coalesced,
+            "inflight": len(self._inflight),
+        }
+
+    def export_metrics(self, cache: str = "history"):
+        CACHE_LOOKUPS.set(self.hits, cache=cache, result="hit")
+        CACHE_LOOKUPS.set(self.misses, cache=cache, result="miss")
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Runs CPU-bound forecasting off the asyncio event loop.
+
+INFERENCE_EXECUTOR picks where model calls run:
+
+    inline   on the event loop itself (the old behaviour)
+    thread   in a thread pool; the event loop keeps serving DB I/O and
+             cached requests, and NumPy/XGBoost release the GIL for much
+             of the work
+    process  in a process pool whose workers load the models once at
+             start, so forecasts run in parallel across cores
+
+Work submitted to a process pool must be picklable: module-level
+functions of model_service and plain arguments (DataFrames, dicts).
+Stage timings taken in a worker (metrics.stage) come back with the
+result and are recorded in the parent.
+"""
+import asyncio
+import logging
+import multiprocessing as mp
+import os
+from concurrent.futures import (
+    BrokenExecutor,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from functools import partial
+
+from metrics import collect, record_stages
+
+logger = logging.getLogger(__name__)
+
+EXECUTOR_KINDS = ("inline", "thread", "process")
+
+
+def _init_worker():
+    # imported here so the parent does not pay for it in inline/thread mode
+    import model_service
+
+    model_service.warm_up()
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+class InferenceExecutor:
+    def __init__(self, kind: str = "thread", workers: int = None):
+        if kind not in EXECUTOR_KINDS:
+            raise ValueError(
+                f"INFERENCE_EXECUTOR must be one of {EXECUTOR_KINDS}, got {kind!r}"
+            )
+        self.kind = kind
+        self.workers = workers or os.cpu_count() or 1
+        self._pool = None
+
+    def _create_pool(self):
+        if self.kind == "thread":
+            return ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="inference"
+            )
+        if self.kind == "process":
+            # spawn, not fork: the parent has an event loop and threads
+            return ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=mp.get_context("spawn"),
+                initializer=_init_worker,
+            )
+        return None
+
+    async def start(self):
+        """
+        Create the pool. For a process pool, also wait until every worker
+        has started and loaded the models, so the first requests do not
+        pay for it.
+        """
+        if self._pool is None:
+            self._pool = self._create_pool()
+        if self.kind == "process":
+            pids = await asyncio.gather(*(self.run(_ping) for _ in range(self.workers)))
+            logger.info("Inference workers ready: %s", sorted(set(pids)))
+
+    async def restart(self):
+        """
+        Replace a process pool with fresh workers, e.g. after a model
+        reload, so they load the models now being served. The new
+        workers are warmed up before the swap; work already submitted
+        finishes on the old pool. Thread and inline executors share the
+        parent's models and need nothing.
+        """
+        if self.kind != "process" or self._pool is None:
+            return
+        new = self._create_pool()
+        loop = asyncio.get_running_loop()
+        pids = await asyncio.gather(
+            *(loop.run_in_executor(new, _ping) for _ in range(self.workers))
+        )
+        old, self._pool = self._pool, new
+        old.shutdown(wait=False)
+        logger.info("Inference workers restarted: %s", sorted(set(pids)))
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Run fn(*args, **kwargs) on the configured executor and return its
+        result; exceptions raised by fn propagate unchanged.
+        """
+        if self.kind == "inline":
+            return fn(*args, **kwargs)
+        if self._pool is None:
+            self._pool = self._create_pool()
+        loop = asyncio.get_running_loop()
+        try:
+            if self.kind == "process":
+                result, timings = await loop.run_in_executor(
+                    self._pool, partial(collect, fn, *args, **kwargs)
+                )
+                record_stages(timings)
+                return result
+            return await loop.run_in_executor(self._pool, partial(fn, *args, **kwargs))
+        except BrokenExecutor as e:
+            # a worker died (e.g. OOM-killed); replace the pool so later
+            # requests work again, and fail this one
+            logger.error("Inference pool broken, restarting it: %s", e)
+            old, self._pool = self._pool, self._create_pool()
+            old.shutdown(wait=False, cancel_futures=True)
+            raise RuntimeError("Inference worker crashed") from e
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def info(self) -> dict:
+        return {
+            "kind": self.kind,
+            "workers": 0 if self.kind == "inline" else self.workers,
+        }
@@ -1,39 +1,243 @@
 # -*- coding: utf-8 -*-
 from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker
+from fastapi.responses import JSONResponse
 from sqlalchemy import text
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional
+from contextlib import asynccontextmanager
 import os
 import json
+import time
+import asyncio
+import logging
 import pandas as pd
 from dotenv import load_dotenv
 
-from model_service import predict_horizon_from_df
+from admin import router as admin_router
+from db_pool import Database
+from enforecast.feature_store import (
+    DATA_VERSION_SQL,
+    HISTORY_COLS,
+    HISTORY_SELECT,
+    FeatureStore,
+    data_version as format_data_version,
+    layout_key,
+)
+from forecast_store import MAX_HORIZON, ForecastPersistence, ForecastTable
+from history_cache import HistoryCache, MISSING
+from inference_pool import InferenceExecutor
+from metrics import REQUEST_SECONDS, REQUESTS, cache_lookup, router as metrics_router, stage
+from panel_store import PanelStore
+from profiler import SlowRequests
+from shadow import ShadowMode, router as shadow_router
+from model_registry import watch as watch_registry
+from model_service import (
+    INTERVAL_PATHS,
+    MODEL_REGISTRY,
+    feature_columns,
+    model_info,
+    model_version,
+    predict_horizon_batch,
+    predict_horizon_from_df,
+    predict_horizon_from_state,
+    reload_models,
+    warm_up,
+)
+
+logger = logging.getLogger(__name__)
 
 # Load env vars
 load_dotenv()
-DATABASE_URL = os.getenv("DATABASE_URL")
-
-app = FastAPI(title="Energy Forecast API")
 
 # Paths
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-PROJECT_ROOT = os.path.abspath(os.path.join(BASE_DIR, ".."))
-
-# Async DB engine for Railway Postgres using asyncpg
-if not DATABASE_URL:
-    ASYNC_DATABASE_URL = None
-    engine = None
-    AsyncSessionLocal = None
-else:
-    # Force asyncpg dialect
-    url = DATABASE_URL.replace("postgres://", "postgresql://")
-    ASYNC_DATABASE_URL = url.replace("postgresql://", "postgresql+asyncpg://")
-    engine = create_async_engine(ASYNC_DATABASE_URL, future=True)
-    AsyncSessionLocal = sessionmaker(
-        engine, expire_on_commit=False, class_=AsyncSession
+
+# Precomputed forecasts: "" (memory only), "file" or "postgres"
+FORECAST_PERSIST = os.getenv("FORECAST_PERSIST", "").lower()
+FORECAST_FILE = os.getenv(
+    "FORECAST_FILE", os.path.join(BASE_DIR, "cache", "forecasts.json")
+)
+# FORECAST_PERSIST=postgres: (artifact hash, data version) tables kept
+FORECAST_KEEP_TABLES = int(os.getenv("FORECAST_KEEP_TABLES", "4"))
+# how often to compare the table against artifacts/data (0 = never)
+FORECAST_REFRESH_SECONDS = int(os.getenv("FORECAST_REFRESH_SECONDS", "300"))
+
+# Where histories come from: "db" (per request, cached) or "memory"
+# (whole panel loaded at startup, reloaded every PANEL_REFRESH_SECONDS)
+HISTORY_SOURCE = os.getenv("HISTORY_SOURCE", "db").lower()
+PANEL_REFRESH_SECONDS = int(os.getenv("PANEL_REFRESH_SECONDS", "600"))
+
+# In-process history cache (size 0 disables, TTL 0 = no expiry)
+HISTORY_CACHE = HistoryCache(
+    maxsize=int(os.getenv("HISTORY_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("HISTORY_CACHE_TTL", "3600")),
+)
+# energy_yearly data version HISTORY_CACHE was last checked against
+_HISTORY_DATA_VERSION: Optional[str] = None
+
+# Start forecasts from the precomputed per-country feature rows
+# (country_features, or the in-memory panel) instead of full histories
+FEATURE_STORE = os.getenv("FEATURE_STORE", "1") not in ("0", "false", "no")
+
+# How often to check the model registry's CURRENT pointer and hot-swap
+# to a newly activated version (0 = only via /admin/models/reload)
+MODEL_WATCH_SECONDS = int(os.getenv("MODEL_WATCH_SECONDS", "30"))
+
+# Shadow mode (shadow.py): replay a sampled share of /forecast calls
+# against a candidate registry version, in the background
+SHADOW_MODEL_VERSION = os.getenv("SHADOW_MODEL_VERSION")
+SHADOW_SAMPLE = float(os.getenv("SHADOW_SAMPLE", "0.1"))
+SHADOW_BATCH_SIZE = int(os.getenv("SHADOW_BATCH_SIZE", "64"))
+SHADOW_QUEUE_SIZE = int(os.getenv("SHADOW_QUEUE_SIZE", "1024"))
+SHADOW_FLUSH_SECONDS = float(os.getenv("SHADOW_FLUSH_SECONDS", "1.0"))
+
+# Sampling profiler (profiler.py): requests slower than PROFILE_SLOW_MS
+# get a collapsed-stack flamegraph file in PROFILE_DIR, keeping the
+# newest PROFILE_KEEP (0 = profiler off)
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0"))
+SLOW_REQUESTS = (
+    SlowRequests(
+        PROFILE_SLOW_MS,
+        os.getenv("PROFILE_DIR", os.path.join(BASE_DIR, "cache", "profiles")),
+        keep=int(os.getenv("PROFILE_KEEP", "100")),
+        interval_ms=float(os.getenv("PROFILE_INTERVAL_MS", "5")),
     )
+    if PROFILE_SLOW_MS > 0
+    else None
+)
+
+# Where model inference runs: "inline", "thread" or "process"
+# (INFERENCE_WORKERS defaults to the CPU count)
+INFERENCE = InferenceExecutor(
+    os.getenv("INFERENCE_EXECUTOR", "thread").lower(),
+    int(os.getenv("INFERENCE_WORKERS", "0")) or None,
+)
+
+
+# Startup state, reported by /ready
+_WARMUP_TASK: Optional[asyncio.Task] = None
+_READY = False
+_STARTUP_ERROR: Optional[str] = None
+
+
+async def _startup():
+    """
+    Warm the models in a worker thread, then load the panel and the
+    precomputed forecasts. Runs in the background so the event loop
+    (and /health) stays responsive; /ready turns 200 when it finishes.
+    """
+    global _READY, _STARTUP_ERROR
+    try:
+        await _WARMUP_TASK
+    except Exception as e:
+        logger.exception("Model warm-up failed")
+        _STARTUP_ERROR = str(e)
+        return
+
+    try:
+        await INFERENCE.start()
+    except Exception as e:
+        logger.exception("Could not start inference workers")
+        _STARTUP_ERROR = str(e)
+        return
+
+    if HISTORY_SOURCE == "memory" and AsyncSessionLocal is not None:
+        try:
+            await refresh_panel_store()
+        except Exception:
+            logger.exception("Could not load panel into memory; using DB")
+
+    try:
+        await refresh_forecast_table()
+    except Exception:
+        logger.exception("Could not materialize forecasts; serving live")
+
+    if SHADOW_MODEL_VERSION:
+        try:
+            await SHADOW.start(SHADOW_MODEL_VERSION, SHADOW_SAMPLE)
+        except Exception:
+            logger.exception("Could not load shadow model %s", SHADOW_MODEL_VERSION)
+
+    _READY = True
+    logger.info("Startup complete; instance is ready")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global _WARMUP_TASK
+    _WARMUP_TASK = asyncio.create_task(asyncio.to_thread(warm_up))
+    background = [asyncio.create_task(_startup())]
+    if (
+        HISTORY_SOURCE == "memory"
+        and AsyncSessionLocal is not None
+        and PANEL_REFRESH_SECONDS > 0
+    ):
+        background.append(asyncio.create_task(_panel_refresher()))
+    if FORECAST_REFRESH_SECONDS > 0:
+        background.append(asyncio.create_task(_forecast_refresher()))
+    if MODEL_WATCH_SECONDS > 0:
+        background.append(asyncio.create_task(watch_registry(
+            MODEL_REGISTRY, MODEL_WATCH_SECONDS, model_version, refresh_models,
+            ready=lambda: _READY,
+        )))
+    background.append(asyncio.create_task(SHADOW.run()))
+    if SLOW_REQUESTS is not None:
+        SLOW_REQUESTS.start()
+    yield
+    for task in background:
+        task.cancel()
+    if SLOW_REQUESTS is not None:
+        SLOW_REQUESTS.stop()
+    INFERENCE.shutdown()
+    SHADOW.shutdown()
+
+
+async def _wait_for_models():
+    """
+    Let requests that arrive during warm-up wait for it without blocking
+    the event loop, instead of loading the models inline.
+    """
+    task = _WARMUP_TASK
+    if task is not None and not task.done():
+        try:
+            await asyncio.shield(task)
+        except Exception:
+            pass  # the request path reports the load error itself
+
+
+class TimedJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        with stage("serialization"):
+            return super().render(content)
+
+
+app = FastAPI(
+    title="Energy Forecast API",
+    lifespan=lifespan,
+    default_response_class=TimedJSONResponse,
+)
+
+# Async DB engines for Railway Postgres using asyncpg (db_pool.py):
+# AsyncSessionLocal for reads (the replica when DATABASE_READ_URL is
+# set), and AsyncWriteSessionLocal on the primary; None without
+# DATABASE_URL
+DB = Database.from_env()
+AsyncSessionLocal = DB.read_session
+AsyncWriteSessionLocal = DB.write_session
+
+# Read queries, built once: the asyncpg dialect keeps each one prepared
+# per connection, keyed by its SQL text
+COUNTRIES_QUERY = text(
+    "SELECT iso3, name FROM countries WHERE iso3 IS NOT NULL ORDER BY name"
+)
+HISTORY_QUERY = text(HISTORY_SELECT + "WHERE c.iso3 = :iso3 ORDER BY e.year;")
+# one array parameter, so one prepared statement for any number of codes
+HISTORIES_QUERY = text(
+    HISTORY_SELECT + "WHERE c.iso3 = ANY(:iso3s) ORDER BY c.iso3, e.year;"
+)
+PANEL_QUERY = text(HISTORY_SELECT + "ORDER BY c.iso3, e.year;")
+DATA_VERSION_QUERY = text(DATA_VERSION_SQL)
 
 # CORS (open for now; restrict later)
 app.add_middleware(
@@ -45,127 +249,682 @@ app.add_middleware(
 )
 
 
+# ---------------------------------------------------------------------------
+# Metrics (see metrics.py) and slow-request profiles (see profiler.py)
+# ---------------------------------------------------------------------------
+
+app.include_router(metrics_router(DB.export_metrics, HISTORY_CACHE.export_metrics))
+
+
+@app.middleware("http")
+async def observe_requests(request, call_next):
+    t0 = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        t1 = time.perf_counter()
+        # the route template, not the path: one series per endpoint
+        route = request.scope.get("route")
+        name = route.path if route is not None else "unmatched"
+        REQUESTS.inc(method=request.method, route=name, status=status)
+        REQUEST_SECONDS.observe(t1 - t0, method=request.method, route=name)
+        if SLOW_REQUESTS is not None:
+            SLOW_REQUESTS.observe(request.method, request.url.path, name, t0, t1)
+
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
 
+@app.get("/ready")
+def ready():
+    """
+    Readiness probe: 200 only once models are warm and startup work is
+    done, 503 before that (or if warm-up failed). /health stays a pure
+    liveness check.
+    """
+    if _READY:
+        return {"status": "ready"}
+    if _STARTUP_ERROR is not None:
+        return JSONResponse(
+            status_code=503, content={"status": "error", "detail": _STARTUP_ERROR}
+        )
+    return JSONResponse(status_code=503, content={"status": "starting"})
+
+
 @app.get("/countries")
 async def list_countries():
     """
     Return list of countries from the countries table in Postgres.
     """
+    if _PANEL_STORE is not None:
+        return _PANEL_STORE.countries
+
     if AsyncSessionLocal is None:
         raise HTTPException(
             status_code=500,
             detail="DATABASE_URL is not configured on the server.",
         )
 
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            text(
-                "SELECT iso3, name FROM countries "
-                "WHERE iso3 IS NOT NULL ORDER BY name"
-            )
-        )
-        rows = result.all()
+    return await _query_countries()
+
+
+async def _query_countries() -> List[dict]:
+    with stage("db_fetch"):
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(COUNTRIES_QUERY)
+            rows = result.all()
     return [{"code": r[0].strip(), "name": r[1]} for r in rows]
 
 
+MAX_BATCH_COUNTRIES = 300
+
+# ?intervals=: at most this many levels, and countries x paths simulated
+# rows per request (every row is one column of each model call)
+MAX_INTERVAL_LEVELS = 5
+MAX_INTERVAL_ROWS = 10000
+
+
+def _parse_intervals(intervals: Optional[str], paths: int, n_countries: int):
+    """
+    "80,95" -> [80.0, 95.0]; None for point forecasts only. Raises 400
+    for malformed levels or too many simulated rows.
+    """
+    if not intervals:
+        return None
+    try:
+        levels = [float(x) for x in intervals.split(",") if x.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="intervals must be numbers, e.g. 80,95")
+    if not levels or len(levels) > MAX_INTERVAL_LEVELS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Give 1 to {MAX_INTERVAL_LEVELS} interval levels",
+        )
+    if any(not 0 < level < 100 for level in levels):
+        raise HTTPException(
+            status_code=400, detail="Interval levels must be between 0 and 100"
+        )
+    if n_countries * paths > MAX_INTERVAL_ROWS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"countries x paths must not exceed {MAX_INTERVAL_ROWS}",
+        )
+    return levels
+
+
+async def _query_history_df(iso3: str) -> pd.DataFrame:
+    with stage("db_fetch"):
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(HISTORY_QUERY, {"iso3": iso3})
+            rows = result.fetchall()
+
+    if not rows:
+        return pd.DataFrame()
+
+    return pd.DataFrame(rows, columns=HISTORY_COLS)
+
+
 async def fetch_history_df(iso3: str) -> pd.DataFrame:
     """
     Fetch full historical time series for a country from Postgres,
     matching the columns used in the ML pipeline.
+
+    Results are served from HISTORY_CACHE; the returned frame is shared
+    and must not be modified.
     """
+    if _PANEL_STORE is not None:
+        return _PANEL_STORE.history(iso3)
+
     if AsyncSessionLocal is None:
         return pd.DataFrame()
 
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            text(
-                """
-                SELECT
-                    c.country_id,
-                    c.iso3,
-                    c.name,
-                    c.region,
-                    c.subregion,
-                    c.income_group,
-                    c.population_millions,
-                    c.gdp_billions_usd,
-                    e.year,
-                    e.electricity_generation_twh,
-                    e.coal_twh,
-                    e.oil_twh,
-                    e.gas_twh,
-                    e.nuclear_twh,
-                    e.hydro_twh,
-                    e.solar_twh,
-                    e.wind_twh,
-                    e.other_renewables_twh,
-                    e.low_carbon_share_pct,
-                    e.fossil_share_pct
-                FROM energy_yearly e
-                JOIN countries c ON c.country_id = e.country_id
-                WHERE c.iso3 = :iso3
-                ORDER BY e.year;
-                """
-            ),
-            {"iso3": iso3.upper()},
-        )
-        rows = result.fetchall()
+    iso3 = iso3.upper()
+    return await HISTORY_CACHE.get(iso3, lambda: _query_history_df(iso3))
 
-    if not rows:
-        return pd.DataFrame()
 
-    cols = [
-        "country_id",
-        "iso3",
-        "name",
-        "region",
-        "subregion",
-        "income_group",
-        "population_millions",
-        "gdp_billions_usd",
-        "year",
-        "electricity_generation_twh",
-        "coal_twh",
-        "oil_twh",
-        "gas_twh",
-        "nuclear_twh",
-        "hydro_twh",
-        "solar_twh",
-        "wind_twh",
-        "other_renewables_twh",
-        "low_carbon_share_pct",
-        "fossil_share_pct",
-    ]
-    return pd.DataFrame(rows, columns=cols)
+async def fetch_histories_df(iso3_list: List[str]) -> Dict[str, pd.DataFrame]:
+    """
+    Fetch histories for several countries, querying only the ones that
+    are not in HISTORY_CACHE, with a single query.
+
+    Returns iso3 -> dataframe for every requested code; codes with no
+    rows map to an empty dataframe.
+    """
+    codes = list(dict.fromkeys(c.strip().upper() for c in iso3_list if c.strip()))
+    if _PANEL_STORE is not None:
+        return _PANEL_STORE.histories(codes)
+    if AsyncSessionLocal is None or not codes:
+        return {code: pd.DataFrame() for code in codes}
+
+    histories = {}
+    missing = []
+    for code in codes:
+        cached = HISTORY_CACHE.lookup(code)
+        if cached is MISSING:
+            missing.append(code)
+        else:
+            histories[code] = cached
+    if not missing:
+        return histories
+
+    # taken before the query, so an invalidation while it runs keeps
+    # these (possibly pre-ETL) rows out of the cache
+    generation = HISTORY_CACHE.generation()
+    with stage("db_fetch"):
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(HISTORIES_QUERY, {"iso3s": missing})
+            rows = result.fetchall()
+
+    fetched = {code: pd.DataFrame() for code in missing}
+    if rows:
+        df = pd.DataFrame(rows, columns=HISTORY_COLS)
+        df["iso3"] = df["iso3"].str.strip()
+        for code, group in df.groupby("iso3", sort=False):
+            fetched[code] = group.reset_index(drop=True)
+    for code, df in fetched.items():
+        HISTORY_CACHE.put(code, df, generation)
+    histories.update(fetched)
+    return {code: histories[code] for code in codes}
 
 
 @app.get("/model-metrics")
-def model_metrics():
+async def model_metrics():
     """
-    Return global validation and test metrics for the forecasting models.
+    Return global validation and test metrics for the forecasting models,
+    under "backtest" the horizon-wise MAE/RMSE of their recursive
+    forecasts (written by ml/backtest.py) and under "bias" the mean
+    one-step residual the forecast intervals are drawn around.
     """
-    metrics_path = os.path.join(BASE_DIR, "models", "metrics.json")
+    info = await asyncio.to_thread(model_info)
+    metrics_path = os.path.join(info["models_dir"], "metrics.json")
     if not os.path.exists(metrics_path):
         return {"error": "metrics file not found", "path": metrics_path}
     with open(metrics_path, "r") as f:
         metrics = json.load(f)
+    metrics["model_version"] = info["model_version"]
+    metrics["bias"] = info["residual_bias"]
     return metrics
 
 
+INTERVALS_QUERY = Query(
+    None,
+    description="Comma-separated central interval levels in percent, e.g. 80,95",
+)
+PATHS_QUERY = Query(INTERVAL_PATHS, ge=50, le=5000,
+                    description="Bootstrap paths per country for intervals")
+
+
 @app.get("/forecast/{iso3}")
-async def forecast(iso3: str, horizon: int = Query(5, ge=1, le=10)):
+async def forecast(
+    iso3: str,
+    horizon: int = Query(5, ge=1, le=10),
+    intervals: Optional[str] = INTERVALS_QUERY,
+    paths: int = PATHS_QUERY,
+):
     """
     Return forecast for a given country iso3 for the next `horizon` years.
+
+    With ?intervals=80,95 every year also gets those prediction
+    intervals, from `paths` residual-bootstrap simulations.
+    """
+    t0 = time.perf_counter()
+    levels = _parse_intervals(intervals, paths, 1)
+    store = _FEATURE_STORE
+    state = store.get(iso3) if store is not None else None
+    hist_df = None
+
+    if store is not None:
+        cache_lookup("feature_store", state is not None)
+
+    table = _FORECAST_TABLE
+    result = None
+    if table is not None and levels is None:
+        result = table.get(iso3, horizon)
+        cache_lookup("forecast_table", result is not None)
+
+    if result is None:
+        if state is None:
+            hist_df = await fetch_history_df(iso3)
+        await _wait_for_models()
+        try:
+            if state is not None:
+                result = await INFERENCE.run(
+                    predict_horizon_from_state, iso3, state, horizon=horizon,
+                    intervals=levels, paths=paths,
+                )
+            else:
+                result = await INFERENCE.run(
+                    predict_horizon_from_df, iso3, hist_df, horizon=horizon,
+                    intervals=levels, paths=paths,
+                )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except RuntimeError as e:
+            # model stack cannot be loaded on this Railway image
+            raise HTTPException(status_code=500, detail=str(e))
+
+    SHADOW.submit(
+        [result],
+        {result["iso3"]: state if state is not None else hist_df},
+        horizon,
+        (time.perf_counter() - t0) * 1000.0,
+    )
+    return result
+
+
+class BatchForecastRequest(BaseModel):
+    iso3: List[str] = Field(..., min_length=1, max_length=MAX_BATCH_COUNTRIES)
+    horizon: int = Field(5, ge=1, le=10)
+    intervals: Optional[List[float]] = Field(None, max_length=MAX_INTERVAL_LEVELS)
+    paths: int = Field(INTERVAL_PATHS, ge=50, le=5000)
+
+
+async def _forecast_batch(iso3_list: List[str], horizon: int,
+                          intervals: Optional[str] = None,
+                          paths: int = INTERVAL_PATHS) -> dict:
+    t0 = time.perf_counter()
+    codes = list(dict.fromkeys(c.strip().upper() for c in iso3_list if c.strip()))
+    if not codes:
+        raise HTTPException(status_code=400, detail="No country codes given")
+    levels = _parse_intervals(intervals, paths, len(codes))
+
+    # serve what we can from the precomputed table, compute the rest
+    # (the table has point forecasts only)
+    table = _FORECAST_TABLE
+    cached = {}
+    if table is not None and levels is None:
+        for code in codes:
+            fc = table.get(code, horizon)
+            cache_lookup("forecast_table", fc is not None)
+            if fc is not None:
+                cached[code] = fc
+    missing = [c for c in codes if c not in cached]
+
+    # precomputed feature rows where available, histories for the rest
+    store = _FEATURE_STORE
+    states = {}
+    if store is not None:
+        for code in missing:
+            state = store.get(code)
+            cache_lookup("feature_store", state is not None)
+            if state is not None:
+                states[code] = state
+    missing = [c for c in missing if c not in states]
+
+    live = {"results": [], "errors": {}}
+    histories = {}
+    if missing or states:
+        histories = await fetch_histories_df(missing) if missing else {}
+        await _wait_for_models()
+        try:
+            live = await INFERENCE.run(
+                predict_horizon_batch, histories, horizon=horizon, states=states,
+                intervals=levels, paths=paths,
+            )
+        except ValueError as e:
+            # no residuals shipped with the models
+            raise HTTPException(status_code=400, detail=str(e))
+        except RuntimeError as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    by_code = dict(cached)
+    by_code.update({r["iso3"]: r for r in live["results"]})
+
+    inputs = dict(histories)
+    inputs.update(states)
+    if store is not None:
+        for code in cached:
+            inputs[code] = store.get(code)
+    SHADOW.submit(
+        list(by_code.values()), inputs, horizon, (time.perf_counter() - t0) * 1000.0
+    )
+    return {
+        "horizon": horizon,
+        "results": [by_code[c] for c in codes if c in by_code],
+        "errors": live["errors"],
+    }
+
+
+@app.post("/forecast/batch")
+async def forecast_batch(req: BatchForecastRequest):
+    """
+    Return forecasts for several countries in one response.
+    Each horizon step runs one model call over all countries.
+    """
+    intervals = ",".join(f"{level:g}" for level in req.intervals or [])
+    return await _forecast_batch(req.iso3, req.horizon, intervals, req.paths)
+
+
+@app.get("/forecast")
+async def forecast_many(
+    iso3: str = Query(..., description="Comma-separated iso3 codes, e.g. IND,USA"),
+    horizon: int = Query(5, ge=1, le=10),
+    intervals: Optional[str] = INTERVALS_QUERY,
+    paths: int = PATHS_QUERY,
+):
+    """
+    GET variant of /forecast/batch taking ?iso3=A,B,C.
+    """
+    codes = [c for c in iso3.split(",") if c.strip()]
+    if len(codes) > MAX_BATCH_COUNTRIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_BATCH_COUNTRIES} countries per request",
+        )
+    return await _forecast_batch(codes, horizon, intervals, paths)
+
+
+# ---------------------------------------------------------------------------
+# Precomputed forecast table
+# ---------------------------------------------------------------------------
+
+_FORECAST_TABLE: Optional[ForecastTable] = None
+_FORECAST_LOCK = asyncio.Lock()
+FORECAST_STORE = ForecastPersistence(
+    FORECAST_PERSIST, FORECAST_FILE, FORECAST_KEEP_TABLES,
+    AsyncSessionLocal, AsyncWriteSessionLocal,
+)
+
+
+async def _query_panel_df() -> pd.DataFrame:
+    with stage("db_fetch"):
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(PANEL_QUERY)
+            rows = result.fetchall()
+    return pd.DataFrame(rows, columns=HISTORY_COLS)
+
+
+async def fetch_all_histories_df() -> Dict[str, pd.DataFrame]:
+    """
+    Fetch the full history of every country in one query.
+    """
+    if _PANEL_STORE is not None:
+        return _PANEL_STORE.histories()
+
+    if AsyncSessionLocal is None:
+        return {}
+
+    df = await _query_panel_df()
+    if df.empty:
+        return {}
+    df["iso3"] = df["iso3"].str.strip()
+    return {
+        code: group.reset_index(drop=True)
+        for code, group in df.groupby("iso3", sort=False)
+    }
+
+
+async def fetch_data_version() -> str:
+    """
+    Cheap fingerprint of energy_yearly: row count, newest year and the
+    newest insert/update time. Changes whenever the ETL adds or revises
+    data.
+    """
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(DATA_VERSION_QUERY)
+        count, max_year, max_changed = result.one()
+    return format_data_version(count, max_year, max_changed)
+
+
+def _sync_history_cache(data_version: str):
+    """
+    Drop every cached history when the data version differs from the
+    one seen at the previous refresh (e.g. after an ETL run), instead of
+    serving pre-ETL histories until HISTORY_CACHE_TTL expires them.
+    """
+    global _HISTORY_DATA_VERSION
+    if data_version != _HISTORY_DATA_VERSION:
+        removed = HISTORY_CACHE.invalidate()
+        if _HISTORY_DATA_VERSION is not None:
+            logger.info(
+                "Data version %s -> %s; dropped %d cached histories",
+                _HISTORY_DATA_VERSION, data_version, removed,
+            )
+        _HISTORY_DATA_VERSION = data_version
+
+
+async def refresh_forecast_table(force: bool = False) -> Optional[ForecastTable]:
+    """
+    Make sure the precomputed table matches the loaded artifacts and the
+    current energy_yearly data, rebuilding it at MAX_HORIZON if not.
+
+    A persisted table with the same key is reused instead of recomputing.
+    The feature store is brought up to date first and, when available,
+    the table is computed from it rather than from full histories.
+    """
+    global _FORECAST_TABLE
+    if AsyncSessionLocal is None:
+        return None
+
+    async with _FORECAST_LOCK:
+        info = await asyncio.to_thread(model_info)
+        art_hash = info["artifact_hash"]
+        # key on the data the forecasts are actually computed from
+        panel = _PANEL_STORE
+        if panel is not None:
+            data_version = panel.data_version
+        else:
+            data_version = await fetch_data_version()
+        _sync_history_cache(data_version)
+
+        try:
+            store = await refresh_feature_store(data_version)
+        except Exception:
+            logger.exception("Could not load country features; using histories")
+            store = None
+
+        table = _FORECAST_TABLE
+        if not force and table is not None and table.is_fresh(art_hash, data_version):
+            return table
+
+        if not force:
+            table = await FORECAST_STORE.load(
+                art_hash, data_version, info["model_version"]
+            )
+            if table is not None:
+                logger.info("Loaded precomputed forecasts (%s)", table.info())
+                _FORECAST_TABLE = table
+                return table
+
+        if store is not None:
+            batch = await INFERENCE.run(
+                predict_horizon_batch, {}, MAX_HORIZON, states=store.states
+            )
+        else:
+            histories = await fetch_all_histories_df()
+            batch = await INFERENCE.run(
+                predict_horizon_batch, histories, MAX_HORIZON
+            )
+        table = ForecastTable(
+            art_hash,
+            data_version,
+            {r["iso3"]: r for r in batch["results"]},
+            model_version=batch["model_version"],
+        )
+        _FORECAST_TABLE = table
+        logger.info("Materialized forecasts (%s)", table.info())
+
+        try:
+            await FORECAST_STORE.save(table)
+        except Exception:
+            logger.exception("Could not persist forecasts (%s)", FORECAST_PERSIST)
+        return table
+
+
+# ---------------------------------------------------------------------------
+# Precomputed feature rows (see enforecast/feature_store.py)
+# ---------------------------------------------------------------------------
+
+_FEATURE_STORE: Optional[FeatureStore] = None
+
+
+async def refresh_feature_store(data_version: str) -> Optional[FeatureStore]:
+    """
+    Make the feature store match the loaded models and `data_version`:
+    built from the in-memory panel when there is one, otherwise read
+    from country_features. When the table has no rows for this data
+    and feature layout (the ETL has not run since the data changed, or
+    it built them for the layout of api/models while the registry
+    serves another), the store is built from energy_yearly instead and
+    kept in memory until either changes; the table itself is left to
+    the ETL. None (requests then use histories) when FEATURE_STORE is
+    off.
     """
-    hist_df = await fetch_history_df(iso3)
+    global _FEATURE_STORE
+    if not FEATURE_STORE:
+        return None
+
+    cols = await asyncio.to_thread(feature_columns)
+    key = layout_key(cols)
+    store = _FEATURE_STORE
+    if store is not None and store.is_fresh(key, data_version):
+        return store
+
+    panel = _PANEL_STORE
+    if panel is not None and panel.data_version == data_version:
+        store = await asyncio.to_thread(
+            lambda: FeatureStore.from_panel(panel.frame(), cols, data_version)
+        )
+    else:
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                text(
+                    """
+                    SELECT iso3, base_year, features, state, lags
+                    FROM country_features
+                    WHERE layout_key = :k AND data_version = :v;
+                    """
+                ),
+                {"k": key, "v": data_version},
+            )
+            rows = result.fetchall()
+            if not rows:
+                logger.info(
+                    "country_features has no rows for layout %s, data version %s; "
+                    "building them from energy_yearly", key, data_version,
+                )
+                result = await session.execute(PANEL_QUERY)
+                frame = pd.DataFrame(result.fetchall(), columns=HISTORY_COLS)
+        if rows:
+            store = FeatureStore.from_rows(key, data_version, rows)
+        else:
+            store = await asyncio.to_thread(
+                FeatureStore.from_panel, frame, cols, data_version
+            )
+
+    # swap in one assignment, like the panel store
+    _FEATURE_STORE = store
+    logger.info("Loaded country features (%s)", store.info())
+    return store
+
+
+async def _forecast_refresher():
+    while True:
+        await asyncio.sleep(FORECAST_REFRESH_SECONDS)
+        try:
+            await refresh_forecast_table()
+        except Exception:
+            logger.exception("Forecast staleness check failed")
+
+
+# ---------------------------------------------------------------------------
+# Model hot reload (see model_registry.py)
+# ---------------------------------------------------------------------------
+
+_MODEL_LOCK = asyncio.Lock()
+
+
+async def refresh_models(version: str = None, force: bool = False) -> dict:
+    """
+    Load `version` (default: the registry's CURRENT) in a worker thread
+    and swap it in, then bring the process workers, feature store and
+    forecast table in line with it. Requests keep being served by the
+    previous version until the swap.
+    """
+    global _FEATURE_STORE, _FORECAST_TABLE
+    async with _MODEL_LOCK:
+        before = await asyncio.to_thread(model_info)
+        info = await asyncio.to_thread(reload_models, version, force)
+        if info["model_version"] == before["model_version"] and not force:
+            return info
+
+        await INFERENCE.restart()
+        SHADOW.reset()
+        # drop what the new models cannot use, so no request pairs them
+        store = _FEATURE_STORE
+        if store is not None and store.key != layout_key(feature_columns()):
+            _FEATURE_STORE = None
+        table = _FORECAST_TABLE
+        if table is not None and table.artifact_hash != info["artifact_hash"]:
+            _FORECAST_TABLE = None
     try:
-        return predict_horizon_from_df(iso3, hist_df, horizon=horizon)
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
-    except RuntimeError as e:
-        # model stack cannot be loaded on this Railway image
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        await refresh_forecast_table()
+    except Exception:
+        logger.exception("Could not materialize forecasts for %s", info["model_version"])
+    return info
+
+
+# ---------------------------------------------------------------------------
+# Shadow mode (see shadow.py)
+# ---------------------------------------------------------------------------
+
+SHADOW = ShadowMode(
+    fetch_histories_df if AsyncSessionLocal is not None else None,
+    lambda: _FEATURE_STORE,
+    batch_size=SHADOW_BATCH_SIZE,
+    queue_size=SHADOW_QUEUE_SIZE,
+    flush_seconds=SHADOW_FLUSH_SECONDS,
+)
+
+
+# ---------------------------------------------------------------------------
+# In-memory panel (HISTORY_SOURCE=memory)
+# ---------------------------------------------------------------------------
+
+_PANEL_STORE: Optional[PanelStore] = None
+
+
+async def refresh_panel_store(force: bool = False) -> PanelStore:
+    """
+    Load the full countries ⋈ energy_yearly panel into memory, unless
+    the loaded copy already matches the current data version.
+    """
+    global _PANEL_STORE
+    data_version = await fetch_data_version()
+    store = _PANEL_STORE
+    if not force and store is not None and store.data_version == data_version:
+        return store
+
+    df = await _query_panel_df()
+    countries = await _query_countries()
+    store = await asyncio.to_thread(
+        PanelStore.from_frame, df, countries, data_version
+    )
+    # swap in one assignment; readers keep whichever store they already hold
+    _PANEL_STORE = store
+    logger.info("Loaded panel into memory (%s)", store.info())
+    return store
+
+
+async def _panel_refresher():
+    while True:
+        await asyncio.sleep(PANEL_REFRESH_SECONDS)
+        try:
+            previous = _PANEL_STORE
+            if await refresh_panel_store() is not previous:
+                await refresh_forecast_table()
+        except Exception:
+            logger.exception("Panel refresh failed; keeping previous copy")
+
+
+# ---------------------------------------------------------------------------
+# /admin/* (admin.py, shadow.py)
+# ---------------------------------------------------------------------------
+
+app.include_router(admin_router(refresh_forecast_table, refresh_models, HISTORY_CACHE))
+app.include_router(shadow_router(SHADOW, SHADOW_SAMPLE))
@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+"""
+Process-local metrics in the Prometheus text exposition format, served
+by GET /metrics (see router()).
+
+Kept dependency-free on purpose: a handful of counters, gauges and
+fixed-bucket histograms with labels, rendered by hand, instead of
+prometheus_client. Values are per process; with several uvicorn
+workers each one is scraped (or aggregated) separately.
+
+Request stages are timed with `stage()`:
+
+    db_fetch        history / panel queries
+    feature_build   history -> EngineState (features.forecast_rows)
+    inference_step  one recursive step: LC and GEN model calls for all
+                    rows of the batch, plus the state update
+    format          arrays -> result dicts (and interval quantiles)
+    serialization   JSON rendering of the response body
+
+Stages timed inside process-pool workers are shipped back with the
+result (see `collect` and inference_pool.py) and recorded here.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+# seconds; stages range from ~10 µs steps to multi-second full refreshes
+STAGE_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+REQUEST_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0,
+)
+
+_REGISTRY = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, doc: str, labels=(), register: bool = True):
+        self.name = name
+        self.doc = doc
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}  # label values -> value
+        if not self.label_names and self.kind != "histogram":
+            self._values[()] = 0
+        # unregistered metrics are kept by their owner (e.g. the shadow
+        # recorder's latencies) and not rendered at /metrics
+        if register:
+            _REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} takes labels {self.label_names}, got {sorted(labels)}")
+        return tuple(str(labels[n]) for n in self.label_names)
+
+    def get(self, **labels):
+        return self._values.get(self._key(labels))
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_labels(self.label_names, key)} {_number(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, n: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + n
+
+    def set(self, value: float, **labels):
+        """
+        For totals kept elsewhere (e.g. HistoryCache.hits), copied in
+        at scrape time; they must only grow.
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class _Buckets:
+    __slots__ = ("counts", "count", "sum")
+
+    def __init__(self, n: int):
+        self.counts = [0] * (n + 1)
+        self.count = 0
+        self.sum = 0.0
+
+
+class Histogram(_Metric):
+    """
+    Fixed-bucket histogram; bucket i counts values <= buckets[i], the
+    last slot everything above. Rendered cumulatively with the `le`
+    label as Prometheus expects.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, labels=(), buckets=STAGE_BUCKETS,
+                 register: bool = True):
+        super().__init__(name, doc, labels, register)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        i = int(np.searchsorted(self.buckets, value))
+        with self._lock:
+            b = self._values.get(key)
+            if b is None:
+                b = self._values[key] = _Buckets(len(self.buckets))
+            b.counts[i] += 1
+            b.count += 1
+            b.sum += value
+
+    def get(self, **labels):
+        b = self._values.get(self._key(labels))
+        return None if b is None else {"count": b.count, "sum": b.sum}
+
+    def snapshot(self, **labels) -> dict:
+        """
+        Count, mean and per-bucket (not cumulative) counts, for JSON
+        endpoints such as /admin/shadow.
+        """
+        with self._lock:
+            b = self._values.get(self._key(labels)) or _Buckets(len(self.buckets))
+            counts, count, total = list(b.counts), b.count, b.sum
+        names = [f"<={v}" for v in self.buckets] + [f">{self.buckets[-1]}"]
+        return {
+            "count": count,
+            "mean": total / count if count else None,
+            "buckets": dict(zip(names, counts)),
+        }
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(
+                (key, list(b.counts), b.count, b.sum) for key, b in self._values.items()
+            )
+        for key, counts, count, total in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = _labels(self.label_names, key, f'le="{_number(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            labels = _labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_number(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+def render() -> str:
+    lines = []
+    for metric in _REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+STAGE_SECONDS = Histogram(
+    "enforecast_stage_seconds",
+    "Time spent per request stage.",
+    ("stage",),
+)
+REQUESTS = Counter(
+    "enforecast_http_requests_total",
+    "HTTP requests by route and status code.",
+    ("method", "route", "status"),
+)
+REQUEST_SECONDS = Histogram(
+    "enforecast_http_request_duration_seconds",
+    "HTTP request latency by route.",
+    ("method", "route"),
+    REQUEST_BUCKETS,
+)
+CACHE_LOOKUPS = Counter(
+    "enforecast_cache_lookups_total",
+    "Cache lookups by cache and result (hit/miss).",
+    ("cache", "result"),
+)
+CACHE_HIT_RATIO = Gauge(
+    "enforecast_cache_hit_ratio",
+    "Hits / lookups since start, per cache.",
+    ("cache",),
+)
+MODEL_LOAD_SECONDS = Gauge(
+    "enforecast_model_load_seconds",
+    "Time to read, verify and build the engine of a model version.",
+    ("version",),
+)
+DB_POOL_CONNECTIONS = Gauge(
+    "enforecast_db_pool_connections",
+    "Database connections per pool: in_use (checked out), open, capacity.",
+    ("pool", "state"),
+)
+DB_POOL_SATURATION = Gauge(
+    "enforecast_db_pool_saturation",
+    "Checked-out connections / (pool_size + max_overflow); at 1 requests "
+    "queue for a connection.",
+    ("pool",),
+)
+DB_POOL_PEAK_SATURATION = Gauge(
+    "enforecast_db_pool_peak_saturation",
+    "Highest saturation over the last DB_POOL_PEAK_WINDOW seconds.",
+    ("pool",),
+)
+SLOW_PROFILES = Counter(
+    "enforecast_slow_request_profiles_total",
+    "Flamegraph profiles written for slow requests.",
+)
+
+
+# ---- stage timing ----
+
+_local = threading.local()
+
+
+def observe_stage(name: str, seconds: float):
+    timings = getattr(_local, "timings", None)
+    if timings is not None:
+        timings.append((name, seconds))
+    else:
+        STAGE_SECONDS.observe(seconds, stage=name)
+
+
+@contextmanager
+def stage(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - t0)
+
+
+def collect(fn, *args, **kwargs):
+    """
+    Run fn and return (result, stage timings) instead of recording the
+    timings: in process-pool workers, so the parent can record stages
+    timed out of its sight, and around work that should not count as
+    serving (shadow batches).
+    """
+    _local.timings = []
+    try:
+        result = fn(*args, **kwargs)
+        return result, _local.timings
+    finally:
+        _local.timings = None
+
+
+def record_stages(timings):
+    for name, seconds in timings:
+        STAGE_SECONDS.observe(seconds, stage=name)
+
+
+def cache_lookup(cache: str, hit: bool):
+    CACHE_LOOKUPS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def update_hit_ratios():
+    caches = {key[0] for key in list(CACHE_LOOKUPS._values)}
+    for cache in caches:
+        hits = CACHE_LOOKUPS.get(cache=cache, result="hit") or 0
+        misses = CACHE_LOOKUPS.get(cache=cache, result="miss") or 0
+        if hits + misses:
+            CACHE_HIT_RATIO.set(hits / (hits + misses), cache=cache)
+
+
+def router(*before_scrape):
+    """
+    APIRouter serving GET /metrics. Each of `before_scrape` is called
+    first, to copy state kept elsewhere (pools, caches) into gauges.
+    """
+    # imported here: forecast_engine and the offline ml/ scripts use
+    # this module without the web stack
+    from fastapi import APIRouter
+    from fastapi.responses import PlainTextResponse
+
+    api = APIRouter()
+
+    @api.get("/metrics")
+    def prometheus_metrics():
+        """
+        Prometheus text format: per-stage and per-route latency
+        histograms, request counts by status, cache hit ratios, model
+        load times and database pool saturation of this process.
+        """
+        for update in before_scrape:
+            update()
+        update_hit_ratios()
+        return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
+
+    return api
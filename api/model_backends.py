@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Alternative inference backends for the trained models.
+
+Each backend exposes ``predict(X) -> 1-D array`` so it can stand in for
+the sklearn estimators inside ForecastEngine.
+"""
+import struct
+import zipfile
+
+import numpy as np
+
+
+class NativeBoosterModel:
+    """
+    XGBoost model loaded from the native UBJ/JSON format and evaluated
+    with Booster.inplace_predict, skipping the sklearn wrapper's input
+    validation and DMatrix construction on every call.
+    """
+
+    def __init__(self, booster):
+        self.booster = booster
+
+    @classmethod
+    def load(cls, path: str) -> "NativeBoosterModel":
+        import xgboost
+
+        booster = xgboost.Booster()
+        booster.load_model(path)
+        return cls(booster)
+
+    def predict(self, X) -> np.ndarray:
+        X = np.asarray(X, dtype=float)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        return self.booster.inplace_predict(X, missing=np.nan)
+
+
+def load_npz_mmap(path: str) -> dict:
+    """
+    Load an uncompressed .npz with every array memory-mapped read-only.
+
+    np.load ignores mmap_mode for .npz archives, so the members are
+    located inside the zip and mapped directly. All processes mapping
+    the same file share one copy of it through the page cache.
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as zf, open(path, "rb") as f:
+        for info in zf.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{path} is compressed and cannot be memory-mapped")
+            f.seek(info.header_offset)
+            name_len, extra_len = struct.unpack("<HH", f.read(30)[26:30])
+            f.seek(info.header_offset + 30 + name_len + extra_len)
+
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+            key = info.filename[:-4] if info.filename.endswith(".npy") else info.filename
+            count = int(np.prod(shape))
+
+            if dtype.hasobject:
+                raise ValueError(f"{path}:{key} holds Python objects")
+            if count == 0 or shape == () or f.tell() % dtype.alignment:
+                # scalars / empty arrays are not worth mapping, and
+                # misaligned members (plain np.savez output) would make
+                # every access slow, so those are read into memory
+                data = f.read(dtype.itemsize * count)
+                arrays[key] = np.frombuffer(data, dtype=dtype).reshape(
+                    shape, order="F" if fortran else "C"
+                )
+            else:
+                mapped = np.memmap(
+                    path, dtype=dtype, mode="r", offset=f.tell(), shape=shape,
+                    order="F" if fortran else "C",
+                )
+                # plain ndarray view of the mapping: memmap's subclass
+                # hooks would otherwise run on every take() result
+                arrays[key] = np.asarray(mapped)
+    return arrays
+
+
+class TreeTableModel:
+    """
+    Tree ensemble evaluated from a flat node table (see
+    ml/export_trees.py) with vectorized NumPy: all trees and all rows
+    descend one level per iteration, for max_depth iterations.
+
+    Matches the original models' arithmetic: inputs are compared as
+    float32, XGBoost leaves are summed in float32 in tree order starting
+    from base_score, random-forest leaves are averaged in float64.
+    """
+
+    def __init__(self, table):
+        self.kind = str(table["kind"])
+        if self.kind not in ("xgb", "rf"):
+            raise ValueError(f"Unknown tree table kind: {self.kind}")
+        self.base_score = float(table["base_score"])
+        self.max_depth = int(table["max_depth"])
+        self.n_features = int(table["n_features"])
+
+        # arrays are used as stored (possibly memory-mapped), never copied
+        self.feature = table["feature"]
+        self.threshold = table["threshold"]
+        self.children = table["children"]
+        self.default_left = table["default_left"]
+        self.value = table["value"]
+        self.roots = table["roots"]
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "TreeTableModel":
+        if mmap:
+            return cls(load_npz_mmap(path))
+        with np.load(path) as data:
+            table = {k: data[k] for k in data.files}
+        return cls(table)
+
+    # rows evaluated together: the (n_trees, rows) node arrays of larger
+    # blocks fall out of cache, e.g. for bootstrap path matrices
+    ROW_BLOCK = 256
+
+    def predict(self, X) -> np.ndarray:
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if len(X) > self.ROW_BLOCK:
+            return np.concatenate([
+                self._predict_block(X[i:i + self.ROW_BLOCK])
+                for i in range(0, len(X), self.ROW_BLOCK)
+            ])
+        return self._predict_block(X)
+
+    def _predict_block(self, X) -> np.ndarray:
+        n, n_cols = X.shape
+        flat = X.ravel()
+        row_offsets = (np.arange(n, dtype=np.int64) * n_cols)[None, :]
+
+        node = np.repeat(self.roots[:, None], n, axis=1)  # (n_trees, n)
+        for _ in range(self.max_depth):
+            x = flat.take(row_offsets + self.feature.take(node))
+            if self.kind == "xgb":
+                go_left = x < self.threshold.take(node)
+            else:
+                go_left = x <= self.threshold.take(node)
+            missing = np.isnan(x)
+            if missing.any():
+                go_left = np.where(missing, self.default_left.take(node), go_left)
+            node = self.children.take(2 * node + go_left)
+
+        leaves = self.value.take(node)
+        if self.kind == "xgb":
+            # reducing over axis 0 adds tree rows one after another
+            acc = np.empty((leaves.shape[0] + 1, n), dtype=np.float32)
+            acc[0] = self.base_score
+            acc[1:] = leaves
+            if n == 1:
+                # a single column would be summed pairwise; keep tree order
+                return np.cumsum(acc[:, 0], dtype=np.float32)[-1:]
+            return acc.sum(axis=0, dtype=np.float32)
+        return leaves.sum(axis=0) / leaves.shape[0]
+
+
+class LinearModel:
+    """
+    Linear model (e.g. Ridge) from a *.linear.npz written by
+    ml/export_trees.py: predict(X) = X @ coef + intercept, NumPy only.
+    """
+
+    def __init__(self, coef, intercept):
+        self.coef = np.asarray(coef, dtype=float)
+        self.intercept = float(intercept)
+
+    @classmethod
+    def load(cls, path: str) -> "LinearModel":
+        with np.load(path) as f:
+            return cls(f["coef"], f["intercept"])
+
+    def predict(self, X) -> np.ndarray:
+        X = np.asarray(X, dtype=float)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        return X @ self.coef + self.intercept
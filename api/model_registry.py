@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+Versioned model registry.
+
+Trained artifacts are published as immutable version directories next
+to a pointer naming the one to serve:
+
+    registry/
+        CURRENT                     "20261017-142501-3fa2b9c1\\n"
+        20261017-142501-3fa2b9c1/
+            manifest.json
+            feature_config.json
+            xgb_lc_model.trees.npz
+            ...
+
+manifest.json records the version, the SHA-256 of every artifact, the
+feature columns, the scaler stats and the selected model types. A
+version is written under a temporary name and renamed into place, and
+CURRENT is replaced atomically, so a reader never sees a half-copied
+version. The API loads whatever CURRENT names (see
+model_service.reload_models) and verifies the hashes first; watch()
+follows CURRENT in a running API.
+
+Without a registry the API serves the flat api/models directory, as
+before.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+CURRENT = "CURRENT"
+
+# what a trained models directory may contain, besides feature_config.json
+ARTIFACT_SUFFIXES = (".joblib", ".ubj", ".trees.npz", ".linear.npz")
+EXTRA_FILES = ("metrics.json", "residuals.npz")
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def current_version(registry_dir: str):
+    """
+    Version named by CURRENT, or None if there is no registry.
+    """
+    try:
+        with open(os.path.join(registry_dir, CURRENT), "r") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def version_dir(registry_dir: str, version: str) -> str:
+    if not version or os.sep in version or version.startswith("."):
+        raise ValueError(f"Invalid model version: {version!r}")
+    return os.path.join(registry_dir, version)
+
+
+def read_manifest(registry_dir: str, version: str) -> dict:
+    path = os.path.join(version_dir(registry_dir, version), MANIFEST)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No model version {version!r} in {registry_dir}")
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def verify(registry_dir: str, manifest: dict):
+    """
+    Raise ValueError unless every artifact of the version matches its
+    manifest hash and the config agrees with the manifest.
+    """
+    path = version_dir(registry_dir, manifest["version"])
+    for name, digest in manifest["artifacts"].items():
+        if file_sha256(os.path.join(path, name)) != digest:
+            raise ValueError(f"{manifest['version']}/{name} does not match its manifest hash")
+    with open(os.path.join(path, "feature_config.json"), "r") as f:
+        cfg = json.load(f)
+    for key in ("feature_cols", "scaler_mean", "scaler_scale"):
+        if cfg.get(key) != manifest.get(key):
+            raise ValueError(f"{manifest['version']}: {key} differs from the manifest")
+
+
+def list_versions(registry_dir: str) -> list:
+    """
+    Manifests of all published versions, oldest first.
+    """
+    if not os.path.isdir(registry_dir):
+        return []
+    manifests = []
+    for name in sorted(os.listdir(registry_dir)):
+        if name.startswith("."):
+            continue  # being published
+        if os.path.exists(os.path.join(registry_dir, name, MANIFEST)):
+            manifests.append(read_manifest(registry_dir, name))
+    return sorted(manifests, key=lambda m: m["created_at"])
+
+
+def activate(registry_dir: str, version: str):
+    """
+    Point CURRENT at an already published version.
+    """
+    read_manifest(registry_dir, version)
+    tmp = os.path.join(registry_dir, f".{CURRENT}.tmp")
+    with open(tmp, "w") as f:
+        f.write(version + "\n")
+    os.replace(tmp, os.path.join(registry_dir, CURRENT))
+
+
+def publish(models_dir: str, registry_dir: str, version: str = None,
+            activate_version: bool = True) -> dict:
+    """
+    Copy the artifacts of a trained models directory (output of
+    ml/train_models.py) into a new registry version and return its
+    manifest. The version defaults to a timestamp plus the first 8 hex
+    digits of the artifacts' combined hash.
+    """
+    with open(os.path.join(models_dir, "feature_config.json"), "r") as f:
+        cfg = json.load(f)
+    names = ["feature_config.json"] + sorted(
+        name for name in os.listdir(models_dir)
+        if name.endswith(ARTIFACT_SUFFIXES) or name in EXTRA_FILES
+    )
+    artifacts = {name: file_sha256(os.path.join(models_dir, name)) for name in names}
+
+    if version is None:
+        combined = hashlib.sha256(json.dumps(artifacts, sort_keys=True).encode())
+        version = time.strftime("%Y%m%d-%H%M%S") + "-" + combined.hexdigest()[:8]
+    target = version_dir(registry_dir, version)
+    if os.path.exists(target):
+        raise FileExistsError(f"Model version {version!r} already exists")
+
+    manifest = {
+        "version": version,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "source": os.path.abspath(models_dir),
+        "artifacts": artifacts,
+        "best_lc_model_type": cfg["best_lc_model_type"],
+        "best_gen_model_type": cfg["best_gen_model_type"],
+        "feature_cols": cfg["feature_cols"],
+        "scaler_mean": cfg["scaler_mean"],
+        "scaler_scale": cfg["scaler_scale"],
+    }
+
+    os.makedirs(registry_dir, exist_ok=True)
+    tmp = os.path.join(registry_dir, f".{version}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for name in names:
+        shutil.copy2(os.path.join(models_dir, name), os.path.join(tmp, name))
+    with open(os.path.join(tmp, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.rename(tmp, target)
+
+    if activate_version:
+        activate(registry_dir, version)
+    return manifest
+
+
+async def watch(registry_dir: str, interval: float, served_version, reload,
+                ready=lambda: True):
+    """
+    Every `interval` seconds, once ready(), compare CURRENT with the
+    served_version() and await reload(version) when they differ. Both
+    are read in a worker thread, off the event loop. Runs until
+    cancelled; a failed reload is logged and retried at the next check.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        if not ready():
+            continue
+        try:
+            version = await asyncio.to_thread(current_version, registry_dir)
+            if version is None:
+                continue
+            if version != await asyncio.to_thread(served_version):
+                logger.info("Registry points at model version %s; reloading", version)
+                await reload(version)
+        except Exception:
+            logger.exception("Model reload failed; keeping the served version")
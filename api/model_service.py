@@ -1,20 +1,82 @@
 # -*- coding: utf-8 -*-
 import os
 import json
+import hashlib
 import logging
+import threading
+import time
+from collections import namedtuple
+
 import pandas as pd
 import numpy as np
-import joblib
+
+from enforecast.feature_store import build_states
+from enforecast.features import LAG_COLS, N_LAGS, forecast_rows
+from enforecast.state import EngineState
+from forecast_engine import ForecastEngine
+from metrics import MODEL_LOAD_SECONDS, stage
+from model_backends import LinearModel, NativeBoosterModel, TreeTableModel
+from model_registry import current_version, read_manifest, verify, version_dir
 
 logger = logging.getLogger(__name__)
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))  # /app
 MODELS_DIR = os.path.join(BASE_DIR, "models")
 
-_CFG = None
-_LC_MODEL = None
-_GEN_MODEL = None
-_FEATURE_COLS = None
+# "auto":    first artifact found of *.trees.npz / *.linear.npz, *.ubj,
+#            *.joblib
+# "numpy":   NumPy node tables / linear coefficients only (no
+#            xgboost/sklearn import)
+# "native":  XGBoost native boosters only. 2-3x faster than the node
+#            tables on large batches, but every worker holds its own
+#            booster in memory instead of sharing the mmap'd tables
+#            (MODEL_MMAP), so it is opt-in
+# "sklearn": pickled sklearn estimators only
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "auto").lower()
+
+# memory-map node tables read-only so uvicorn workers share one copy
+MODEL_MMAP = os.getenv("MODEL_MMAP", "1") not in ("0", "false", "no")
+
+# versioned artifacts (model_registry.py); served instead of MODELS_DIR
+# once its CURRENT pointer exists
+MODEL_REGISTRY = os.getenv("MODEL_REGISTRY", os.path.join(MODELS_DIR, "registry"))
+
+# one-step residuals of the models (ml/backtest.py), for ?intervals=
+RESIDUALS_FILE = "residuals.npz"
+INTERVAL_PATHS = int(os.getenv("INTERVAL_PATHS", "500"))
+# fixed seed: the same request gets the same bands
+INTERVAL_SEED = 0
+# subtract the mean one-step residual before resampling. Off by default:
+# the mean is the models' bias, a real part of their error, and without
+# it the bands understate how far off the point forecast is
+INTERVAL_CENTER_RESIDUALS = os.getenv("INTERVAL_CENTER_RESIDUALS", "0") not in ("0", "false", "no")
+
+# everything loaded for one model version, swapped as a unit: a request
+# keeps the LoadedModels it started with even if a reload swaps it out
+LoadedModels = namedtuple(
+    "LoadedModels",
+    [
+        "version", "models_dir", "cfg", "lc_model", "gen_model", "engine",
+        "artifact_hash", "residual_bias",
+    ],
+)
+
+_MODELS = None
+# models may be loaded from the warm-up thread and a request concurrently
+_LOAD_LOCK = threading.RLock()
+
+
+def _current() -> LoadedModels:
+    """
+    The models being served, loading them on first use.
+    """
+    models = _MODELS
+    if models is not None:
+        return models
+    with _LOAD_LOCK:
+        if _MODELS is None:
+            _swap(_load_version(current_version(MODEL_REGISTRY)))
+    return _MODELS
 
 
 def _load_models():
@@ -25,46 +87,330 @@ def _load_models():
     binary dependencies (libgomp) on Railway; instead, its mean and
     scale are stored in feature_config.json and applied manually.
     """
-    global _CFG, _LC_MODEL, _GEN_MODEL, _FEATURE_COLS
-    if _CFG is not None:
-        return _CFG, _LC_MODEL, _GEN_MODEL, _FEATURE_COLS
-
-    try:
-        cfg_path = os.path.join(MODELS_DIR, "feature_config.json")
-        logger.info("Loading feature config from %s", cfg_path)
-        with open(cfg_path, "r") as f:
-            _CFG = json.load(f)
-
-        lc_path = os.path.join(
-            MODELS_DIR, f"{_CFG['best_lc_model_type']}_lc_model.joblib"
-        )
-        gen_path = os.path.join(
-            MODELS_DIR, f"{_CFG['best_gen_model_type']}_gen_model.joblib"
-        )
+    models = _current()
+    return models.cfg, models.lc_model, models.gen_model, models.cfg["feature_cols"]
 
-        logger.info("Loading LC model from %s", lc_path)
-        _LC_MODEL = joblib.load(lc_path)
 
-        logger.info("Loading GEN model from %s", gen_path)
-        _GEN_MODEL = joblib.load(gen_path)
-
-        _FEATURE_COLS = _CFG["feature_cols"]
+def _load_version(version) -> LoadedModels:
+    """
+    Load a registry version (verified against its manifest), or the flat
+    MODELS_DIR when `version` is None. Does not touch the served models.
+    """
+    models_dir = MODELS_DIR
+    t0 = time.perf_counter()
+    try:
+        if version is not None:
+            manifest = read_manifest(MODEL_REGISTRY, version)
+            verify(MODEL_REGISTRY, manifest)
+            models_dir = version_dir(MODEL_REGISTRY, version)
+        cfg, paths, lc_model, gen_model = _read_artifacts(models_dir)
+        art_hash = _hash_files(paths)
+        residuals = _load_residuals(models_dir)
+        engine = _new_engine(cfg, lc_model, gen_model, residuals)
+        seconds = time.perf_counter() - t0
         logger.info(
-            "Models loaded OK from %s (n_features=%d)",
-            MODELS_DIR,
-            len(_FEATURE_COLS),
+            "Models loaded OK from %s (n_features=%d) in %.2f s",
+            models_dir,
+            len(cfg["feature_cols"]),
+            seconds,
         )
     except Exception as e:
-        logger.exception("Failed to load models from %s", MODELS_DIR)
+        logger.exception("Failed to load models %s", version or models_dir)
         raise RuntimeError(
             "Model stack could not be loaded on this environment "
             "(likely missing or incompatible artifacts)."
         ) from e
+    version = version or art_hash[:12]
+    MODEL_LOAD_SECONDS.set(seconds, version=version)
+    return LoadedModels(
+        # unregistered artifacts are identified by their hash
+        version,
+        models_dir,
+        cfg,
+        lc_model,
+        gen_model,
+        engine,
+        art_hash,
+        residual_bias(residuals),
+    )
+
+
+def _swap(models: LoadedModels):
+    global _MODELS
+    # one assignment: requests see either the old or the new version
+    _MODELS = models
+
+
+def reload_models(version: str = None, force: bool = False) -> dict:
+    """
+    Load `version` (default: the registry's CURRENT) off the request
+    path, warm it up, then swap it in atomically. In-flight requests
+    finish on the version they started with. A failed load leaves the
+    served models untouched. Blocking; call it from a worker thread.
+    """
+    if version is None:
+        version = current_version(MODEL_REGISTRY)
+    served = _MODELS
+    if not force and served is not None and (version or served.version) == served.version:
+        return model_info()
+
+    t0 = time.perf_counter()
+    models = _load_version(version)
+    _warm(models.engine)
+    with _LOAD_LOCK:
+        previous = _MODELS
+        _swap(models)
+    logger.info(
+        "Swapped models %s -> %s in %.2f s",
+        previous.version if previous is not None else None,
+        models.version,
+        time.perf_counter() - t0,
+    )
+    return model_info()
+
+
+# ---- shadow candidate (see shadow.py) ----
+
+_SHADOW = None
+
+
+def load_shadow(version: str) -> dict:
+    """
+    Load a registry version as the shadow candidate, next to the served
+    models. Blocking; call it from a worker thread.
+    """
+    global _SHADOW
+    models = _load_version(version)
+    _warm(models.engine)
+    _SHADOW = models
+    logger.info("Shadow candidate %s loaded", models.version)
+    return {"model_version": models.version, "artifact_hash": models.artifact_hash}
+
+
+def clear_shadow():
+    global _SHADOW
+    _SHADOW = None
+
+
+def shadow_version():
+    models = _SHADOW
+    return models.version if models is not None else None
+
+
+def shadow_feature_columns():
+    models = _SHADOW
+    return list(models.engine.feature_cols) if models is not None else None
+
+
+def shadow_predict_batch(histories: dict, horizon: int, states: dict = None) -> dict:
+    """
+    predict_horizon_batch with the shadow candidate instead of the
+    served models; also returns the candidate's run time under
+    "seconds". Raises RuntimeError if no candidate is loaded.
+    """
+    models = _SHADOW
+    if models is None:
+        raise RuntimeError("No shadow model loaded")
+    t0 = time.perf_counter()
+    batch = _predict_batch(models, histories, horizon, states)
+    batch["seconds"] = time.perf_counter() - t0
+    return batch
+
+
+def model_version() -> str:
+    return _current().version
+
+
+def model_info() -> dict:
+    models = _current()
+    return {
+        "model_version": models.version,
+        "models_dir": models.models_dir,
+        "artifact_hash": models.artifact_hash,
+        "registry": MODEL_REGISTRY,
+        "registry_current": current_version(MODEL_REGISTRY),
+        "best_lc_model_type": models.cfg["best_lc_model_type"],
+        "best_gen_model_type": models.cfg["best_gen_model_type"],
+        "residual_bias": models.residual_bias,
+    }
+
+
+def _read_artifacts(models_dir: str):
+    """
+    Read feature_config.json and the selected LC/GEN models from
+    `models_dir`. Returns (cfg, [config, lc, gen paths], lc, gen).
+    """
+    cfg_path = os.path.join(models_dir, "feature_config.json")
+    logger.info("Loading feature config from %s", cfg_path)
+    with open(cfg_path, "r") as f:
+        cfg = json.load(f)
+
+    logger.info("Loading LC model (backend=%s)", MODEL_BACKEND)
+    lc_path, lc_model = _load_model(cfg["best_lc_model_type"], "lc", models_dir)
+
+    logger.info("Loading GEN model (backend=%s)", MODEL_BACKEND)
+    gen_path, gen_model = _load_model(cfg["best_gen_model_type"], "gen", models_dir)
+
+    return cfg, [cfg_path, lc_path, gen_path], lc_model, gen_model
+
+
+def _load_joblib(path: str):
+    import joblib
+
+    return joblib.load(path)
+
+
+def _load_model(model_type: str, target: str, models_dir: str = MODELS_DIR):
+    """
+    Load one model artifact for MODEL_BACKEND, returning (path, model).
+    """
+    base = os.path.join(models_dir, f"{model_type}_{target}_model")
+    candidates = []
+    if MODEL_BACKEND in ("auto", "numpy"):
+        candidates.append(
+            (
+                "numpy",
+                f"{base}.trees.npz",
+                lambda path: TreeTableModel.load(path, mmap=MODEL_MMAP),
+            )
+        )
+        candidates.append(("numpy", f"{base}.linear.npz", LinearModel.load))
+    if MODEL_BACKEND in ("auto", "native") and model_type == "xgb":
+        candidates.append(("native", f"{base}.ubj", NativeBoosterModel.load))
+    if MODEL_BACKEND in ("auto", "sklearn"):
+        candidates.append(("sklearn", f"{base}.joblib", _load_joblib))
+
+    for name, path, loader in candidates:
+        if os.path.exists(path):
+            logger.info("Loading %s model from %s", name, path)
+            return path, loader(path)
+    raise FileNotFoundError(
+        f"No artifact for {base} with MODEL_BACKEND={MODEL_BACKEND}"
+    )
+
+
+def _hash_files(paths) -> str:
+    h = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+    return h.hexdigest()
+
+
+def artifact_hash() -> str:
+    """
+    SHA-256 over the feature config and the two model files that are
+    currently loaded. Used to key precomputed forecasts.
+    """
+    return _current().artifact_hash
+
+
+def _scaled_input(cfg: dict, target: str) -> bool:
+    # configs from before "{target}_input" existed: LC scaled, GEN raw
+    default = "scaled" if target == "lc" else "raw"
+    return cfg.get(f"{target}_input", default) == "scaled"
+
+
+def _get_engine() -> ForecastEngine:
+    """
+    ForecastEngine around the served models, with the manual
+    StandardScaler stats (same as scaler.mean_ and scaler.scale_).
+    """
+    return _current().engine
+
+
+def _load_residuals(models_dir: str):
+    """
+    (m, 2) array of one-step (delta_lc, delta_log_gen) residuals, or
+    None if the models directory has no residuals file.
+    """
+    path = os.path.join(models_dir, RESIDUALS_FILE)
+    if not os.path.exists(path):
+        logger.info("No %s; forecast intervals disabled", path)
+        return None
+    with np.load(path) as f:
+        return f["residuals"]
+
+
+def residual_bias(residuals):
+    """
+    Mean one-step residual of each model, and whether the interval
+    bootstrap subtracts it (INTERVAL_CENTER_RESIDUALS). None without
+    residuals.
+    """
+    if residuals is None or not len(residuals):
+        return None
+    bias = residuals.mean(axis=0)
+    return {
+        "delta_lc": float(bias[0]),
+        "delta_log_gen": float(bias[1]),
+        "residuals": len(residuals),
+        "centered": INTERVAL_CENTER_RESIDUALS,
+    }
 
-    return _CFG, _LC_MODEL, _GEN_MODEL, _FEATURE_COLS
+
+def _new_engine(cfg: dict, lc_model, gen_model, residuals=None) -> ForecastEngine:
+    if INTERVAL_CENTER_RESIDUALS and residuals is not None and len(residuals):
+        bias = residuals.mean(axis=0)
+        logger.info(
+            "Centering %d residuals (mean delta_lc %.4f, delta_log_gen %.4f)",
+            len(residuals), bias[0], bias[1],
+        )
+        residuals = residuals - bias
+    return ForecastEngine(
+        cfg["feature_cols"],
+        cfg["scaler_mean"],
+        cfg["scaler_scale"],
+        lc_model,
+        gen_model,
+        lc_scaled=_scaled_input(cfg, "lc"),
+        gen_scaled=_scaled_input(cfg, "gen"),
+        residuals=residuals,
+    )
+
+
+def load_engine(models_dir: str):
+    """
+    A separate ForecastEngine over the artifacts in `models_dir`, e.g.
+    for backtesting freshly trained models. Returns (cfg, engine,
+    artifact hash); the served models are not touched.
+    """
+    cfg, paths, lc_model, gen_model = _read_artifacts(models_dir)
+    engine = _new_engine(cfg, lc_model, gen_model, _load_residuals(models_dir))
+    return cfg, engine, _hash_files(paths)
+
+
+def feature_columns() -> list:
+    """
+    Model input columns of the loaded models, in feature_config.json
+    order.
+    """
+    return list(_get_engine().feature_cols)
+
+
+def warm_up():
+    """
+    Load the models and run a dummy two-step forecast, so imports,
+    artifact loading and first-call allocations happen before the first
+    real request. Blocking; call it from a worker thread.
+    """
+    _warm(_get_engine())
+
+
+def _warm(engine: ForecastEngine):
+    state = EngineState(
+        features=np.zeros(len(engine.feature_cols)),
+        current=np.ones(len(engine.state_cols)),
+        past=np.ones((N_LAGS, len(LAG_COLS))),
+        base_year=0,
+    )
+    engine.run([state], 2)
 
 
 def _add_shares_and_lags(df: pd.DataFrame) -> pd.DataFrame:
+    # pandas reference for features.build_features, used only by
+    # _predict_horizon_pandas
     if df.empty:
         return df
 
@@ -98,21 +444,213 @@ def _add_shares_and_lags(df: pd.DataFrame) -> pd.DataFrame:
 
 
 def _prepare_history_for_features(df: pd.DataFrame) -> pd.DataFrame:
-    df = _add_shares_and_lags(df)
+    # forecast_rows returns a new frame: callers may pass shared
+    # (cached) frames
+    if df.empty:
+        return df
+    return forecast_rows(df).copy()
+
+
+def _prepare_history_pandas(df: pd.DataFrame) -> pd.DataFrame:
+    df = _add_shares_and_lags(df.copy())
     df = df[df["year"] >= 2000]
     df = df[df["low_carbon_share_pct_lag3"].notnull()]
     return df.sort_values("year").copy()
 
 
+def _initial_state(engine: ForecastEngine, iso3: str, hist_raw: pd.DataFrame):
+    if hist_raw.empty:
+        raise ValueError(f"No history for {iso3}")
+
+    hist = _prepare_history_for_features(hist_raw)
+    if hist.empty:
+        raise ValueError("Not enough history to build features")
+
+    return engine.initial_state(hist)
+
+
+def _build_states(feature_cols, histories: dict) -> dict:
+    """
+    iso3 -> EngineState for every country in `histories` with usable
+    rows, built in one feature_store.build_states pass over all of them
+    instead of one _initial_state per country.
+    """
+    codes, frames = [], []
+    for iso3, hist_raw in histories.items():
+        if not hist_raw.empty:
+            codes.append(iso3.upper())
+            frames.append(hist_raw)
+    if not frames:
+        return {}
+    panel = pd.concat(frames, ignore_index=True)
+    # keyed by the requested code, as _initial_state is
+    panel["iso3"] = np.repeat(codes, [len(f) for f in frames])
+    return build_states(panel, feature_cols)
+
+
+def _format_forecast(iso3: str, base_year: int, lc, gen, bands=None) -> dict:
+    forecasts = [
+        {
+            "year": base_year + step,
+            "low_carbon_share_pct": float(lc[step - 1]),
+            "electricity_generation_twh": float(gen[step - 1]),
+        }
+        for step in range(1, len(lc) + 1)
+    ]
+    if bands is not None:
+        for i, row in enumerate(forecasts):
+            row["intervals"] = {
+                key: {
+                    "low_carbon_share_pct": [float(lc_lo[i]), float(lc_hi[i])],
+                    "electricity_generation_twh": [float(gen_lo[i]), float(gen_hi[i])],
+                }
+                for key, (lc_lo, lc_hi, gen_lo, gen_hi) in bands.items()
+            }
+    return {"iso3": iso3, "base_year": base_year, "forecasts": forecasts}
+
+
+def _run_states(models: LoadedModels, codes, states, horizon: int,
+                intervals=None, paths: int = INTERVAL_PATHS) -> list:
+    """
+    Forecast results for `states`, tagged with the model version. With
+    `intervals` (central levels in percent, e.g. [80, 95]) every step
+    also gets the matching quantile bands of `paths` bootstrap paths per
+    country.
+    """
+    engine = models.engine
+    if not intervals:
+        lc, gen = engine.run(states, horizon)
+        with stage("format"):
+            results = [
+                _format_forecast(iso3, state.base_year, lc[i], gen[i])
+                for i, (iso3, state) in enumerate(zip(codes, states))
+            ]
+            for result in results:
+                result["model_version"] = models.version
+        return results
+
+    lc, gen, lc_paths, gen_paths = engine.run_paths(
+        states, horizon, paths, rng=INTERVAL_SEED
+    )
+    with stage("format"):
+        return _format_bands(models, codes, states, intervals, paths,
+                             lc, gen, lc_paths, gen_paths)
+
+
+def _format_bands(models: LoadedModels, codes, states, intervals, paths: int,
+                  lc, gen, lc_paths, gen_paths) -> list:
+    levels = sorted(set(float(level) for level in intervals))
+    q = [p for level in levels for p in (0.5 - level / 200.0, 0.5 + level / 200.0)]
+    # (len(q), n, horizon)
+    lc_q = np.quantile(lc_paths, q, axis=1)
+    gen_q = np.quantile(gen_paths, q, axis=1)
+
+    results = []
+    for i, (iso3, state) in enumerate(zip(codes, states)):
+        bands = {
+            f"{level:g}": (lc_q[2 * j, i], lc_q[2 * j + 1, i],
+                           gen_q[2 * j, i], gen_q[2 * j + 1, i])
+            for j, level in enumerate(levels)
+        }
+        result = _format_forecast(iso3, state.base_year, lc[i], gen[i], bands)
+        result["interval_paths"] = paths
+        result["model_version"] = models.version
+        results.append(result)
+    return results
+
+
 def predict_horizon_from_df(
-    iso3: str, hist_raw: pd.DataFrame, horizon: int = 5
+    iso3: str, hist_raw: pd.DataFrame, horizon: int = 5,
+    intervals=None, paths: int = INTERVAL_PATHS,
 ) -> dict:
     """
     Predict low_carbon_share_pct and electricity_generation_twh
     for horizon future years (1–10) after the last actual year,
     given a history dataframe from the database.
+
+    `intervals` (e.g. [80, 95]) adds residual-bootstrap prediction
+    intervals at those central levels to every year.
     """
-    CFG, LC_MODEL, GEN_MODEL, FEATURE_COLS = _load_models()
+    models = _current()
+
+    iso3 = iso3.upper()
+    with stage("feature_build"):
+        state = _initial_state(models.engine, iso3, hist_raw)
+    return _run_states(models, [iso3], [state], horizon, intervals, paths)[0]
+
+
+def predict_horizon_from_state(
+    iso3: str, state: EngineState, horizon: int = 5,
+    intervals=None, paths: int = INTERVAL_PATHS,
+) -> dict:
+    """
+    predict_horizon_from_df starting from a precomputed state (see
+    feature_store.py) instead of the raw history.
+    """
+    models = _current()
+    return _run_states(models, [iso3.upper()], [state], horizon, intervals, paths)[0]
+
+
+def predict_horizon_batch(
+    histories: dict, horizon: int = 5, states: dict = None,
+    intervals=None, paths: int = INTERVAL_PATHS,
+) -> dict:
+    """
+    Batched predict_horizon_from_df for several countries at once.
+
+    `histories` maps iso3 -> history dataframe, `states` iso3 ->
+    precomputed EngineState for countries whose history is not needed.
+    All countries (and all their bootstrap paths, with `intervals`) are
+    stacked into one matrix so each step costs a single LC and GEN
+    model call. Countries without usable history are reported under
+    "errors" instead of failing the whole batch.
+    """
+    # one version for the whole batch, even if a reload swaps it meanwhile
+    return _predict_batch(_current(), histories, horizon, states, intervals, paths)
+
+
+def _predict_batch(models: LoadedModels, histories: dict, horizon: int,
+                   states: dict = None, intervals=None,
+                   paths: int = INTERVAL_PATHS) -> dict:
+    codes, run_states, errors = [], [], {}
+    for iso3, state in (states or {}).items():
+        codes.append(iso3.upper())
+        run_states.append(state)
+    with stage("feature_build"):
+        built = _build_states(models.cfg["feature_cols"], histories)
+        for iso3, hist_raw in histories.items():
+            iso3 = iso3.upper()
+            if hist_raw.empty:
+                errors[iso3] = f"No history for {iso3}"
+            elif iso3 not in built:
+                errors[iso3] = "Not enough history to build features"
+            else:
+                codes.append(iso3)
+                run_states.append(built[iso3])
+
+    results = []
+    if run_states:
+        results = _run_states(models, codes, run_states, horizon, intervals, paths)
+
+    return {
+        "horizon": horizon,
+        "model_version": models.version,
+        "results": results,
+        "errors": errors,
+    }
+
+
+def _predict_horizon_pandas(
+    iso3: str, hist_raw: pd.DataFrame, horizon: int = 5
+) -> dict:
+    """
+    Original pandas implementation of the recursive forecast, which
+    rebuilds the history frame at every step. Kept as the reference
+    that ForecastEngine output is checked against.
+    """
+    models = _current()
+    CFG, LC_MODEL, GEN_MODEL = models.cfg, models.lc_model, models.gen_model
+    FEATURE_COLS = CFG["feature_cols"]
 
     # manual StandardScaler stats (same as scaler.mean_ and scaler.scale_)
     means = np.array(CFG["scaler_mean"], dtype=float)
@@ -122,7 +660,7 @@ def predict_horizon_from_df(
     if hist_raw.empty:
         raise ValueError(f"No history for {iso3}")
 
-    hist = _prepare_history_for_features(hist_raw)
+    hist = _prepare_history_pandas(hist_raw)
     if hist.empty:
         raise ValueError("Not enough history to build features")
 
@@ -141,8 +679,10 @@ def predict_horizon_from_df(
         X = row.astype(float).values.reshape(1, -1)
 
         X_scaled = (X - means) / scales
-        delta_lc = float(LC_MODEL.predict(X_scaled)[0])
-        delta_log_gen = float(GEN_MODEL.predict(X)[0])
+        X_lc = X_scaled if _scaled_input(CFG, "lc") else X
+        X_gen = X_scaled if _scaled_input(CFG, "gen") else X
+        delta_lc = float(LC_MODEL.predict(X_lc)[0])
+        delta_log_gen = float(GEN_MODEL.predict(X_gen)[0])
 
         lc_level = lc_level + delta_lc
         lc_level = max(0.0, min(100.0, lc_level))
@@ -187,9 +727,9 @@ def predict_horizon_from_df(
         hist = pd.concat([hist, new_row.to_frame().T], ignore_index=True)
         hist = _add_shares_and_lags(hist)
 
-
     return {
         "iso3": iso3,
         "base_year": last_year,
         "forecasts": results,
+        "model_version": models.version,
     }
\ No newline at end of file
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Columnar in-memory copy of the countries ⋈ energy_yearly panel.
+
+The whole yearly dataset is small (~200 countries × ~35 years), so with
+HISTORY_SOURCE=memory it is loaded once into contiguous NumPy arrays
+sorted by (iso3, year), plus an iso3 -> (start, stop) offset index.
+Country histories are then array slices with no database round trip.
+"""
+import numpy as np
+import pandas as pd
+
+# non-numeric columns of the history query; everything else is float64
+TEXT_COLS = ["iso3", "name", "region", "subregion", "income_group"]
+INT_COLS = ["country_id", "year"]
+
+
+class PanelStore:
+    def __init__(self, columns: dict, offsets: dict, countries: list,
+                 data_version: str = None):
+        self.columns = columns  # column name -> 1-D array, all same length
+        self.offsets = offsets  # iso3 -> (start, stop)
+        self.countries = countries  # [{"code", "name"}] ordered by name
+        self.data_version = data_version
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, countries: list,
+                   data_version: str = None) -> "PanelStore":
+        """
+        Build from the history query result (one row per country-year)
+        and the /countries listing.
+        """
+        df = df.copy()
+        df["iso3"] = df["iso3"].astype(str).str.strip()
+        df = df.sort_values(["iso3", "year"], kind="stable").reset_index(drop=True)
+
+        columns = {}
+        for col in df.columns:
+            if col in TEXT_COLS:
+                columns[col] = df[col].to_numpy(dtype=object)
+            elif col in INT_COLS:
+                columns[col] = np.ascontiguousarray(df[col].to_numpy(dtype=np.int64))
+            else:
+                values = pd.to_numeric(df[col], errors="coerce")
+                columns[col] = np.ascontiguousarray(
+                    values.to_numpy(dtype=np.float64, na_value=np.nan)
+                )
+
+        offsets = {}
+        iso = columns.get("iso3", np.empty(0, dtype=object))
+        if len(iso):
+            starts = np.flatnonzero(np.r_[True, iso[1:] != iso[:-1]])
+            stops = np.r_[starts[1:], len(iso)]
+            for start, stop in zip(starts, stops):
+                offsets[iso[start]] = (int(start), int(stop))
+
+        return cls(columns, offsets, countries, data_version)
+
+    def __contains__(self, iso3: str) -> bool:
+        return iso3.upper() in self.offsets
+
+    def history(self, iso3: str) -> pd.DataFrame:
+        """
+        History frame for one country (empty if unknown), same columns
+        as the database query.
+        """
+        span = self.offsets.get(iso3.upper())
+        if span is None:
+            return pd.DataFrame()
+        start, stop = span
+        return pd.DataFrame(
+            {col: arr[start:stop] for col, arr in self.columns.items()}
+        )
+
+    def frame(self) -> pd.DataFrame:
+        """
+        The whole panel, sorted by (iso3, year).
+        """
+        return pd.DataFrame(self.columns)
+
+    def histories(self, iso3_list=None) -> dict:
+        codes = self.offsets.keys() if iso3_list is None else iso3_list
+        return {code: self.history(code) for code in codes}
+
+    def info(self) -> dict:
+        return {
+            "rows": len(self.columns.get("year", ())),
+            "countries_with_history": len(self.offsets),
+            "countries": len(self.countries),
+            "data_version": self.data_version,
+        }
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Sampling profiler for slow requests.
+
+A daemon thread samples the Python stack of every thread in the
+process every `interval` seconds and keeps the last `window` seconds
+of samples. When a request turns out to be slow (SlowRequests,
+PROFILE_SLOW_MS), the samples taken while it ran are written as a
+collapsed ("folded") stack file:
+
+    MainThread;run (uvicorn/server.py:61);...;forecast (main.py:421) 37
+
+one line per distinct stack with its sample count, root first, which
+flamegraph.pl, speedscope or inferno turn into a flamegraph. The first
+frame is the thread name, so the event loop and the inference threads
+show up as separate towers.
+
+Samples cover the whole process, so requests running at the same time
+as the slow one show up too. With INFERENCE_EXECUTOR=process the model
+work happens in other processes and is not sampled; use thread or
+inline to profile inference.
+"""
+import asyncio
+import collections
+import functools
+import logging
+import os
+import sys
+import threading
+import time
+
+from metrics import SLOW_PROFILES
+
+logger = logging.getLogger(__name__)
+
+
+# bounded: code objects of exec'd/reloaded code keep coming, and each
+# cached one stays alive
+@functools.lru_cache(maxsize=4096)
+def _frame_label(code) -> str:
+    name = getattr(code, "co_qualname", code.co_name)
+    path = code.co_filename
+    parent = os.path.basename(os.path.dirname(path))
+    return f"{name} ({parent}/{os.path.basename(path)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = 0.005, window: float = 30.0):
+        self.interval = interval
+        self.window = window
+        self._samples = collections.deque()  # (perf_counter, folded stack)
+        self._stacks = {}  # folded stack -> itself, so repeats share one string
+        self._dumps = collections.deque()  # (start, end, path)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def request_dump(self, start: float, end: float, path: str):
+        """
+        Write the samples taken between perf_counter() values `start`
+        and `end` to `path`. Only queues the work; the sampling thread
+        writes the file, off the request path.
+        """
+        self._dumps.append((start, end, path))
+
+    def _fold(self, thread_name: str, frame) -> str:
+        parts = []
+        while frame is not None:
+            parts.append(_frame_label(frame.f_code))
+            frame = frame.f_back
+        parts.append(thread_name)
+        stack = ";".join(reversed(parts))
+        return self._stacks.setdefault(stack, stack)
+
+    def _sample(self, now: float):
+        me = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident != me:
+                self._samples.append((now, self._fold(names.get(ident, str(ident)), frame)))
+        cutoff = now - self.window
+        while self._samples and self._samples[0][0] < cutoff:
+            self._samples.popleft()
+        if len(self._stacks) > 100000:
+            self._stacks.clear()
+
+    def _write(self, start: float, end: float, path: str):
+        counts = collections.Counter(
+            stack for t, stack in self._samples if start <= t <= end
+        )
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            for stack, n in counts.most_common():
+                f.write(f"{stack} {n}\n")
+        os.replace(tmp, path)
+
+    def _run(self):
+        while not self._stop.is_set():
+            now = time.perf_counter()
+            self._sample(now)
+            while self._dumps and self._dumps[0][1] <= now:
+                start, end, path = self._dumps.popleft()
+                try:
+                    self._write(start, end, path)
+                except OSError:
+                    logger.exception("Could not write profile %s", path)
+            self._stop.wait(self.interval)
+        while self._dumps:
+            try:
+                self._write(*self._dumps.popleft())
+            except OSError:
+                pass
+
+
+def prune(directory: str, keep: int):
+    """
+    Delete all but the `keep` newest *.folded files in `directory`.
+    """
+    try:
+        names = [n for n in os.listdir(directory) if n.endswith(".folded")]
+    except FileNotFoundError:
+        return
+    paths = sorted(
+        (os.path.join(directory, n) for n in names), key=os.path.getmtime, reverse=True
+    )
+    for path in paths[keep:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class SlowRequests:
+    """
+    Profiles requests that take `slow_ms` or longer into `directory`,
+    one file per request, keeping the newest `keep`.
+    """
+
+    def __init__(self, slow_ms: float, directory: str, keep: int = 100,
+                 interval_ms: float = 5.0):
+        self.slow_ms = slow_ms
+        self.directory = directory
+        self.keep = keep
+        self.profiler = SamplingProfiler(interval=interval_ms / 1000.0)
+
+    def start(self):
+        self.profiler.start()
+
+    def stop(self):
+        self.profiler.stop()
+
+    def observe(self, method: str, path: str, route: str, t0: float, t1: float):
+        """
+        Called for every request with its route template and
+        perf_counter() start and end.
+        """
+        ms = (t1 - t0) * 1000.0
+        if ms < self.slow_ms:
+            return
+        SLOW_PROFILES.inc()
+        slug = route.strip("/").replace("/", "_").replace("{", "").replace("}", "") or "root"
+        out = os.path.join(
+            self.directory,
+            f"{time.strftime('%Y%m%d-%H%M%S')}-{SLOW_PROFILES.get():06d}-{slug}-{ms:.0f}ms.folded",
+        )
+        self.profiler.request_dump(t0, t1, out)
+        logger.info("Slow request %s %s (%.0f ms); profile -> %s", method, path, ms, out)
+        if SLOW_PROFILES.get() % 10 == 0:
+            asyncio.get_running_loop().run_in_executor(
+                None, prune, self.directory, self.keep
+            )
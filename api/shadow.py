@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+"""
+Shadow (canary) comparison of a candidate model version.
+
+A sampled share of /forecast calls is replayed against a candidate
+model version in the background (ShadowMode), after the response has
+been computed. The ShadowRecorder keeps, per country, how far the
+candidate's forecasts are from the ones clients received, plus latency
+histograms of the primary inference and of the shadow batches, so a
+retrained version can be judged on real traffic before it is
+activated.
+
+Divergence per forecast is averaged over the horizon years:
+
+    lc:  |candidate - primary| of low_carbon_share_pct (percentage points)
+    gen: |candidate - primary| / primary of electricity_generation_twh
+"""
+import asyncio
+import logging
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from admin import require_admin, verify_version
+from enforecast.feature_store import layout_key
+from metrics import Histogram, collect
+from model_service import (
+    clear_shadow,
+    load_shadow,
+    model_info,
+    shadow_feature_columns,
+    shadow_predict_batch,
+    shadow_version,
+)
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+def _latency_histogram(buckets=LATENCY_BUCKETS_MS) -> Histogram:
+    # one set per recorder, so not registered for /metrics
+    return Histogram(
+        "enforecast_shadow_latency_ms", "Shadow comparison latency.",
+        buckets=buckets, register=False,
+    )
+
+
+class _Divergence:
+    __slots__ = ("n", "lc_sum", "lc_max", "gen_sum", "gen_max")
+
+    def __init__(self):
+        self.n = 0
+        self.lc_sum = self.lc_max = 0.0
+        self.gen_sum = self.gen_max = 0.0
+
+    def add(self, lc: float, gen: float):
+        self.n += 1
+        self.lc_sum += lc
+        self.lc_max = max(self.lc_max, lc)
+        self.gen_sum += gen
+        self.gen_max = max(self.gen_max, gen)
+
+    def snapshot(self) -> dict:
+        return {
+            "n": self.n,
+            "lc_mean_abs_pp": self.lc_sum / self.n if self.n else None,
+            "lc_max_abs_pp": self.lc_max,
+            "gen_mean_rel": self.gen_sum / self.n if self.n else None,
+            "gen_max_rel": self.gen_max,
+        }
+
+
+def divergence(primary: dict, candidate: dict):
+    """
+    (lc, gen) divergence of two forecast results over their common
+    years, or None if they do not start from the same base year.
+    """
+    if primary["base_year"] != candidate["base_year"]:
+        return None
+    p, c = primary["forecasts"], candidate["forecasts"]
+    n = min(len(p), len(c))
+    if not n:
+        return None
+    lc_p = np.array([r["low_carbon_share_pct"] for r in p[:n]])
+    lc_c = np.array([r["low_carbon_share_pct"] for r in c[:n]])
+    gen_p = np.array([r["electricity_generation_twh"] for r in p[:n]])
+    gen_c = np.array([r["electricity_generation_twh"] for r in c[:n]])
+    # years where either side is NaN/inf say nothing about divergence
+    ok = np.isfinite(lc_p) & np.isfinite(lc_c) & np.isfinite(gen_p) & np.isfinite(gen_c)
+    if not ok.any():
+        return None
+    lc = float(np.mean(np.abs(lc_c[ok] - lc_p[ok])))
+    gen_rel = np.abs(gen_c[ok] - gen_p[ok]) / np.maximum(np.abs(gen_p[ok]), 1e-9)
+    return lc, float(np.mean(gen_rel))
+
+
+class ShadowRecorder:
+    """
+    Divergence and latency statistics for one (primary, candidate)
+    version pair. Updated from the event loop and the shadow thread.
+    """
+
+    def __init__(self, primary_version: str, candidate_version: str):
+        self.primary_version = primary_version
+        self.candidate_version = candidate_version
+        self._lock = threading.Lock()
+        self.countries = {}  # iso3 -> _Divergence
+        self.overall = _Divergence()
+        self.primary_ms = _latency_histogram()
+        self.shadow_batch_ms = _latency_histogram()
+        self.shadow_row_ms = _latency_histogram(
+            (0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50)
+        )
+        self.sampled = 0
+        self.compared = 0
+        self.dropped = 0  # queue full
+        self.skipped = 0  # no candidate forecast or different base year
+        self.errors = 0
+
+    def observe_primary(self, ms: float):
+        with self._lock:
+            self.sampled += 1
+            self.primary_ms.observe(ms)
+
+    def observe_batch(self, ms: float, rows: int):
+        with self._lock:
+            self.shadow_batch_ms.observe(ms)
+            if rows:
+                self.shadow_row_ms.observe(ms / rows)
+
+    def record(self, iso3: str, primary: dict, candidate: dict):
+        div = divergence(primary, candidate) if candidate is not None else None
+        with self._lock:
+            if div is None:
+                self.skipped += 1
+                return
+            self.compared += 1
+            self.overall.add(*div)
+            self.countries.setdefault(iso3, _Divergence()).add(*div)
+
+    def count(self, field: str, n: int = 1):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + n)
+
+    def snapshot(self, top: int = 20) -> dict:
+        """
+        Totals, latency histograms and the `top` countries with the
+        largest mean LC divergence (all countries with top=0).
+        """
+        with self._lock:
+            countries = {k: v.snapshot() for k, v in self.countries.items()}
+            ranked = sorted(
+                countries, key=lambda k: countries[k]["lc_mean_abs_pp"], reverse=True
+            )
+            if top:
+                ranked = ranked[:top]
+            return {
+                "primary_version": self.primary_version,
+                "candidate_version": self.candidate_version,
+                "sampled": self.sampled,
+                "compared": self.compared,
+                "skipped": self.skipped,
+                "dropped": self.dropped,
+                "errors": self.errors,
+                "divergence": self.overall.snapshot(),
+                "countries": {k: countries[k] for k in ranked},
+                "latency_ms": {
+                    "primary": self.primary_ms.snapshot(),
+                    "shadow_batch": self.shadow_batch_ms.snapshot(),
+                    "shadow_per_country": self.shadow_row_ms.snapshot(),
+                },
+            }
+
+
+class ShadowMode:
+    """
+    Queue and worker replaying sampled forecast calls against the
+    shadow candidate (model_service.load_shadow).
+
+    `fetch_histories` (async, codes -> iso3 -> history frame; None
+    without a database) supplies inputs a sampled call did not have at
+    hand. `feature_store` returns the FeatureStore being served, whose
+    states the candidate reuses when it has the same feature layout.
+    """
+
+    def __init__(self, fetch_histories=None, feature_store=lambda: None,
+                 batch_size: int = 64, queue_size: int = 1024,
+                 flush_seconds: float = 1.0):
+        self.fetch_histories = fetch_histories
+        self.feature_store = feature_store
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.recorder = None  # ShadowRecorder, None when off
+        self.sample = 0.0
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        # one thread of its own, so shadow work never takes inference workers
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shadow")
+
+    def submit(self, results: list, inputs: dict, horizon: int, primary_ms: float):
+        """
+        Queue the results of a sampled /forecast call for the shadow
+        candidate. Only a random draw and put_nowait on the request path;
+        a full queue drops the sample.
+
+        `inputs` maps iso3 -> the EngineState or history frame the result
+        was computed from (None if neither was at hand).
+        """
+        recorder = self.recorder
+        if recorder is None or not results or random.random() >= self.sample:
+            return
+        recorder.observe_primary(primary_ms)
+        for result in results:
+            try:
+                self.queue.put_nowait((result, inputs.get(result["iso3"]), horizon))
+            except asyncio.QueueFull:
+                recorder.count("dropped")
+
+    def reset(self):
+        """
+        Restart the statistics against the served version, e.g. after a
+        reload.
+        """
+        version = shadow_version()
+        if version is not None:
+            self.recorder = ShadowRecorder(model_info()["model_version"], version)
+
+    async def start(self, version: str, sample: float) -> dict:
+        info = await asyncio.to_thread(load_shadow, version)
+        self.sample = sample
+        self.reset()
+        logger.info("Shadowing %s on %.0f%% of forecast calls", version, 100 * sample)
+        return info
+
+    def stop(self):
+        self.recorder = None
+        clear_shadow()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def snapshot(self, top: int = 20) -> dict:
+        recorder = self.recorder
+        if recorder is None:
+            return {"enabled": False}
+        return {
+            "enabled": True,
+            "sample": self.sample,
+            "queued": self.queue.qsize(),
+            **recorder.snapshot(top=top),
+        }
+
+    async def _compare(self, recorder: ShadowRecorder, items: list):
+        """
+        Run the candidate on queued (result, input, horizon) items, one
+        batch per horizon, and record the divergence from each result.
+        """
+        # stored states only fit a candidate with the same feature layout
+        store = self.feature_store()
+        cols = shadow_feature_columns()
+        if cols is None:
+            return
+        same_layout = store is not None and store.key == layout_key(cols)
+
+        loop = asyncio.get_running_loop()
+        by_horizon = {}
+        for item in items:
+            by_horizon.setdefault(item[2], []).append(item)
+
+        for horizon, group in by_horizon.items():
+            states, histories, need = {}, {}, set()
+            for result, source, _ in group:
+                code = result["iso3"]
+                if result.get("model_version") != recorder.primary_version:
+                    continue  # served before a reload
+                if isinstance(source, pd.DataFrame):
+                    histories[code] = source
+                elif source is not None and same_layout:
+                    states[code] = source
+                else:
+                    need.add(code)
+            need -= set(histories) | set(states)
+            if need and self.fetch_histories is not None:
+                histories.update(await self.fetch_histories(sorted(need)))
+            if not states and not histories:
+                recorder.count("skipped", len(group))
+                continue
+
+            # collect() keeps the candidate's steps out of the served stage metrics
+            batch, _ = await loop.run_in_executor(
+                self._executor,
+                lambda: collect(shadow_predict_batch, histories, horizon, states=states),
+            )
+            by_code = {r["iso3"]: r for r in batch["results"]}
+            recorder.observe_batch(batch["seconds"] * 1000.0, len(by_code))
+            for result, _, _ in group:
+                recorder.record(result["iso3"], result, by_code.get(result["iso3"]))
+
+    async def run(self):
+        """
+        Worker task: compare queued items until cancelled.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            # collect for up to flush_seconds: fewer, larger candidate
+            # batches take less CPU away from the requests being served
+            items = [await self.queue.get()]
+            deadline = loop.time() + self.flush_seconds
+            while len(items) < self.batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            recorder = self.recorder
+            if recorder is None:
+                continue
+            try:
+                await self._compare(recorder, items)
+            except Exception:
+                logger.exception("Shadow comparison failed")
+                recorder.count("errors")
+
+
+def router(shadow: ShadowMode, default_sample: float = 0.1) -> APIRouter:
+    api = APIRouter(prefix="/admin/shadow", dependencies=[Depends(require_admin)])
+
+    @api.get("")
+    def admin_shadow(top: int = 20):
+        """
+        Divergence of the shadow candidate from the served forecasts
+        (per country, the `top` largest; top=0 for all) and latency
+        histograms.
+        """
+        return shadow.snapshot(top=top)
+
+    @api.post("")
+    async def admin_start_shadow(
+        version: str,
+        sample: float = Query(default_sample, gt=0.0, le=1.0),
+    ):
+        """
+        Shadow registry version `version` on a `sample` share of forecast
+        calls; restarts the statistics.
+        """
+        try:
+            await verify_version(version)
+            return await shadow.start(version, sample)
+        except (FileNotFoundError, ValueError) as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except RuntimeError as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    @api.delete("")
+    def admin_stop_shadow():
+        shadow.stop()
+        return {"enabled": False}
+
+    return api
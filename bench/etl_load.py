@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Timing harness for the OWID loaders in etl/load_owid_energy.py.
+
+Writes a synthetic OWID-shaped CSV (--rows country-years, ~10% missing
+values), then for each method loads it twice into a scratch schema:
+once into empty tables and once more on top (every row conflicts; for
+the incremental loader every row is unchanged).
+Finally checks that all methods left the same energy_yearly contents
+(NaN written by the row loader and NULL written by COPY count as equal).
+
+Needs a Postgres to talk to: --database-url or BENCH_DATABASE_URL. All
+tables live in the schema given by --schema, which is dropped first
+and again at the end; nothing else in the database is touched.
+
+    python bench/etl_load.py --database-url postgresql://... [--rows 100000]
+"""
+import argparse
+import itertools
+import os
+import string
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import psycopg2
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, PROJECT_ROOT)
+
+from etl import load_owid_energy as etl  # noqa: E402
+
+YEARS = range(1990, 2024)
+
+
+def write_synthetic_csv(path: str, n_rows: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    n_countries = -(-n_rows // len(YEARS))
+    codes = ["".join(p) for p in itertools.product(string.ascii_uppercase, repeat=3)]
+    codes = codes[:n_countries]
+
+    iso = np.repeat(codes, len(YEARS))[:n_rows]
+    year = np.tile(np.array(YEARS), n_countries)[:n_rows]
+    df = pd.DataFrame({
+        "country": [f"Country {c}, synthetic" for c in iso],
+        "year": year,
+        "iso_code": iso,
+        "population": rng.uniform(1e5, 1e9, n_rows).round(),
+    })
+    for col in list(etl.ENERGY_COLUMNS)[2:]:
+        values = rng.lognormal(3.0, 2.0, n_rows)
+        if col.endswith("_share_elec"):
+            values = rng.uniform(0, 100, n_rows)
+        values[rng.random(n_rows) < 0.1] = np.nan
+        df[col] = values
+    df.to_csv(path, index=False)
+
+
+def _connect(url: str, schema: str):
+    return psycopg2.connect(url, options=f"-c search_path={schema}")
+
+
+def _reset_schema(url: str, schema: str, create: bool = True):
+    conn = psycopg2.connect(url)
+    with conn, conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+        if create:
+            cur.execute(f"CREATE SCHEMA {schema}")
+            cur.execute(f"SET search_path TO {schema}")
+            with open(os.path.join(PROJECT_ROOT, "db", "schema.sql"), encoding="utf-8") as f:
+                cur.execute(f.read())
+    conn.close()
+
+
+def _snapshot(conn) -> pd.DataFrame:
+    cols = ", ".join(etl.VALUE_COLS)
+    with conn.cursor() as cur:
+        cur.execute(
+            f"""
+            SELECT c.iso3, e.year, {cols}
+            FROM energy_yearly e JOIN countries c USING (country_id)
+            ORDER BY c.iso3, e.year
+            """
+        )
+        rows = cur.fetchall()
+    df = pd.DataFrame(rows, columns=["iso3", "year"] + etl.VALUE_COLS)
+    df[etl.VALUE_COLS] = df[etl.VALUE_COLS].astype(float)
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database-url", default=os.getenv("BENCH_DATABASE_URL"))
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--schema", default="etl_bench")
+    parser.add_argument("--methods", default="rows,copy,incremental")
+    args = parser.parse_args()
+    if not args.database_url:
+        parser.error("pass --database-url or set BENCH_DATABASE_URL")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "owid-synthetic.csv")
+        write_synthetic_csv(csv_path, args.rows)
+        print(f"synthetic OWID CSV: {args.rows} rows, "
+              f"{os.path.getsize(csv_path) / 1e6:.1f} MB")
+
+        snapshots = {}
+        print(f"{'method':>12}{'empty s':>10}{'reload s':>10}{'rows':>10}")
+        try:
+            for method in args.methods.split(","):
+                _reset_schema(args.database_url, args.schema)
+                conn = _connect(args.database_url, args.schema)
+                timings = []
+                for _ in range(2):
+                    t0 = time.perf_counter()
+                    etl.run(conn, csv_path, method, features=False)
+                    timings.append(time.perf_counter() - t0)
+                snapshots[method] = _snapshot(conn)
+                conn.close()
+                print(f"{method:>12}{timings[0]:>10.2f}{timings[1]:>10.2f}"
+                      f"{len(snapshots[method]):>10}")
+        finally:
+            _reset_schema(args.database_url, args.schema, create=False)
+
+    frames = list(snapshots.values())
+    for name, other in list(snapshots.items())[1:]:
+        base = frames[0]
+        same = (
+            base[["iso3", "year"]].equals(other[["iso3", "year"]])
+            and np.allclose(base[etl.VALUE_COLS], other[etl.VALUE_COLS],
+                            rtol=0, atol=0, equal_nan=True)
+        )
+        print(f"{name} matches {next(iter(snapshots))}: {same}")
+        if not same:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
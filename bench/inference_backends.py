@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Microbenchmark of the model inference backends:
+
+    sklearn  XGBRegressor.predict on the pickled estimator
+    native   xgboost Booster.inplace_predict on the .ubj booster
+    numpy    TreeTableModel on the exported .trees.npz node table
+
+Measures cold start (fresh interpreter: import + load both models),
+single-row and batched latency on feature rows from data/ml_panel.csv,
+and checks every backend against the sklearn predictions. Exits
+non-zero if any backend differs by more than --tol.
+
+    python bench/inference_backends.py [--repeat 200] [--tol 0]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+API_DIR = os.path.join(PROJECT_ROOT, "api")
+sys.path.insert(0, API_DIR)
+
+from model_backends import NativeBoosterModel, TreeTableModel  # noqa: E402
+
+MODELS_DIR = os.path.join(API_DIR, "models")
+DATA_PATH = os.path.join(PROJECT_ROOT, "data", "ml_panel.csv")
+
+BACKENDS = {
+    # name: (artifact suffix, loader source for the cold-start child)
+    "sklearn": (".joblib", "import joblib; load = joblib.load"),
+    "native": (".ubj", "from model_backends import NativeBoosterModel as M; load = M.load"),
+    "numpy": (".trees.npz", "from model_backends import TreeTableModel as M; load = M.load"),
+}
+
+
+def _load(name, path):
+    if name == "sklearn":
+        import joblib
+
+        return joblib.load(path)
+    if name == "native":
+        return NativeBoosterModel.load(path)
+    return TreeTableModel.load(path)
+
+
+def _cold_start_ms(name):
+    suffix, loader = BACKENDS[name]
+    paths = [os.path.join(MODELS_DIR, f"xgb_{t}_model{suffix}") for t in ("lc", "gen")]
+    code = (
+        "import sys, time; t0 = time.perf_counter(); "
+        f"sys.path.insert(0, {API_DIR!r}); {loader}; "
+        f"[load(p) for p in {paths!r}]; "
+        "print((time.perf_counter() - t0) * 1000)"
+    )
+    out = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", code],
+        capture_output=True, text=True, check=True,
+    )
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def _time_ms(fn, X, repeat):
+    fn(X)  # warm-up
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(X)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--tol", type=float, default=0.0,
+                        help="max allowed |diff| vs sklearn predictions")
+    args = parser.parse_args()
+
+    with open(os.path.join(MODELS_DIR, "feature_config.json")) as f:
+        cfg = json.load(f)
+    means = np.array(cfg["scaler_mean"], dtype=float)
+    scales = np.array(cfg["scaler_scale"], dtype=float)
+
+    df = pd.read_csv(DATA_PATH)
+    X_all = df.reindex(columns=cfg["feature_cols"]).astype(float).fillna(0.0).to_numpy()
+    X_by_model = {"lc": (X_all - means) / scales, "gen": X_all}
+    sizes = [1, df["iso3"].nunique(), len(X_all)]
+
+    print("cold start (import + load LC and GEN):")
+    for name in BACKENDS:
+        print(f"  {name:>7}: {_cold_start_ms(name):8.1f} ms")
+
+    ok = True
+    for target in ("lc", "gen"):
+        X = X_by_model[target]
+        models = {
+            name: _load(name, os.path.join(MODELS_DIR, f"xgb_{target}_model{suffix}"))
+            for name, (suffix, _) in BACKENDS.items()
+        }
+        reference = models["sklearn"].predict(X)
+
+        print(f"[{target}] parity vs sklearn over {len(X)} rows:")
+        for name, model in models.items():
+            diff = float(np.abs(model.predict(X) - reference).max())
+            ok = ok and diff <= args.tol
+            print(f"  {name:>7}: max |diff| = {diff:.3g}")
+
+        print(f"[{target}] median latency (ms):")
+        print("  " + " " * 7 + "".join(f"{n:>12}" for n in BACKENDS))
+        for n in sizes:
+            X_b = np.ascontiguousarray(X[:n])
+            row = "".join(
+                f"{_time_ms(m.predict, X_b, args.repeat):12.3f}"
+                for m in models.values()
+            )
+            print(f"  {n:>5} rows{row}")
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Load test of live /forecast/{iso3} requests with N concurrent clients,
+once per INFERENCE_EXECUTOR setting ("inline" is the old behaviour of
+predicting on the event loop).
+
+Each configuration runs in a fresh interpreter. The app is driven
+in-process through httpx's ASGI transport, with no forecast table and
+the history cache disabled, so every request does a history fetch and
+a live forecast. Postgres is simulated by an asyncio.sleep of --db-ms
+per history query, serving frames from data/ml_panel.csv.
+
+Alongside the clients, a probe requests /health every 20 ms; its
+latency shows how long the event loop is blocked.
+
+    python bench/load_forecast.py [--clients 50] [--requests 10] [--db-ms 5]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+API_DIR = os.path.join(PROJECT_ROOT, "api")
+DATA_PATH = os.path.join(PROJECT_ROOT, "data", "ml_panel.csv")
+
+MODES = ["inline", "thread", "process"]
+
+
+def _percentiles(samples):
+    import numpy as np
+
+    arr = np.array(samples) * 1000.0
+    return {
+        "p50": float(np.percentile(arr, 50)),
+        "p99": float(np.percentile(arr, 99)),
+        "max": float(arr.max()),
+    }
+
+
+async def _run(args):
+    import asyncio
+    import time
+    import warnings
+
+    warnings.filterwarnings("ignore")
+    sys.path.insert(0, API_DIR)
+
+    import httpx
+    import pandas as pd
+
+    import main
+
+    panel = pd.read_csv(DATA_PATH)
+    histories = {code: g.reset_index(drop=True) for code, g in panel.groupby("iso3")}
+    codes = sorted(histories)
+
+    async def query_history(iso3):
+        await asyncio.sleep(args.db_ms / 1000.0)
+        return histories.get(iso3, pd.DataFrame())
+
+    async def no_table(force=False):
+        return None
+
+    # stand-in for Postgres; no precomputed table so every request is live
+    main.AsyncSessionLocal = object()
+    main._query_history_df = query_history
+    main.refresh_forecast_table = no_table
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app), httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+        while not main._READY:
+            if main._STARTUP_ERROR:
+                raise SystemExit(main._STARTUP_ERROR)
+            await asyncio.sleep(0.05)
+
+        latencies, probe = [], []
+        failures = 0
+        done = asyncio.Event()
+
+        async def worker(i):
+            nonlocal failures
+            for j in range(args.requests):
+                code = codes[(i * args.requests + j) % len(codes)]
+                t0 = time.perf_counter()
+                r = await client.get(f"/forecast/{code}", params={"horizon": 10})
+                latencies.append(time.perf_counter() - t0)
+                if r.status_code != 200:
+                    failures += 1
+
+        async def prober():
+            while not done.is_set():
+                t0 = time.perf_counter()
+                await client.get("/health")
+                probe.append(time.perf_counter() - t0)
+                await asyncio.sleep(0.02)
+
+        probe_task = asyncio.create_task(prober())
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(args.clients)))
+        wall = time.perf_counter() - t0
+        done.set()
+        await probe_task
+
+    return {
+        "forecast": _percentiles(latencies),
+        "health": _percentiles(probe),
+        "rps": len(latencies) / wall,
+        "failures": failures,
+    }
+
+
+def _child(args):
+    import asyncio
+
+    print(json.dumps(asyncio.run(_run(args))))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=10, help="per client")
+    parser.add_argument("--db-ms", type=float, default=5.0)
+    parser.add_argument("--workers", type=int, default=0, help="0 = CPU count")
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _child(args)
+        return
+
+    print(
+        f"{args.clients} clients x {args.requests} live /forecast requests, "
+        f"simulated DB {args.db_ms:g} ms, {os.cpu_count()} CPUs"
+    )
+    print(
+        f"{'executor':>10}{'req/s':>8}{'p50 ms':>9}{'p99 ms':>9}"
+        f"{'max ms':>9}{'/health p99':>13}{'failed':>8}"
+    )
+    for mode in args.modes.split(","):
+        env = dict(
+            os.environ,
+            INFERENCE_EXECUTOR=mode,
+            INFERENCE_WORKERS=str(args.workers),
+            HISTORY_CACHE_SIZE="0",
+            FORECAST_REFRESH_SECONDS="0",
+            HISTORY_SOURCE="db",
+            DATABASE_URL="",
+        )
+        out = subprocess.run(
+            [sys.executable, __file__, "--child",
+             "--clients", str(args.clients), "--requests", str(args.requests),
+             "--db-ms", str(args.db_ms)],
+            env=env, cwd=API_DIR, capture_output=True, text=True, check=True,
+        )
+        r = json.loads(out.stdout.strip().splitlines()[-1])
+        fc, hp = r["forecast"], r["health"]
+        print(
+            f"{mode:>10}{r['rps']:>8.1f}{fc['p50']:>9.1f}{fc['p99']:>9.1f}"
+            f"{fc['max']:>9.1f}{hp['p99']:>13.1f}{r['failures']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
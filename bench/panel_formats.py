@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Write/read time and on-disk size of the ML panel in each storage format
+supported by ml/panel_io.py:
+
+    csv       data/ml_panel.csv as before (types inferred on read)
+    parquet   single zstd Parquet file (the default panel format)
+    pq-years  Parquet dataset partitioned by year
+    feather   uncompressed Arrow IPC file
+
+"read" loads every column; "train read" loads only what
+ml/train_models.py asks for (year, targets and feature columns).
+Timings are the median of --repeat runs. The panel is data/ml_panel.csv,
+optionally tiled --scale times with shifted years to mimic a bigger one.
+
+    python bench/panel_formats.py [--repeat 5] [--scale 1]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "ml"))
+
+import panel_io  # noqa: E402
+
+FORMATS = {
+    # name: file name inside the scratch directory
+    "csv": "ml_panel.csv",
+    "parquet": "ml_panel.parquet",
+    "pq-years": "ml_panel",
+    "feather": "ml_panel.feather",
+}
+
+
+def _size(path: str) -> int:
+    if os.path.isdir(path):
+        return sum(
+            os.path.getsize(os.path.join(root, f))
+            for root, _, files in os.walk(path)
+            for f in files
+        )
+    return os.path.getsize(path)
+
+
+def _median_ms(fn, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times) * 1000.0
+
+
+def _load_panel(scale: int) -> pd.DataFrame:
+    df = pd.read_csv(os.path.join(PROJECT_ROOT, "data", "ml_panel.csv"))
+    if scale <= 1:
+        return df
+    span = int(df["year"].max() - df["year"].min() + 1)
+    copies = [df.assign(year=df["year"] - i * span) for i in range(scale)]
+    return pd.concat(copies, ignore_index=True).sort_values(
+        ["iso3", "year"], ignore_index=True
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--scale", type=int, default=1)
+    args = parser.parse_args()
+
+    df = _load_panel(args.scale)
+    train_cols = None
+    print(f"panel: {len(df)} rows x {df.shape[1]} columns")
+    print(f"{'format':>9}{'size KB':>10}{'write ms':>10}{'read ms':>10}"
+          f"{'train read ms':>15}")
+
+    tmp = tempfile.mkdtemp()
+    try:
+        for name, fname in FORMATS.items():
+            path = os.path.join(tmp, fname)
+            write_ms = _median_ms(lambda: panel_io.write_panel(df, path), args.repeat)
+            if train_cols is None:
+                meta = panel_io.write_panel(df, os.path.join(tmp, "meta.feather"))
+                train_cols = ["year"] + meta["target_cols"] + meta["feature_cols"]
+
+            read_ms = _median_ms(lambda: panel_io.read_panel(path), args.repeat)
+            train_ms = _median_ms(
+                lambda: panel_io.read_panel(path, train_cols), args.repeat
+            )
+            print(f"{name:>9}{_size(path) / 1024:>10.0f}{write_ms:>10.1f}"
+                  f"{read_ms:>10.1f}{train_ms:>15.1f}")
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+In-process SQLite stand-in for the API's Postgres, for benchmarks that
+must run without a network or a database server.
+
+seed() loads data/ml_panel.csv into an in-memory sqlite3 database with
+the countries and energy_yearly columns the API reads (db/schema.sql).
+SessionFactory is a drop-in for main.AsyncSessionLocal: its sessions
+run the same text() queries on that database, after rewriting the few
+Postgres-only constructs they use (= ANY(:list), GREATEST). An optional
+per-query delay stands in for the network round trip.
+
+Tables the API only reads opportunistically (country_features,
+forecasts) do not exist, so those paths fall back as they would on a
+fresh database.
+"""
+import asyncio
+import re
+import sqlite3
+
+import pandas as pd
+
+COUNTRY_COLS = [
+    "country_id", "iso3", "name", "region", "subregion", "income_group",
+    "population_millions", "gdp_billions_usd",
+]
+YEARLY_COLS = [
+    "country_id", "year", "electricity_generation_twh", "coal_twh", "oil_twh",
+    "gas_twh", "nuclear_twh", "hydro_twh", "solar_twh", "wind_twh",
+    "other_renewables_twh", "low_carbon_share_pct", "fossil_share_pct",
+]
+
+_ANY = re.compile(r"=\s*ANY\(:(\w+)\)")
+
+
+def seed(panel_path: str) -> sqlite3.Connection:
+    """
+    In-memory database with one countries row per iso3 (its latest
+    attributes) and every panel row in energy_yearly.
+    """
+    panel = pd.read_csv(panel_path)
+    conn = sqlite3.connect(":memory:", check_same_thread=False)
+    countries = panel.sort_values("year").groupby("iso3", sort=True).last().reset_index()
+    countries[COUNTRY_COLS].to_sql("countries", conn, index=False)
+    yearly = panel[YEARLY_COLS].copy()
+    yearly["created_at"] = "2024-01-01 00:00:00"
+    yearly["updated_at"] = "2024-01-01 00:00:00"
+    yearly.to_sql("energy_yearly", conn, index=False)
+    conn.execute("CREATE UNIQUE INDEX countries_iso3 ON countries(iso3)")
+    conn.execute(
+        "CREATE UNIQUE INDEX energy_yearly_country_year ON energy_yearly(country_id, year)"
+    )
+    conn.commit()
+    return conn
+
+
+def _translate(sql: str, params: dict):
+    params = dict(params or {})
+    for name in _ANY.findall(sql):
+        values = list(params.pop(name))
+        names = [f"{name}_{i}" for i in range(len(values))]
+        params.update(zip(names, values))
+        placeholders = ", ".join(f":{n}" for n in names) or "NULL"
+        sql = sql.replace(f"= ANY(:{name})", f"IN ({placeholders})")
+    return sql.replace("GREATEST(", "MAX("), params
+
+
+class _Result:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def fetchall(self):
+        return self._rows
+
+    all = fetchall
+
+    def one(self):
+        if len(self._rows) != 1:
+            raise ValueError(f"Expected one row, got {len(self._rows)}")
+        return self._rows[0]
+
+
+class _Session:
+    def __init__(self, factory):
+        self._factory = factory
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, clause, params=None):
+        sql, params = _translate(str(clause), params)
+        if self._factory.latency:
+            await asyncio.sleep(self._factory.latency)
+        self._factory.queries += 1
+        return _Result(self._factory.conn.execute(sql, params).fetchall())
+
+
+class SessionFactory:
+    def __init__(self, conn: sqlite3.Connection, latency_ms: float = 0.0):
+        self.conn = conn
+        self.latency = latency_ms / 1000.0
+        self.queries = 0
+
+    def __call__(self):
+        return _Session(self)
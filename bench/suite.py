@@ -0,0 +1,447 @@
+# -*- coding: utf-8 -*-
+"""
+Reproducible benchmark suite of the API and the ML pipeline, offline.
+
+Postgres is replaced by an in-memory SQLite database seeded from
+data/ml_panel.csv (bench/sqlite_db.py); the API serves the shipped
+api/models artifacts. Every benchmark runs in a fresh interpreter:
+
+    predict_single   predict_horizon_from_df, one country per call
+    predict_batch    predict_horizon_batch over every country
+    fetch_history    fetch_history_df / fetch_histories_df through the
+                     history cache, cold (query) and warm (hit)
+    forecast_api     /forecast/{iso3} throughput via httpx's ASGI
+                     transport: live (history fetch + inference per
+                     request) and from the precomputed table
+    build_dataset    build_dataset.build_panel and the country feature
+                     rows the ETL refresh writes
+    train_models     ml/train_models.py wall time on a small fixed grid
+                     (--full-train: the built-in grid), no backtest
+
+Results are written to --out as JSON. --compare BASELINE checks them
+against an earlier results file and exits 1 if any metric got worse by
+more than --threshold (relative): metrics ending in _ms or _s are
+lower-is-better, those ending in _per_s higher-is-better, and any new
+failed request counts too.
+
+    python bench/suite.py [--only predict_single,forecast_api] [--repeat 5]
+                          [--out bench/results/latest.json]
+                          [--compare bench/results/baseline.json]
+    python bench/suite.py --compare OLD.json --against NEW.json
+
+The numbers are only comparable on the same machine; keep the baseline
+next to the runner it was recorded on.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+API_DIR = os.path.join(PROJECT_ROOT, "api")
+ML_DIR = os.path.join(PROJECT_ROOT, "ml")
+DATA_PATH = os.path.join(PROJECT_ROOT, "data", "ml_panel.csv")
+RESULTS_DIR = os.path.join(PROJECT_ROOT, "bench", "results")
+sys.path.insert(0, API_DIR)
+
+HORIZON = 10
+
+# one candidate per family: stable, and minutes faster than SEARCH_GRID
+TRAIN_GRID = {
+    "ridge": [{"alpha": 1.0}],
+    "rf": [{"n_estimators": 100, "max_depth": 10, "min_samples_leaf": 5}],
+    "xgb": [{
+        "n_estimators": 300,
+        "max_depth": 3,
+        "learning_rate": 0.1,
+        "subsample": 0.8,
+        "colsample_bytree": 0.8,
+    }],
+}
+
+# the API as a benchmark sees it: shipped models, no background work
+CHILD_ENV = {
+    "MODEL_REGISTRY": os.path.join(PROJECT_ROOT, "bench", ".no-registry"),
+    "INFERENCE_EXECUTOR": "thread",
+    "HISTORY_SOURCE": "db",
+    "FEATURE_STORE": "0",
+    "FORECAST_PERSIST": "",
+    "FORECAST_REFRESH_SECONDS": "0",
+    "MODEL_WATCH_SECONDS": "0",
+    "PROFILE_SLOW_MS": "0",
+    "SHADOW_MODEL_VERSION": "",
+}
+
+
+def _stats(samples, prefix: str = "") -> dict:
+    import numpy as np
+
+    arr = np.array(samples) * 1000.0
+    return {
+        f"{prefix}median_ms": float(np.median(arr)),
+        f"{prefix}p90_ms": float(np.percentile(arr, 90)),
+    }
+
+
+def _histories() -> dict:
+    import pandas as pd
+    from enforecast.feature_store import HISTORY_COLS
+
+    panel = pd.read_csv(DATA_PATH, usecols=HISTORY_COLS)
+    return {
+        code: group[HISTORY_COLS].reset_index(drop=True)
+        for code, group in panel.groupby("iso3", sort=True)
+    }
+
+
+def _timed(fn, repeat: int) -> list:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+
+def _app():
+    """
+    main, with the SQLite stand-in as its database.
+    """
+    import logging
+
+    logging.disable(logging.WARNING)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import main
+    from sqlite_db import SessionFactory, seed
+
+    main.AsyncSessionLocal = SessionFactory(seed(DATA_PATH))
+    return main
+
+
+# ---- benchmarks (run in the child) ----
+
+def bench_predict_single(args) -> dict:
+    from model_service import predict_horizon_from_df, warm_up
+
+    histories = _histories()
+    warm_up()
+    samples = []
+    for _ in range(args.repeat):
+        for code, hist in histories.items():
+            t0 = time.perf_counter()
+            predict_horizon_from_df(code, hist, horizon=HORIZON)
+            samples.append(time.perf_counter() - t0)
+    return {"countries": len(histories), **_stats(samples)}
+
+
+def bench_predict_batch(args) -> dict:
+    from model_service import predict_horizon_batch, warm_up
+
+    histories = _histories()
+    warm_up()
+    predict_horizon_batch(histories, HORIZON)
+    samples = _timed(lambda: predict_horizon_batch(histories, HORIZON), args.repeat)
+    result = {"countries": len(histories), **_stats(samples)}
+    result["per_country_ms"] = result["median_ms"] / len(histories)
+    return result
+
+
+def bench_fetch_history(args) -> dict:
+    import asyncio
+
+    main = _app()
+    codes = sorted(_histories())
+
+    async def run():
+        cache = main.HISTORY_CACHE
+        cold, warm, batch = [], [], []
+        for _ in range(args.repeat):
+            for code in codes:
+                cache.invalidate()
+                t0 = time.perf_counter()
+                await main.fetch_history_df(code)
+                cold.append(time.perf_counter() - t0)
+                t0 = time.perf_counter()
+                await main.fetch_history_df(code)
+                warm.append(time.perf_counter() - t0)
+            cache.invalidate()
+            t0 = time.perf_counter()
+            await main.fetch_histories_df(codes)
+            batch.append(time.perf_counter() - t0)
+        return cold, warm, batch
+
+    cold, warm, batch = asyncio.run(run())
+    return {
+        **_stats(cold, "cold_"),
+        **_stats(warm, "warm_"),
+        **_stats(batch, "all_countries_"),
+    }
+
+
+def bench_forecast_api(args) -> dict:
+    import asyncio
+
+    import httpx
+
+    main = _app()
+    codes = sorted(_histories())
+    refresh_forecast_table = main.refresh_forecast_table
+
+    async def no_table(force=False):
+        return None
+
+    # startup builds no table; the live round measures fetch + inference
+    main.refresh_forecast_table = no_table
+    main.HISTORY_CACHE.maxsize = 0
+
+    async def load(client, clients: int, requests: int):
+        latencies, failures = [], 0
+
+        async def worker(i):
+            nonlocal failures
+            for j in range(requests):
+                code = codes[(i * requests + j) % len(codes)]
+                t0 = time.perf_counter()
+                r = await client.get(f"/forecast/{code}", params={"horizon": HORIZON})
+                latencies.append(time.perf_counter() - t0)
+                failures += r.status_code != 200
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(clients)))
+        wall = time.perf_counter() - t0
+        return latencies, len(latencies) / wall, failures
+
+    async def run():
+        result = {}
+        transport = httpx.ASGITransport(app=main.app)
+        async with main.app.router.lifespan_context(main.app), httpx.AsyncClient(
+            transport=transport, base_url="http://bench"
+        ) as client:
+            while not main._READY:
+                if main._STARTUP_ERROR:
+                    raise SystemExit(main._STARTUP_ERROR)
+                await asyncio.sleep(0.05)
+            await load(client, args.clients, 2)  # warm-up
+            for name in ("live", "table"):
+                if name == "table":
+                    await refresh_forecast_table(force=True)
+                latencies, rps, failures = await load(
+                    client, args.clients, args.requests * args.repeat
+                )
+                result.update(_stats(latencies, f"{name}_"))
+                result[f"{name}_requests_per_s"] = rps
+                result[f"{name}_failures"] = failures
+        return result
+
+    return {"clients": args.clients, **asyncio.run(run())}
+
+
+def bench_build_dataset(args) -> dict:
+    import pandas as pd
+
+    sys.path.insert(0, ML_DIR)
+    from build_dataset import build_panel
+    from enforecast.feature_store import HISTORY_COLS, FeatureStore, load_feature_cols
+
+    raw = pd.read_csv(DATA_PATH, usecols=HISTORY_COLS)[HISTORY_COLS]
+    cols = load_feature_cols()
+    panel = _timed(lambda: build_panel(raw.copy()), args.repeat)
+    features = _timed(lambda: FeatureStore.from_panel(raw, cols, "bench"), args.repeat)
+    return {
+        "rows": len(raw),
+        **_stats(panel, "build_panel_"),
+        **_stats(features, "country_features_"),
+    }
+
+
+def bench_train_models(args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        cmd = [
+            sys.executable, os.path.join(ML_DIR, "train_models.py"),
+            "--models-dir", os.path.join(tmp, "models"),
+            "--jobs", "1", "--no-backtest",
+        ]
+        if not args.full_train:
+            grid = os.path.join(tmp, "grid.json")
+            with open(grid, "w") as f:
+                json.dump(TRAIN_GRID, f)
+            cmd += ["--grid", grid]
+        t0 = time.perf_counter()
+        subprocess.run(cmd, cwd=PROJECT_ROOT, check=True, capture_output=True)
+        wall = time.perf_counter() - t0
+    return {"grid": "full" if args.full_train else "bench", "wall_s": wall}
+
+
+BENCHMARKS = {
+    "predict_single": bench_predict_single,
+    "predict_batch": bench_predict_batch,
+    "fetch_history": bench_fetch_history,
+    "forecast_api": bench_forecast_api,
+    "build_dataset": bench_build_dataset,
+    "train_models": bench_train_models,
+}
+
+
+# ---- runner ----
+
+def _run_child(name: str, args) -> dict:
+    cmd = [
+        sys.executable, os.path.abspath(__file__), "--child", name,
+        "--repeat", str(args.repeat),
+        "--clients", str(args.clients),
+        "--requests", str(args.requests),
+    ]
+    if args.full_train:
+        cmd.append("--full-train")
+    env = {**os.environ, **CHILD_ENV}
+    out = subprocess.run(cmd, capture_output=True, text=True, env=env)
+    if out.returncode != 0:
+        return {"error": out.stderr.strip().splitlines()[-1] if out.stderr else "failed"}
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _meta(args) -> dict:
+    import numpy as np
+    import pandas as pd
+
+    return {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "repeat": args.repeat,
+        "clients": args.clients,
+        "requests": args.requests,
+    }
+
+
+def _direction(metric: str):
+    """
+    +1 if higher is better, -1 if lower is better, None if not compared.
+    """
+    if metric.endswith("_per_s"):
+        return 1
+    if metric.endswith(("_ms", "_s")):
+        return -1
+    return None
+
+
+def compare(baseline: dict, current: dict, threshold: float,
+            min_delta_ms: float = 0.05) -> list:
+    """
+    (benchmark, metric, baseline, current, relative change, regressed)
+    for every metric both runs have; the change is signed so that
+    positive means worse. Timings that moved by less than min_delta_ms
+    are never regressions (microsecond paths are mostly noise), and
+    any new failed request is one.
+    """
+    rows = []
+    for bench, metrics in current["results"].items():
+        base = baseline["results"].get(bench, {})
+        for metric, value in metrics.items():
+            old = base.get(metric)
+            if not isinstance(old, (int, float)):
+                continue
+            if metric.endswith("_failures"):
+                rows.append((bench, metric, old, value, 0.0, value > old))
+                continue
+            direction = _direction(metric)
+            if direction is None or not old:
+                continue
+            worse = -direction * (value - old) / abs(old)
+            delta_ms = abs(value - old) * (1000.0 if metric.endswith("_s") else 1.0)
+            regressed = worse > threshold and (
+                direction > 0 or delta_ms >= min_delta_ms
+            )
+            rows.append((bench, metric, old, value, worse, regressed))
+    return rows
+
+
+def _print_comparison(rows, threshold: float):
+    print(f"{'benchmark':<16} {'metric':<28} {'baseline':>12} {'current':>12} {'change':>8}")
+    for bench, metric, old, new, worse, regressed in rows:
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{bench:<16} {metric:<28} {old:>12.4g} {new:>12.4g} {worse:>+8.1%}{flag}")
+    n = sum(r[5] for r in rows)
+    print(f"{n} of {len(rows)} metrics regressed by more than {threshold:.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--only", help="comma-separated benchmarks "
+                                       f"(default: all of {','.join(BENCHMARKS)})")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--clients", type=int, default=20,
+                        help="concurrent clients for forecast_api")
+    parser.add_argument("--requests", type=int, default=10,
+                        help="requests per client per repeat for forecast_api")
+    parser.add_argument("--full-train", action="store_true",
+                        help="train_models on the built-in SEARCH_GRID")
+    parser.add_argument("--out", default=os.path.join(RESULTS_DIR, "latest.json"))
+    parser.add_argument("--compare", metavar="BASELINE",
+                        help="results file to check for regressions against")
+    parser.add_argument("--against", metavar="RESULTS",
+                        help="with --compare: compare this file instead of running")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="relative slowdown that counts as a regression")
+    parser.add_argument("--min-delta-ms", type=float, default=0.05,
+                        help="smaller timing changes never count as regressions")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(BENCHMARKS[args.child](args)))
+        return
+
+    if args.against:
+        if not args.compare:
+            parser.error("--against needs --compare")
+        with open(args.against) as f:
+            current = json.load(f)
+    else:
+        names = [n for n in (args.only or ",".join(BENCHMARKS)).split(",") if n]
+        unknown = set(names) - set(BENCHMARKS)
+        if unknown:
+            parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+        current = {"meta": _meta(args), "results": {}}
+        for name in names:
+            t0 = time.perf_counter()
+            result = _run_child(name, args)
+            current["results"][name] = result
+            status = result.get("error") or f"{time.perf_counter() - t0:.1f} s"
+            print(f"{name:<16} {status}")
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(current, f, indent=2)
+        print(f"Results written to {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows = compare(baseline, current, args.threshold, args.min_delta_ms)
+        _print_comparison(rows, args.threshold)
+        failed = any(r[5] for r in rows) or any(
+            "error" in r for r in current["results"].values()
+        )
+        sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
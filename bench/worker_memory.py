@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Per-worker memory cost of the loaded models, as uvicorn --workers N sees it.
+
+Starts N fresh processes per configuration. Each loads the models
+through model_service, runs a one-row prediction and reads every model
+array so all of its pages are resident (a large batch prediction is
+avoided on purpose: its temporaries would dominate the numbers). Once
+all N are loaded, each reads /proc/self/smaps_rollup. Reported numbers
+are the increase caused by loading the models (median across workers):
+
+    RSS      resident pages, shared ones counted in full in every worker
+    PSS      proportional share: shared pages divided by the sharers
+    private  pages no other worker can share
+
+Memory-mapped node tables show up as shared file pages, so PSS and
+private memory per worker shrink as N grows. Copies made by joblib or
+np.load stay private to each worker. Linux only.
+
+    python bench/worker_memory.py [--workers 4]
+"""
+import argparse
+import multiprocessing as mp
+import os
+import statistics
+import sys
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+API_DIR = os.path.join(PROJECT_ROOT, "api")
+
+CONFIGS = {
+    # label: environment for model_service
+    "numpy + mmap": {"MODEL_BACKEND": "numpy", "MODEL_MMAP": "1"},
+    "numpy, no mmap": {"MODEL_BACKEND": "numpy", "MODEL_MMAP": "0"},
+    "sklearn (joblib)": {"MODEL_BACKEND": "sklearn"},
+}
+
+
+def _smaps_kb():
+    fields = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    return {
+        "rss": fields["Rss"],
+        "pss": fields["Pss"],
+        "private": fields["Private_Clean"] + fields["Private_Dirty"],
+    }
+
+
+def _worker(env, barrier, queue):
+    import warnings
+
+    warnings.filterwarnings("ignore")
+    os.environ.update(env)
+    sys.path.insert(0, API_DIR)
+
+    import numpy as np
+    import pandas as pd
+
+    import model_service
+
+    df = pd.read_csv(os.path.join(PROJECT_ROOT, "data", "ml_panel.csv"))
+    before = _smaps_kb()
+
+    cfg, lc_model, gen_model, feature_cols = model_service._load_models()
+    X = df.reindex(columns=feature_cols).astype(float).fillna(0.0).to_numpy()[:1]
+    lc_model.predict(X)
+    gen_model.predict(X)
+    for model in (lc_model, gen_model):
+        # fault in every page of the node tables, not just visited nodes
+        for value in vars(model).values():
+            if isinstance(value, np.ndarray) and value.size:
+                value.sum()
+
+    barrier.wait()  # every worker has its models resident
+    after = _smaps_kb()
+    barrier.wait()  # keep pages mapped until all workers have measured
+    queue.put({k: after[k] - before[k] for k in after})
+
+
+def measure(env, n_workers):
+    ctx = mp.get_context("spawn")
+    barrier = ctx.Barrier(n_workers)
+    queue = ctx.Queue()
+    procs = [
+        ctx.Process(target=_worker, args=(env, barrier, queue))
+        for _ in range(n_workers)
+    ]
+    for p in procs:
+        p.start()
+    results = [queue.get() for _ in procs]
+    for p in procs:
+        p.join()
+    return {k: statistics.median(r[k] for r in results) for k in results[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    print(f"model memory per worker with {args.workers} workers (kB, median)")
+    print(f"{'':>18}{'RSS':>10}{'PSS':>10}{'private':>10}")
+    for label, env in CONFIGS.items():
+        r = measure(env, args.workers)
+        print(f"{label:>18}{r['rss']:>10.0f}{r['pss']:>10.0f}{r['private']:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
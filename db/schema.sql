@@ -56,9 +56,66 @@ CREATE TABLE IF NOT EXISTS energy_yearly (
     UNIQUE (country_id, year)
 );
 
+-- Set when the incremental ETL revises a row (see fetch_data_version)
+ALTER TABLE energy_yearly
+    ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT NOW();
+
+-- Digest of each OWID (iso3, year) row as last loaded by
+-- etl/load_owid_energy.py --method incremental
+CREATE TABLE IF NOT EXISTS energy_yearly_hashes (
+    iso3 CHAR(3) NOT NULL,
+    year INT NOT NULL,
+    row_hash CHAR(32) NOT NULL,
+    updated_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (iso3, year)
+);
+
 CREATE INDEX IF NOT EXISTS idx_energy_yearly_country_year
     ON energy_yearly(country_id, year);
 CREATE INDEX IF NOT EXISTS idx_energy_date
     ON energy_generation(date DESC);
 CREATE INDEX IF NOT EXISTS idx_energy_country
     ON energy_generation(country_id);
+
+-- Precomputed forecasts served by the API (FORECAST_PERSIST=postgres).
+-- Rows are keyed by the model artifact hash and energy_yearly version
+-- they were computed from, so stale rows are never served and tables of
+-- several model versions (workers mid hot-swap) live side by side.
+CREATE TABLE IF NOT EXISTS forecasts (
+    iso3 CHAR(3) NOT NULL,
+    year INT NOT NULL,
+    base_year INT NOT NULL,
+    low_carbon_share_pct DOUBLE PRECISION,
+    electricity_generation_twh DOUBLE PRECISION,
+    artifact_hash VARCHAR(64) NOT NULL,
+    data_version VARCHAR(100) NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (artifact_hash, data_version, iso3, year)
+);
+
+-- Tables created with the earlier (iso3, year) key
+DO $$
+BEGIN
+    IF (SELECT count(*) FROM information_schema.key_column_usage
+        WHERE table_name = 'forecasts' AND constraint_name = 'forecasts_pkey') = 2 THEN
+        ALTER TABLE forecasts
+            DROP CONSTRAINT forecasts_pkey,
+            ADD PRIMARY KEY (artifact_hash, data_version, iso3, year);
+    END IF;
+END $$;
+
+-- Latest forecast input of every country (api/enforecast/feature_store.py), rebuilt
+-- by etl/load_owid_energy.py and ml/build_dataset.py. Vectors follow the
+-- column layout hashed in layout_key and were built from the
+-- energy_yearly fingerprint in data_version; lags is N_LAGS x LAG_COLS
+-- row-major, oldest year first.
+CREATE TABLE IF NOT EXISTS country_features (
+    iso3 CHAR(3) PRIMARY KEY,
+    base_year INT NOT NULL,
+    features DOUBLE PRECISION[] NOT NULL,
+    state DOUBLE PRECISION[] NOT NULL,
+    lags DOUBLE PRECISION[] NOT NULL,
+    layout_key CHAR(32) NOT NULL,
+    data_version VARCHAR(100) NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW()
+);
@@ -1,32 +1,166 @@
 # -*- coding: utf-8 -*-
+"""
+Load OWID energy data into countries and energy_yearly.
+
+    python -m etl.load_owid_energy [--csv data/owid-energy-data.csv]
+                                   [--method copy|incremental|rows]
+                                   [--summary changes.json]
+                                   [--save-parquet data/owid-energy.parquet]
+                                   [--skip-features]
+
+Run it from the repository root: it imports the feature code the API
+serves with from the api.enforecast package.
+
+The CSV is read in chunks, only the columns the loaders use, keeping
+country rows from 1990 on. --save-parquet stores that pruned input, and
+a .parquet path given as --csv is read instead of parsing the CSV.
+
+--method copy (default) streams the prepared frames into temporary
+staging tables with COPY FROM STDIN and merges them with one
+INSERT ... SELECT ... ON CONFLICT per table, all in a single transaction.
+--method incremental sends only (iso3, year) rows that are new or were
+revised since the last run, as real upserts, and prints how many rows
+were inserted, updated and unchanged (--summary also writes it, with
+the changed iso3 codes, to a JSON file). Row digests are kept in
+energy_yearly_hashes.
+--method rows is the original row-by-row loader, kept for comparison
+(bench/etl_load.py times it against the others).
+
+After loading, the country_features table (latest forecast input per
+country, see api/enforecast/feature_store.py) is rebuilt unless
+--skip-features.
+"""
+import argparse
+import hashlib
+import io
+import json
 import os
+import numpy as np
 import psycopg2
 import pandas as pd
 from dotenv import load_dotenv
 
+# country_features is built with the API's feature code
+from api.enforecast.feature_store import refresh_country_features
+
 load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL")
 CSV_PATH = "data/owid-energy-data.csv"
 
-def main():
-    conn = psycopg2.connect(DATABASE_URL)
-    cur = conn.cursor()
+# OWID column -> energy_yearly column
+ENERGY_COLUMNS = {
+    "iso_code": "iso3",
+    "year": "year",
+    "primary_energy_consumption": "total_energy_ej",
+    "electricity_generation": "electricity_generation_twh",
+    "coal_electricity": "coal_twh",
+    "oil_electricity": "oil_twh",
+    "gas_electricity": "gas_twh",
+    "nuclear_electricity": "nuclear_twh",
+    "hydro_electricity": "hydro_twh",
+    "solar_electricity": "solar_twh",
+    "wind_electricity": "wind_twh",
+    "other_renewable_electricity": "other_renewables_twh",
+    "low_carbon_share_elec": "low_carbon_share_pct",
+    "fossil_share_elec": "fossil_share_pct",
+}
+VALUE_COLS = list(ENERGY_COLUMNS.values())[2:]
+# decimal places of the energy_yearly columns (DECIMAL(p, s)); default 3
+VALUE_SCALE = {
+    "total_energy_ej": 4,
+    "low_carbon_share_pct": 2,
+    "fossil_share_pct": 2,
+}
+
+
+# OWID columns the loaders use; everything else in the file is skipped
+OWID_COLS = ["country", "population"] + list(ENERGY_COLUMNS)
+OWID_DTYPES = {
+    "iso_code": str,
+    "country": str,
+    "year": "int16",
+}
+# stored as categoricals once filtered (one code per row instead of a
+# Python string)
+CATEGORY_COLS = ["iso_code", "country"]
+# rows per CSV chunk; only the filtered part of each chunk is kept
+CHUNK_ROWS = 20_000
 
-    df = pd.read_csv(CSV_PATH)
 
+def _filter_owid(df: pd.DataFrame) -> pd.DataFrame:
     # Only real countries and recent years
-    df = df[df["iso_code"].str.len() == 3].copy()
-    df = df[df["year"] >= 1990]
+    return df[(df["iso_code"].str.len() == 3) & (df["year"] >= 1990)]
+
+
+def read_owid(path: str, chunksize: int = CHUNK_ROWS) -> pd.DataFrame:
+    """
+    Read the columns in OWID_COLS from the OWID energy CSV, chunk by
+    chunk, keeping only country rows from 1990 on. Peak memory is one
+    chunk plus the filtered result, whatever the size of the file.
 
-    # ---- countries from OWID ----
-    countries_dim = (
-        df.groupby(["iso_code", "country"])
+    A .parquet path (see --save-parquet) is read directly instead,
+    skipping CSV parsing.
+    """
+    if path.endswith(".parquet"):
+        df = pd.read_parquet(path)
+        df = df[[c for c in OWID_COLS if c in df.columns]]
+        return _filter_owid(df).reset_index(drop=True)
+
+    header = pd.read_csv(path, nrows=0).columns
+    usecols = [c for c in OWID_COLS if c in header]
+    # values stay float64: float32 keeps ~7 significant digits, which
+    # would round large TWh figures below the 3 decimals stored in
+    # energy_yearly (and show up as revisions to the incremental loader)
+    dtypes = {c: OWID_DTYPES.get(c, "float64") for c in usecols}
+
+    chunks = [
+        _filter_owid(chunk)
+        for chunk in pd.read_csv(
+            path, usecols=usecols, dtype=dtypes, chunksize=chunksize
+        )
+    ]
+    df = pd.concat(chunks, ignore_index=True)[usecols]
+    for col in CATEGORY_COLS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    return df
+
+
+def build_countries(df: pd.DataFrame) -> pd.DataFrame:
+    return (
+        df.groupby(["iso_code", "country"], observed=True)
           .agg(population_millions=("population",
                                     lambda x: x.dropna().iloc[-1] / 1e6
                                     if x.dropna().size else None))
           .reset_index()
     )
 
+
+def build_energy(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    iso3, year and the energy_yearly value columns, numeric, one row
+    per OWID country-year.
+    """
+    requested_cols = list(ENERGY_COLUMNS)
+    available_cols = [c for c in requested_cols if c in df.columns]
+    edf = df[available_cols].copy()
+    for col in requested_cols:
+        if col not in edf.columns:
+            edf[col] = pd.NA
+
+    edf = edf[requested_cols].rename(columns=ENERGY_COLUMNS)
+    num_cols = [c for c in edf.columns if c != "iso3"]
+    edf[num_cols] = edf[num_cols].apply(pd.to_numeric, errors="coerce")
+    return edf
+
+
+# ---------------------------------------------------------------------------
+# Row-by-row loader (original)
+# ---------------------------------------------------------------------------
+
+def load_rows(conn, countries_dim: pd.DataFrame, edf: pd.DataFrame):
+    cur = conn.cursor()
+
     for _, row in countries_dim.iterrows():
         cur.execute(
             """
@@ -48,51 +182,11 @@ def main():
         "SELECT country_id, iso3 FROM countries", conn
     ).set_index("iso3")["country_id"]
 
-    # ---- yearly energy fact ----
-    requested_cols = [
-        "iso_code", "year",
-        "primary_energy_consumption",
-        "electricity_generation",
-        "coal_electricity", "oil_electricity", "gas_electricity",
-        "nuclear_electricity", "hydro_electricity",
-        "solar_electricity", "wind_electricity",
-        "other_renewable_electricity",
-        "low_carbon_share_elec",
-        "fossil_share_elec",
-    ]
-
-    available_cols = [c for c in requested_cols if c in df.columns]
-    edf = df[available_cols].copy()
-    for col in requested_cols:
-        if col not in edf.columns:
-            edf[col] = pd.NA
-
-    edf.rename(
-        columns={
-            "iso_code": "iso3",
-            "primary_energy_consumption": "total_energy_ej",
-            "electricity_generation": "electricity_generation_twh",
-            "coal_electricity": "coal_twh",
-            "oil_electricity": "oil_twh",
-            "gas_electricity": "gas_twh",
-            "nuclear_electricity": "nuclear_twh",
-            "hydro_electricity": "hydro_twh",
-            "solar_electricity": "solar_twh",
-            "wind_electricity": "wind_twh",
-            "other_renewable_electricity": "other_renewables_twh",
-            "low_carbon_share_elec": "low_carbon_share_pct",
-            "fossil_share_elec": "fossil_share_pct",
-        },
-        inplace=True,
-    )
-
+    edf = edf.copy()
     edf["country_id"] = edf["iso3"].map(cid_map)
     edf = edf.dropna(subset=["country_id"])
     edf["country_id"] = edf["country_id"].astype(int)
 
-    num_cols = [c for c in edf.columns if c not in ("iso3")]
-    edf[num_cols] = edf[num_cols].apply(pd.to_numeric, errors="coerce")
-
     tuples = [
         (
             int(row["country_id"]),
@@ -128,15 +222,244 @@ def main():
         cur.executemany(insert_sql, chunk)
         conn.commit()
 
-    cur.execute("SELECT COUNT(DISTINCT country_id) FROM energy_yearly")
-    c_count = cur.fetchone()[0]
-    cur.execute("SELECT MIN(year), MAX(year) FROM energy_yearly")
-    y_min, y_max = cur.fetchone()
+    cur.close()
+
+
+# ---------------------------------------------------------------------------
+# COPY-based bulk loader
+# ---------------------------------------------------------------------------
+
+def _copy_frame(cur, table: str, df: pd.DataFrame):
+    """
+    Stream a frame into `table` with COPY FROM STDIN (CSV). Empty
+    fields, i.e. NaN/None, arrive as NULL.
+    """
+    buf = io.StringIO()
+    df.to_csv(buf, index=False, header=False)
+    buf.seek(0)
+    cols = ", ".join(df.columns)
+    cur.copy_expert(f"COPY {table} ({cols}) FROM STDIN WITH (FORMAT csv)", buf)
+
+
+def _merge_countries(cur, countries_dim: pd.DataFrame):
+    # one row per iso3: a single ON CONFLICT DO UPDATE statement cannot
+    # touch the same country twice (load_rows lets the last one win)
+    countries = (
+        countries_dim.rename(columns={"iso_code": "iso3", "country": "name"})
+        .drop_duplicates("iso3", keep="last")
+        [["iso3", "name", "population_millions"]]
+    )
+    cur.execute(
+        """
+        CREATE TEMP TABLE countries_stage (
+            iso3 CHAR(3),
+            name VARCHAR(100),
+            population_millions NUMERIC
+        ) ON COMMIT DROP
+        """
+    )
+    _copy_frame(cur, "countries_stage", countries)
+    cur.execute(
+        """
+        INSERT INTO countries (iso3, name, population_millions)
+        SELECT iso3, name, population_millions FROM countries_stage
+        ON CONFLICT (iso3) DO UPDATE
+        SET name = EXCLUDED.name,
+            population_millions =
+                COALESCE(EXCLUDED.population_millions,
+                         countries.population_millions)
+        """
+    )
+
+
+def _create_energy_stage(cur, extra_cols: str = ""):
+    # staging values stay NUMERIC so the text from COPY is parsed
+    # exactly as the row loader's literals would be
+    value_defs = ",\n".join(f"{c} NUMERIC" for c in VALUE_COLS)
+    cur.execute(
+        f"""
+        CREATE TEMP TABLE energy_yearly_stage (
+            iso3 CHAR(3),
+            year INT,
+            {value_defs}{extra_cols}
+        ) ON COMMIT DROP
+        """
+    )
+
+
+def load_copy(conn, countries_dim: pd.DataFrame, edf: pd.DataFrame):
+    """
+    Same result as load_rows, except that missing values are stored as
+    NULL (load_rows passes pandas NaN through as numeric 'NaN').
+    """
+    with conn, conn.cursor() as cur:
+        _merge_countries(cur, countries_dim)
+        _create_energy_stage(cur)
+        _copy_frame(cur, "energy_yearly_stage", edf[list(ENERGY_COLUMNS.values())])
+
+        value_list = ", ".join(VALUE_COLS)
+        cur.execute(
+            f"""
+            INSERT INTO energy_yearly (country_id, year, {value_list})
+            SELECT c.country_id, s.year, {", ".join("s." + v for v in VALUE_COLS)}
+            FROM energy_yearly_stage s
+            JOIN countries c ON c.iso3 = s.iso3
+            ON CONFLICT (country_id, year) DO NOTHING
+            """
+        )
+
+
+# ---------------------------------------------------------------------------
+# Incremental loader
+# ---------------------------------------------------------------------------
+
+def row_digests(edf: pd.DataFrame) -> list:
+    """
+    MD5 digest of each row's values rounded to the scale of their
+    energy_yearly column, in frame order. Differences that the NUMERIC
+    columns would round away (e.g. float parsing noise) do not count as
+    a change.
+    """
+    scaled = np.empty((len(edf), len(VALUE_COLS)), dtype=np.int64)
+    for j, col in enumerate(VALUE_COLS):
+        values = edf[col].to_numpy(dtype=float, na_value=np.nan)
+        rounded = np.round(values * 10.0 ** VALUE_SCALE.get(col, 3))
+        missing = np.isnan(rounded)
+        scaled[:, j] = np.where(missing, np.iinfo(np.int64).min, np.nan_to_num(rounded))
+    return [hashlib.md5(row.tobytes()).hexdigest() for row in scaled]
+
+
+def load_incremental(conn, countries_dim: pd.DataFrame, edf: pd.DataFrame) -> dict:
+    """
+    Send only rows whose digest differs from energy_yearly_hashes (new
+    or revised in OWID) and upsert them, so revisions are applied.
+    Returns counts of inserted/updated/unchanged rows and the iso3 codes
+    of countries whose rows changed.
+
+    The digests mirror what this loader wrote; after loading with
+    another method, run once with --method incremental to resync them.
+    """
+    edf = edf.drop_duplicates(["iso3", "year"], keep="last")
+    digests = row_digests(edf)
+
+    with conn, conn.cursor() as cur:
+        cur.execute("SELECT iso3, year, row_hash FROM energy_yearly_hashes")
+        known = {(iso3, year): h for iso3, year, h in cur.fetchall()}
+
+        changed = [
+            i for i, key in enumerate(zip(edf["iso3"], edf["year"]))
+            if known.get(key) != digests[i]
+        ]
+        summary = {
+            "inserted": 0,
+            "updated": 0,
+            "unchanged": len(edf) - len(changed),
+            "countries": sorted({edf["iso3"].iat[i] for i in changed}),
+        }
+
+        _merge_countries(cur, countries_dim)
+        if not changed:
+            return summary
+
+        _create_energy_stage(cur, ",\nrow_hash CHAR(32)")
+        stage = edf[list(ENERGY_COLUMNS.values())].iloc[changed].assign(
+            row_hash=[digests[i] for i in changed]
+        )
+        _copy_frame(cur, "energy_yearly_stage", stage)
+
+        value_list = ", ".join(VALUE_COLS)
+        cur.execute(
+            f"""
+            INSERT INTO energy_yearly (country_id, year, {value_list})
+            SELECT c.country_id, s.year, {", ".join("s." + v for v in VALUE_COLS)}
+            FROM energy_yearly_stage s
+            JOIN countries c ON c.iso3 = s.iso3
+            ON CONFLICT (country_id, year) DO UPDATE
+            SET {", ".join(f"{v} = EXCLUDED.{v}" for v in VALUE_COLS)},
+                updated_at = NOW()
+            RETURNING (xmax = 0) AS inserted
+            """
+        )
+        flags = [row[0] for row in cur.fetchall()]
+        summary["inserted"] = sum(flags)
+        summary["updated"] = len(flags) - summary["inserted"]
+
+        cur.execute(
+            """
+            INSERT INTO energy_yearly_hashes (iso3, year, row_hash)
+            SELECT iso3, year, row_hash FROM energy_yearly_stage
+            ON CONFLICT (iso3, year) DO UPDATE
+            SET row_hash = EXCLUDED.row_hash,
+                updated_at = NOW()
+            """
+        )
+    return summary
+
+
+def report(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT COUNT(DISTINCT country_id) FROM energy_yearly")
+        c_count = cur.fetchone()[0]
+        cur.execute("SELECT MIN(year), MAX(year) FROM energy_yearly")
+        y_min, y_max = cur.fetchone()
 
     print(f"energy_yearly: {c_count} countries, years {y_min}-{y_max}")
 
-    cur.close()
-    conn.close()
+
+LOADERS = {"copy": load_copy, "rows": load_rows, "incremental": load_incremental}
+
+
+def run(conn, csv_path: str = CSV_PATH, method: str = "copy",
+        save_parquet: str = None, features: bool = True):
+    """
+    Load the CSV (or Parquet file) with the given method, optionally
+    saving the pruned, filtered input as Parquet for later runs, then
+    rebuild country_features. Returns the loader's summary (incremental
+    only, otherwise None).
+    """
+    df = read_owid(csv_path)
+    if save_parquet:
+        df.to_parquet(save_parquet, index=False)
+    summary = LOADERS[method](conn, build_countries(df), build_energy(df))
+    if features:
+        refresh_country_features(conn)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv", default=CSV_PATH)
+    parser.add_argument("--method", choices=sorted(LOADERS), default="copy")
+    parser.add_argument(
+        "--summary", help="write the incremental summary as JSON to this path"
+    )
+    parser.add_argument(
+        "--save-parquet",
+        help="also save the pruned input here; pass it as --csv next time "
+             "to skip CSV parsing (needs pyarrow)",
+    )
+    parser.add_argument(
+        "--skip-features", action="store_true",
+        help="do not rebuild country_features after loading",
+    )
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(DATABASE_URL)
+    try:
+        summary = run(conn, args.csv, args.method, args.save_parquet,
+                      features=not args.skip_features)
+        if summary is not None:
+            print(
+                f"rows: {summary['inserted']} inserted, {summary['updated']} "
+                f"updated, {summary['unchanged']} unchanged; "
+                f"{len(summary['countries'])} countries changed"
+            )
+            if args.summary:
+                with open(args.summary, "w") as f:
+                    json.dump(summary, f, indent=2)
+        report(conn)
+    finally:
+        conn.close()
 
 if __name__ == "__main__":
     main()
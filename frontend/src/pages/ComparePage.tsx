@@ -28,6 +28,12 @@ interface ForecastResponse {
   forecasts: Forecast[];
 }
 
+interface BatchForecastResponse {
+  horizon: number;
+  results: ForecastResponse[];
+  errors: Record<string, string>;
+}
+
 interface Props {
   goHome: () => void;
 }
@@ -87,10 +93,28 @@ const ComparePage: React.FC<Props> = ({ goHome }) => {
     fetchCountries();
   }, [fetchCountries]);
 
+  const fetchInitialForecasts = useCallback(async () => {
+    setLoading(true);
+    try {
+      const res = await axios.get<BatchForecastResponse>(
+        `${API_BASE}/forecast?iso3=IND,USA&horizon=10`
+      );
+      const byCode = (code: string) =>
+        res.data.results.find((r) => r.iso3 === code) || null;
+      setForecastA(byCode("IND"));
+      setForecastB(byCode("USA"));
+    } catch (e) {
+      console.error("forecast failed", e);
+      setForecastA(null);
+      setForecastB(null);
+    } finally {
+      setLoading(false);
+    }
+  }, []);
+
   useEffect(() => {
-    fetchForecast("IND", setForecastA);
-    fetchForecast("USA", setForecastB);
-  }, [fetchForecast]);
+    fetchInitialForecasts();
+  }, [fetchInitialForecasts]);
 
   const filteredA = countries.filter((c) =>
     c.name.toLowerCase().includes(searchA.toLowerCase())
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+Walk-forward backtest of the recursive forecasts the API serves.
+
+For every origin year and every country with a usable feature row in
+that year, replays the forecast the API would have returned with data
+up to the origin (predict_horizon_from_df on the history cut there) for
+horizons 1..--horizon, and compares it with what actually happened.
+All (country, origin) pairs are stacked into one matrix, so each step
+is a single LC and GEN model call over the whole grid.
+
+For each horizon it reports how many pairs have an actual value and
+the MAE/RMSE of low_carbon_share_pct (percentage points) and
+electricity_generation_twh (TWh). The result is stored under
+"backtest" in the models directory's metrics.json, which the API
+serves at /model-metrics. train_models.py runs it after training.
+
+Origins default to train_year_max of the models onwards, so forecast
+years never overlap the training data.
+
+It also writes residuals.npz next to the models: the one-step
+(delta_lc, delta_log_gen) errors for target years in the validation
+period, which the API resamples for ?intervals= prediction bands.
+
+    python ml/backtest.py [--models-dir models] [--panel data/ml_panel.parquet]
+                          [--database-url postgresql://...]
+                          [--origin-min 2015] [--horizon 10] [--dry-run]
+
+With --database-url the full histories are read from the database
+instead of the panel file (which starts at 2000, so its first years
+only feed the lags).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from panel_io import PANEL_CSV, PANEL_PATH, read_panel
+
+# replay through the API's own feature and forecast code
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+from enforecast.feature_store import HISTORY_COLS, HISTORY_SELECT, prepare_panel, state_arrays  # noqa: E402
+from enforecast.features import LOG_EPS  # noqa: E402
+from forecast_store import MAX_HORIZON  # noqa: E402
+from model_service import RESIDUALS_FILE, load_engine  # noqa: E402
+
+MODELS_DIR = "models"
+DATA_PATH = PANEL_PATH if os.path.exists(PANEL_PATH) else PANEL_CSV
+
+LEVEL_COLS = {"lc": "low_carbon_share_pct", "gen": "electricity_generation_twh"}
+
+
+def load_history(panel_path: str = DATA_PATH, database_url: str = None) -> pd.DataFrame:
+    """
+    History rows (HISTORY_COLS) from the database or the ML panel.
+    """
+    if database_url:
+        import psycopg2
+
+        conn = psycopg2.connect(database_url)
+        try:
+            with conn.cursor() as cur:
+                cur.execute(HISTORY_SELECT + "ORDER BY c.iso3, e.year;")
+                return pd.DataFrame(cur.fetchall(), columns=HISTORY_COLS)
+        finally:
+            conn.close()
+    return read_panel(panel_path, HISTORY_COLS)
+
+
+def _errors(pred: np.ndarray, actual: np.ndarray) -> dict:
+    ok = ~(np.isnan(pred) | np.isnan(actual))
+    err = pred[ok] - actual[ok]
+    if not len(err):
+        return {"n": 0, "mae": None, "rmse": None}
+    return {
+        "n": int(len(err)),
+        "mae": float(np.mean(np.abs(err))),
+        "rmse": float(np.sqrt(np.mean(err ** 2))),
+    }
+
+
+def _actuals(panel: pd.DataFrame) -> pd.DataFrame:
+    # LEVEL_COLS indexed by (iso3, year)
+    return (
+        panel.assign(iso3=panel["iso3"].astype(str).str.strip())
+        .set_index(["iso3", "year"])[list(LEVEL_COLS.values())]
+        .astype(float)
+    )
+
+
+def one_step_residuals(engine, panel: pd.DataFrame, origin_min: int,
+                       origin_max: int) -> np.ndarray:
+    """
+    (m, 2) array of actual minus predicted (delta_lc, delta_log_gen)
+    for one-step forecasts from origins origin_min..origin_max, one row
+    per (country, origin) where both next-year values are known.
+    """
+    hist = prepare_panel(panel)
+    years = hist["year"].to_numpy()
+    rows = np.flatnonzero((years >= origin_min) & (years <= origin_max))
+    if not len(rows):
+        return np.empty((0, 2))
+
+    features, current, past = state_arrays(hist, rows, engine.feature_cols)
+    lc, gen = engine.run_arrays(features, current, past, 1)
+
+    keys = pd.MultiIndex.from_arrays([hist["iso3"].to_numpy()[rows], years[rows] + 1])
+    values = _actuals(panel).reindex(keys)
+    actual_lc = values[LEVEL_COLS["lc"]].to_numpy()
+    actual_gen = values[LEVEL_COLS["gen"]].to_numpy()
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        res = np.column_stack([
+            actual_lc - lc[:, 0],
+            np.log(np.maximum(actual_gen, LOG_EPS)) - np.log(np.maximum(gen[:, 0], LOG_EPS)),
+        ])
+    return res[np.isfinite(res).all(axis=1)]
+
+
+def backtest(engine, panel: pd.DataFrame, origin_min: int,
+             origin_max: int = None, horizon: int = MAX_HORIZON) -> dict:
+    """
+    Horizon-wise errors of `engine` over every (country, origin) pair
+    with origin_min <= origin <= origin_max (default: last year - 1).
+    """
+    t0 = time.perf_counter()
+    hist = prepare_panel(panel)
+    years = hist["year"].to_numpy()
+    if origin_max is None:
+        origin_max = int(panel["year"].max()) - 1
+    rows = np.flatnonzero((years >= origin_min) & (years <= origin_max))
+    if not len(rows):
+        raise ValueError(f"No usable rows between {origin_min} and {origin_max}")
+
+    features, current, past = state_arrays(hist, rows, engine.feature_cols)
+    lc, gen = engine.run_arrays(features, current, past, horizon)
+    preds = {"lc": lc, "gen": gen}
+
+    actual = _actuals(panel)
+    iso = hist["iso3"].to_numpy()[rows]
+    origins = years[rows]
+
+    by_horizon = []
+    for h in range(1, horizon + 1):
+        keys = pd.MultiIndex.from_arrays([iso, origins + h])
+        values = actual.reindex(keys)
+        entry = {"horizon": h}
+        for key, col in LEVEL_COLS.items():
+            errors = _errors(preds[key][:, h - 1], values[col].to_numpy())
+            entry[f"{key}_n"] = errors["n"]
+            entry[f"{key}_mae"] = errors["mae"]
+            entry[f"{key}_rmse"] = errors["rmse"]
+        by_horizon.append(entry)
+
+    return {
+        "origin_min": int(origin_min),
+        "origin_max": int(origin_max),
+        "pairs": int(len(rows)),
+        "countries": int(len(np.unique(iso))),
+        "seconds": round(time.perf_counter() - t0, 3),
+        "by_horizon": by_horizon,
+    }
+
+
+def run(models_dir: str = MODELS_DIR, panel_path: str = DATA_PATH,
+        database_url: str = None, origin_min: int = None,
+        horizon: int = MAX_HORIZON, write: bool = True) -> dict:
+    """
+    Backtest the models in `models_dir` and, if `write`, store the result
+    under "backtest" in its metrics.json and their validation-period
+    residuals in residuals.npz.
+    """
+    cfg, engine, art_hash = load_engine(models_dir)
+    train_year_max = cfg.get("train_year_max", 2015)
+    if origin_min is None:
+        origin_min = train_year_max
+
+    panel = load_history(panel_path, database_url)
+    result = backtest(engine, panel, origin_min, horizon=horizon)
+    result = {"artifact_hash": art_hash, "horizon": horizon, **result}
+
+    # origins whose next year is a validation year
+    res_min = train_year_max
+    res_max = cfg.get("val_year_max", train_year_max + 5) - 1
+    residuals = one_step_residuals(engine, panel, res_min, res_max)
+    result["residuals"] = {
+        "n": int(len(residuals)),
+        "origin_min": int(res_min),
+        "origin_max": int(res_max),
+    }
+
+    if write:
+        np.savez(os.path.join(models_dir, RESIDUALS_FILE), residuals=residuals)
+        metrics_path = os.path.join(models_dir, "metrics.json")
+        metrics = {}
+        if os.path.exists(metrics_path):
+            with open(metrics_path) as f:
+                metrics = json.load(f)
+        metrics["backtest"] = result
+        with open(metrics_path, "w") as f:
+            json.dump(metrics, f, indent=2)
+    return result
+
+
+def _fmt(value) -> str:
+    return f"{value:>10.3f}" if value is not None else f"{'-':>10}"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--models-dir", default=MODELS_DIR)
+    parser.add_argument("--panel", default=DATA_PATH)
+    parser.add_argument("--database-url", help="read histories from Postgres")
+    parser.add_argument("--origin-min", type=int,
+                        help="first origin year (default: train_year_max)")
+    parser.add_argument("--horizon", type=int, default=MAX_HORIZON)
+    parser.add_argument("--dry-run", action="store_true",
+                        help="print the result without updating metrics.json")
+    args = parser.parse_args()
+
+    result = run(args.models_dir, args.panel, args.database_url,
+                 args.origin_min, args.horizon, write=not args.dry_run)
+
+    print(f"{result['pairs']} (country, origin) pairs, origins "
+          f"{result['origin_min']}-{result['origin_max']}, "
+          f"{result['seconds']:.2f} s")
+    print(f"{'h':>3}{'n':>7}{'LC MAE':>10}{'LC RMSE':>10}"
+          f"{'GEN MAE':>10}{'GEN RMSE':>10}")
+    for e in result["by_horizon"]:
+        print(f"{e['horizon']:>3}{e['lc_n']:>7}{_fmt(e['lc_mae'])}"
+              f"{_fmt(e['lc_rmse'])}{_fmt(e['gen_mae'])}{_fmt(e['gen_rmse'])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,59 @@
 # -*- coding: utf-8 -*-
+import argparse
 import os
+import sys
 import psycopg2
 import pandas as pd
 import numpy as np
 from dotenv import load_dotenv
 
+from panel_io import PANEL_CSV, PANEL_PATH, write_panel
+
+# feature code is shared with the API so training and serving match
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+from enforecast.features import build_features  # noqa: E402
+from enforecast.feature_store import refresh_country_features  # noqa: E402
+
 load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-OUT_PATH = "data/ml_panel.csv"
+OUT_PATH = PANEL_PATH
+
+
+def build_panel(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Joined countries ⋈ energy_yearly rows -> training panel: features,
+    delta targets, rows with full history from 2000 on.
+    """
+    # 2-3) Shares and 1–3 year lags per country (api/enforecast/features.py)
+    df = build_features(df, group_col="iso3")
+
+    # 4) Create delta targets
+    df["delta_lc"] = df.groupby("iso3")["low_carbon_share_pct"].diff()
+
+    df["log_gen"] = np.log(df["electricity_generation_twh"].clip(lower=1e-6))
+    df["delta_log_gen"] = df.groupby("iso3")["log_gen"].diff()
+
+    # 5) Drop rows without full history (lags and deltas)
+    df = df[
+        df["low_carbon_share_pct_lag3"].notnull()
+        & df["delta_lc"].notnull()
+        & df["delta_log_gen"].notnull()
+    ].copy()
+
+    # 6) Optional: filter to start from 2000 for cleaner panel
+    return df[df["year"] >= 2000].reset_index(drop=True)
+
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", default=OUT_PATH,
+                        help="panel path: .parquet, .feather or a directory "
+                             "(year-partitioned Parquet)")
+    parser.add_argument("--csv", action="store_true",
+                        help=f"also export the panel to {PANEL_CSV}")
+    args = parser.parse_args()
+
     conn = psycopg2.connect(DATABASE_URL)
 
     # 1) Pull joined data from DB
@@ -42,53 +85,25 @@ def main():
         ORDER BY c.iso3, e.year;
     """
     df = pd.read_sql(query, conn)
-    conn.close()
-
-    # 2) Compute shares (avoid division by zero)
-    eps = 1e-9
-    gen = df["electricity_generation_twh"].clip(lower=eps)
-
-    for src in ["coal", "oil", "gas", "nuclear", "hydro", "solar", "wind", "other_renewables"]:
-        df[f"{src}_share"] = df[f"{src}_twh"] / gen
-
-    # 3) Create lag features (1–3 years) for key columns
-    df = df.sort_values(["iso3", "year"])
-
-    lag_cols = [
-        "low_carbon_share_pct",
-        "electricity_generation_twh",
-        "solar_share",
-        "wind_share",
-        "fossil_share_pct",
-    ]
 
-    for col in lag_cols:
-        for lag in [1, 2, 3]:
-            df[f"{col}_lag{lag}"] = df.groupby("iso3")[col].shift(lag)
-
-    # 4) Create delta targets
-    df["delta_lc"] = df.groupby("iso3")["low_carbon_share_pct"].diff()
-
-    df["log_gen"] = np.log(df["electricity_generation_twh"].clip(lower=1e-6))
-    df["delta_log_gen"] = df.groupby("iso3")["log_gen"].diff()
-
-    # 5) Drop rows without full history (lags and deltas)
-    df = df[
-        df["low_carbon_share_pct_lag3"].notnull()
-        & df["delta_lc"].notnull()
-        & df["delta_log_gen"].notnull()
-    ].copy()
+    # keep the API's per-country feature rows in step with the panel
+    store = refresh_country_features(conn)
+    print(f"Refreshed country_features for {len(store.states)} countries")
+    conn.close()
 
-    # 6) Optional: filter to start from 2000 for cleaner panel
-    df = df[df["year"] >= 2000].reset_index(drop=True)
+    # 2-6) features, targets, filtering
+    df = build_panel(df)
 
-    # 7) Save to CSV for ML training
+    # 7) Save typed panel (plus feature metadata) for ML training
     os.makedirs("data", exist_ok=True)
-    df.to_csv(OUT_PATH, index=False)
+    meta = write_panel(df, args.out)
+    if args.csv:
+        write_panel(df, PANEL_CSV)
     print(
-        f"Saved ML panel to {OUT_PATH} with {len(df)} rows, "
-        f"{df['iso3'].nunique()} countries, years "
-        f"{df['year'].min()}–{df['year'].max()}"
+        f"Saved ML panel to {args.out} with {meta['rows']} rows, "
+        f"{meta['countries']} countries, years "
+        f"{meta['year_min']}–{meta['year_max']}, "
+        f"{len(meta['feature_cols'])} features"
     )
 
 if __name__ == "__main__":
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+Flatten trained tree ensembles into array-backed node tables.
+
+The API can then evaluate the models with plain NumPy
+(api/model_backends.py::TreeTableModel), without importing xgboost or
+scikit-learn. One table holds every node of every tree, already in the
+evaluator's working layout so the API can memory-map it as is:
+
+    feature       int64    split feature index (0 for leaves)
+    threshold     float32 (xgb) / float64 (rf) split threshold
+    children      int64    [right, left] child index pairs, so node i's
+                           children are children[2*i] and children[2*i+1];
+                           leaves point to themselves
+    default_left  bool     direction taken when the feature is NaN
+    value         float64  leaf value (0 for internal nodes)
+    roots         int64    root node index of each tree
+
+plus scalar metadata: `kind` ("xgb" or "rf"), `base_score`, `max_depth`
+and `n_features`. Tables are written as an uncompressed .npz whose
+members start on 64-byte boundaries, so every array can be
+memory-mapped straight out of the file with aligned access.
+
+Linear models (ridge) are exported as *.linear.npz holding just
+`coef` and `intercept`.
+
+    python ml/export_trees.py models/      # re-export existing joblib files
+"""
+import io
+import json
+import os
+import struct
+import sys
+import zipfile
+
+import joblib
+import numpy as np
+
+
+def _pack(trees, kind, base_score, n_features):
+    """
+    trees: list of dicts with per-tree arrays feature, threshold, left,
+    right, default_left, value (local node indices, -1 for no child).
+    """
+    feature, threshold, left, right, default_left, value, roots = ([] for _ in range(7))
+    max_depth = 0
+    offset = 0
+    for t in trees:
+        n = len(t["feature"])
+        is_leaf = t["left"] < 0
+        node_ids = np.arange(n)
+        # leaves point to themselves so a fixed number of steps is safe
+        lft = np.where(is_leaf, node_ids, t["left"]) + offset
+        rgt = np.where(is_leaf, node_ids, t["right"]) + offset
+
+        feature.append(np.where(is_leaf, -1, t["feature"]))
+        threshold.append(np.where(is_leaf, 0.0, t["threshold"]))
+        left.append(lft)
+        right.append(rgt)
+        default_left.append(t["default_left"])
+        value.append(np.where(is_leaf, t["value"], 0.0))
+        roots.append(offset)
+        max_depth = max(max_depth, _depth(t["left"], t["right"]))
+        offset += n
+
+    left = np.concatenate(left)
+    children = np.empty(2 * len(left), dtype=np.int64)
+    children[0::2] = np.concatenate(right)
+    children[1::2] = left
+
+    return {
+        "kind": np.array(kind),
+        "base_score": np.array(base_score, dtype=np.float64),
+        "max_depth": np.array(max_depth, dtype=np.int32),
+        "n_features": np.array(n_features, dtype=np.int32),
+        "feature": np.maximum(np.concatenate(feature), 0).astype(np.int64),
+        "threshold": np.concatenate(threshold).astype(
+            np.float32 if kind == "xgb" else np.float64
+        ),
+        "children": children,
+        "default_left": np.concatenate(default_left).astype(bool),
+        "value": np.concatenate(value).astype(np.float64),
+        "roots": np.array(roots, dtype=np.int64),
+    }
+
+
+def _depth(left, right):
+    max_depth = 0
+    stack = [(0, 0)]
+    while stack:
+        node, depth = stack.pop()
+        if left[node] < 0:
+            max_depth = max(max_depth, depth)
+        else:
+            stack.append((left[node], depth + 1))
+            stack.append((right[node], depth + 1))
+    return max_depth
+
+
+TREE_MODEL_TYPES = ("xgb", "rf")
+
+
+def xgb_booster(model):
+    """
+    Booster of an XGBRegressor, cut at its early-stopping iteration if
+    it has one (the trees its predict() uses); Boosters pass through.
+    """
+    if not hasattr(model, "get_booster"):
+        return model
+    booster = model.get_booster()
+    best = getattr(model, "best_iteration", None)
+    return booster[: best + 1] if best is not None else booster
+
+
+def xgb_to_tree_table(model) -> dict:
+    """
+    Node table for an XGBRegressor or xgboost.Booster trained with
+    reg:squarederror on numeric (non-categorical) features.
+    """
+    booster = xgb_booster(model)
+    learner = json.loads(booster.save_raw(raw_format="json"))["learner"]
+
+    objective = learner["objective"]["name"]
+    if objective != "reg:squarederror":
+        raise ValueError(f"Unsupported XGBoost objective: {objective}")
+    gbm = learner["gradient_booster"]
+    if gbm["name"] != "gbtree":
+        raise ValueError(f"Unsupported XGBoost booster: {gbm['name']}")
+
+    trees = []
+    for t in gbm["model"]["trees"]:
+        if any(t["split_type"]):
+            raise ValueError("Categorical splits are not supported")
+        left = np.array(t["left_children"], dtype=np.int64)
+        trees.append(
+            {
+                "feature": np.array(t["split_indices"], dtype=np.int64),
+                # XGBoost compares float32 values; leaves keep their
+                # weight in split_conditions
+                "threshold": np.array(t["split_conditions"], dtype=np.float32),
+                "left": left,
+                "right": np.array(t["right_children"], dtype=np.int64),
+                "default_left": np.array(t["default_left"], dtype=bool),
+                "value": np.array(t["split_conditions"], dtype=np.float32),
+            }
+        )
+
+    params = learner["learner_model_param"]
+    return _pack(
+        trees,
+        "xgb",
+        float(np.float32(params["base_score"])),
+        int(params["num_feature"]),
+    )
+
+
+def rf_to_tree_table(model) -> dict:
+    """
+    Node table for a fitted sklearn RandomForestRegressor (single output).
+    """
+    trees = []
+    for est in model.estimators_:
+        tree = est.tree_
+        left = tree.children_left.astype(np.int64)
+        trees.append(
+            {
+                "feature": tree.feature.astype(np.int64),
+                "threshold": tree.threshold.astype(np.float64),
+                "left": left,
+                "right": tree.children_right.astype(np.int64),
+                "default_left": np.ones(len(left), dtype=bool),
+                "value": tree.value[:, 0, 0].astype(np.float64),
+            }
+        )
+    return _pack(trees, "rf", 0.0, int(model.n_features_in_))
+
+
+def to_tree_table(model, model_type: str) -> dict:
+    if model_type == "xgb":
+        return xgb_to_tree_table(model)
+    if model_type == "rf":
+        return rf_to_tree_table(model)
+    raise ValueError(f"No tree export for model type {model_type!r}")
+
+
+def save_npz_aligned(path: str, arrays: dict, align: int = 64):
+    """
+    Like np.savez, but pads each zip local header (via an extra field)
+    so the .npy payload of every member starts on an `align`-byte
+    boundary; .npy headers are themselves padded to 64 bytes.
+    """
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_STORED) as zf:
+        for key, arr in arrays.items():
+            buf = io.BytesIO()
+            np.lib.format.write_array(buf, np.asanyarray(arr), allow_pickle=False)
+
+            name = f"{key}.npy"
+            # fixed timestamp keeps exports byte-identical for identical models
+            zinfo = zipfile.ZipInfo(name, date_time=(1980, 1, 1, 0, 0, 0))
+            zinfo.compress_type = zipfile.ZIP_STORED
+            header_end = zf.fp.tell() + 30 + len(name.encode())
+            pad = -header_end % align
+            if 0 < pad < 4:  # an extra field needs at least 4 bytes
+                pad += align
+            if pad:
+                zinfo.extra = struct.pack("<HH", 0x7061, pad - 4) + b"\0" * (pad - 4)
+            zf.writestr(zinfo, buf.getvalue())
+
+
+def save_tree_table(model, model_type: str, path: str):
+    save_npz_aligned(path, to_tree_table(model, model_type))
+
+
+def save_linear(model, path: str):
+    """
+    coef/intercept of a fitted sklearn linear regressor, for the API's
+    LinearModel backend.
+    """
+    np.savez(
+        path,
+        coef=np.asarray(model.coef_, dtype=np.float64),
+        intercept=np.float64(model.intercept_),
+    )
+
+
+def main():
+    """
+    Export node tables next to the joblib models in a models directory,
+    using feature_config.json to find the selected model types.
+    """
+    models_dir = sys.argv[1] if len(sys.argv) > 1 else "models"
+    with open(os.path.join(models_dir, "feature_config.json")) as f:
+        cfg = json.load(f)
+
+    for target in ("lc", "gen"):
+        model_type = cfg[f"best_{target}_model_type"]
+        model = joblib.load(
+            os.path.join(models_dir, f"{model_type}_{target}_model.joblib")
+        )
+        if model_type not in TREE_MODEL_TYPES:
+            out_path = os.path.join(models_dir, f"{model_type}_{target}_model.linear.npz")
+            save_linear(model, out_path)
+            print(f"Saved {out_path}")
+            continue
+        out_path = os.path.join(models_dir, f"{model_type}_{target}_model.trees.npz")
+        save_tree_table(model, model_type, out_path)
+        print(f"Saved {out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+Storage of the ML panel built by build_dataset.py.
+
+The panel is written as typed Arrow data with the column order, feature
+columns and targets stored in the schema metadata, so training reads
+exactly the columns it needs without inferring anything. Text columns
+are dictionary-encoded, ids and years are int32/int16, values float64.
+The path picks the layout:
+
+    data/ml_panel.parquet   single zstd Parquet file (default)
+    data/ml_panel/          Parquet dataset partitioned by year, for
+                            panels large enough that per-year files pay
+                            off (on today's ~5k rows they do not)
+    *.feather / *.arrow     uncompressed Arrow IPC, memory-mappable
+    *.csv                   plain CSV export, as before
+
+Everything but CSV needs pyarrow.
+"""
+import json
+import os
+
+import pandas as pd
+
+PANEL_PATH = "data/ml_panel.parquet"
+PANEL_CSV = "data/ml_panel.csv"
+
+METADATA_KEY = b"enforecast.panel"
+
+TEXT_COLS = ["iso3", "name", "region", "subregion", "income_group"]
+INT_COLS = {"country_id": "int32", "year": "int16"}
+TARGET_COLS = ["delta_lc", "delta_log_gen"]
+SORT_KEYS = ["iso3", "year"]
+# never used as model inputs: ids, labels, current levels and targets
+NON_FEATURE_COLS = [
+    "country_id", "iso3", "name", "year",
+    "region", "subregion", "income_group",
+    "low_carbon_share_pct", "electricity_generation_twh",
+    "log_gen",  # helper
+] + TARGET_COLS
+
+
+def feature_columns(df: pd.DataFrame) -> list:
+    """
+    Model input columns: every numeric column except NON_FEATURE_COLS,
+    in panel order.
+    """
+    return [
+        c for c in df.columns
+        if c not in NON_FEATURE_COLS and pd.api.types.is_numeric_dtype(df[c])
+    ]
+
+
+def typed_panel(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Panel with explicit column types: categorical text, int32/int16
+    ids and years, float64 for everything else.
+    """
+    out = {}
+    for col in df.columns:
+        if col in TEXT_COLS:
+            out[col] = df[col].astype("string").astype("category")
+        elif col in INT_COLS:
+            out[col] = df[col].astype(INT_COLS[col])
+        else:
+            out[col] = pd.to_numeric(df[col], errors="coerce").astype("float64")
+    return pd.DataFrame(out)
+
+
+def _metadata(df: pd.DataFrame) -> dict:
+    return {
+        "columns": list(df.columns),
+        "feature_cols": feature_columns(df),
+        "target_cols": [c for c in TARGET_COLS if c in df.columns],
+        "rows": len(df),
+        "countries": int(df["iso3"].nunique()) if "iso3" in df else None,
+        "year_min": int(df["year"].min()) if len(df) else None,
+        "year_max": int(df["year"].max()) if len(df) else None,
+    }
+
+
+def _is_csv(path: str) -> bool:
+    return path.endswith(".csv")
+
+
+def _is_feather(path: str) -> bool:
+    return path.endswith((".feather", ".arrow"))
+
+
+def _is_parquet_file(path: str) -> bool:
+    return path.endswith(".parquet")
+
+
+def write_panel(df: pd.DataFrame, path: str = PANEL_PATH) -> dict:
+    """
+    Write the panel to `path` (see the module docstring for the
+    layouts; an existing partitioned directory is replaced). Returns the
+    metadata stored with it.
+    """
+    df = typed_panel(df)
+    meta = _metadata(df)
+
+    if _is_csv(path):
+        df.to_csv(path, index=False)
+        return meta
+
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata(
+        {**(table.schema.metadata or {}), METADATA_KEY: json.dumps(meta).encode()}
+    )
+
+    if _is_feather(path):
+        import pyarrow.feather as feather
+
+        # uncompressed so readers can memory-map it without copies
+        feather.write_feather(table, path, compression="uncompressed")
+        return meta
+
+    if _is_parquet_file(path):
+        import pyarrow.parquet as pq
+
+        pq.write_table(table, path, compression="zstd")
+        return meta
+
+    import shutil
+
+    import pyarrow.dataset as ds
+
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    ds.write_dataset(
+        table,
+        path,
+        format="parquet",
+        partitioning=ds.partitioning(
+            pa.schema([("year", pa.int16())]), flavor="hive"
+        ),
+    )
+    return meta
+
+
+def _dataset(path: str):
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    if _is_feather(path):
+        return ds.dataset(path, format="ipc")
+    if _is_parquet_file(path):
+        return ds.dataset(path, format="parquet")
+    return ds.dataset(
+        path,
+        format="parquet",
+        partitioning=ds.partitioning(
+            pa.schema([("year", pa.int16())]), flavor="hive"
+        ),
+    )
+
+
+def read_metadata(path: str = PANEL_PATH):
+    """
+    Metadata stored with a Parquet/Feather panel, or None for CSV files
+    and panels written without it.
+    """
+    if _is_csv(path) or not os.path.exists(path):
+        return None
+    raw = (_dataset(path).schema.metadata or {}).get(METADATA_KEY)
+    return json.loads(raw) if raw else None
+
+
+def read_panel(path: str = PANEL_PATH, columns: list = None) -> pd.DataFrame:
+    """
+    Read the panel, or only `columns` of it, in panel column order.
+
+    Parquet/Feather columns that are not requested are never read, and
+    numeric columns without nulls are handed to pandas without copying
+    where Arrow allows it.
+    """
+    if _is_csv(path):
+        return pd.read_csv(path, usecols=columns)
+
+    dataset = _dataset(path)
+    meta = read_metadata(path) or {}
+    order = meta.get("columns") or dataset.schema.names
+    wanted = [c for c in order if columns is None or c in columns]
+    missing = set(columns or ()) - set(wanted)
+    if missing:
+        raise KeyError(f"Columns not in panel {path}: {sorted(missing)}")
+
+    # partitions come back ordered by year; the sort keys are always
+    # read so the panel's (iso3, year) row order can be restored (this
+    # matters: row order feeds the models' subsampling)
+    keys = [c for c in SORT_KEYS if c in order]
+    table = dataset.to_table(columns=wanted + [k for k in keys if k not in wanted])
+    if keys:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        # Arrow cannot sort dictionary columns; sort on decoded keys
+        sort_keys = pa.table({
+            k: table[k].cast(pa.string()) if k in TEXT_COLS else table[k]
+            for k in keys
+        })
+        table = table.take(
+            pc.sort_indices(sort_keys, [(k, "ascending") for k in keys])
+        )
+    table = table.select(wanted)
+    # one block per column: no consolidation copy into 2-D blocks
+    return table.to_pandas(split_blocks=True, self_destruct=True)
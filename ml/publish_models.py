@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Publish trained models into the API's model registry.
+
+Copies the artifacts of a models directory (output of train_models.py)
+into a new immutable registry version with a manifest of their hashes,
+feature columns and scaler stats, and by default points CURRENT at it.
+Running API workers pick the new version up within MODEL_WATCH_SECONDS
+and swap to it without a restart (or at once via POST
+/admin/models/reload).
+
+    python ml/publish_models.py [--models-dir models]
+                                [--registry api/models/registry]
+                                [--version NAME] [--no-activate]
+    python ml/publish_models.py --activate NAME     # roll back / forward
+    python ml/publish_models.py --list
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+from model_registry import activate, current_version, list_versions, publish  # noqa: E402
+
+MODELS_DIR = "models"
+REGISTRY_DIR = os.getenv(
+    "MODEL_REGISTRY",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api", "models", "registry"),
+)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--models-dir", default=MODELS_DIR)
+    parser.add_argument("--registry", default=REGISTRY_DIR)
+    parser.add_argument("--version", help="version name (default: timestamp-hash)")
+    parser.add_argument("--no-activate", action="store_true",
+                        help="publish without pointing CURRENT at it")
+    parser.add_argument("--activate", metavar="VERSION",
+                        help="point CURRENT at an existing version and exit")
+    parser.add_argument("--list", action="store_true",
+                        help="list published versions and exit")
+    args = parser.parse_args()
+
+    if args.list:
+        current = current_version(args.registry)
+        for m in list_versions(args.registry):
+            mark = "*" if m["version"] == current else " "
+            print(f"{mark} {m['version']}  {m['created_at']}  "
+                  f"lc={m['best_lc_model_type']} gen={m['best_gen_model_type']}")
+        return
+    if args.activate:
+        activate(args.registry, args.activate)
+        print(f"CURRENT -> {args.activate}")
+        return
+
+    manifest = publish(args.models_dir, args.registry, args.version,
+                       activate_version=not args.no_activate)
+    print(f"Published {args.models_dir} as {manifest['version']} "
+          f"({len(manifest['artifacts'])} files)"
+          + ("" if args.no_activate else "; now CURRENT"))
+
+
+if __name__ == "__main__":
+    main()
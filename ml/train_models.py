@@ -1,13 +1,56 @@
 # -*- coding: utf-8 -*-
+"""
+Train the delta_lc and delta_log_gen models.
+
+Every (target, family, parameters) candidate in SEARCH_GRID is fitted on
+the years up to 2015 and scored on 2016-2020, in parallel worker
+processes (--jobs). For each target the candidate with the lowest
+validation RMSE is saved for the API, whichever family it belongs to;
+the 2021+ test years are only reported.
+
+Fits stop early once more trees no longer help on the last
+EARLY_STOP_YEARS training years (2013-2015), held out from a first fit
+on the years before: XGBoost after XGB_EARLY_STOPPING rounds without
+improvement, random forests (grown RF_STEP trees at a time) after
+RF_PATIENCE steps. The model is then refitted on all training years
+with the tree count found there, so the validation years are only used
+for selection. A large n_estimators in the grid is an upper bound, not
+a cost.
+
+metrics.json keeps the {family}_{target}_{val,test} entries for the best
+candidate of each family, and adds the selected models and, under
+"search", every candidate's parameters, scores and fit time. The saved
+models are then backtested on recursive 1-10 year forecasts
+(ml/backtest.py), which adds "backtest".
+
+    python ml/train_models.py [--jobs -1] [--grid grid.json]
+                              [--families ridge,rf,xgb] [--models-dir models]
+                              [--no-backtest] [--publish]
+
+--grid takes a JSON object {family: [parameter dicts]} that replaces the
+built-in grid of the families it names.
+"""
+import argparse
 import os
 import json
-import pandas as pd
+import time
 from sklearn.preprocessing import StandardScaler
 from sklearn.linear_model import Ridge
 from sklearn.metrics import mean_absolute_error, mean_squared_error
 from sklearn.ensemble import RandomForestRegressor
 from math import sqrt
 import joblib
+import numpy as np
+from joblib import Parallel, delayed
+
+from export_trees import TREE_MODEL_TYPES, save_linear, save_tree_table, xgb_booster
+from panel_io import (
+    PANEL_CSV,
+    PANEL_PATH,
+    feature_columns,
+    read_metadata,
+    read_panel,
+)
 
 try:
     from xgboost import XGBRegressor
@@ -15,45 +58,207 @@ try:
 except ImportError:
     HAS_XGB = False
 
-DATA_PATH = "data/ml_panel.csv"
+# typed Parquet panel from build_dataset.py, else the CSV export
+DATA_PATH = PANEL_PATH if os.path.exists(PANEL_PATH) else PANEL_CSV
 MODELS_DIR = "models"
 
-def train_and_eval(X_train, y_train, X_val, y_val, model):
-    model.fit(X_train, y_train)
-    preds = model.predict(X_val)
-    mae = mean_absolute_error(y_val, preds)
-    rmse = sqrt(mean_squared_error(y_val, preds))
-    return model, mae, rmse
+TRAIN_YEAR_MAX = 2015
+VAL_YEAR_MAX = 2020
+
+# family -> candidate parameters
+SEARCH_GRID = {
+    "ridge": [{"alpha": alpha} for alpha in (0.001, 0.01, 0.1, 1.0, 10.0)],
+    "rf": [
+        {"n_estimators": 300, "max_depth": depth, "min_samples_leaf": leaf}
+        for depth in (6, 10, None)
+        for leaf in (1, 5)
+    ],
+    "xgb": [
+        {
+            "n_estimators": 1000,
+            "max_depth": depth,
+            "learning_rate": lr,
+            "subsample": 0.8,
+            "colsample_bytree": 0.8,
+        }
+        for depth in (3, 6)
+        for lr in (0.05, 0.1)
+    ],
+}
+
+# families trained on standardized features; trees take raw ones
+SCALED_FAMILIES = {"ridge"}
+
+# trailing training years held out to pick the number of trees
+EARLY_STOP_YEARS = 3
+XGB_EARLY_STOPPING = 50
+RF_STEP = 50
+RF_PATIENCE = 2
+# relative RMSE improvement a forest step must bring to count
+RF_MIN_GAIN = 1e-3
+
+TARGETS = {"lc": "delta_lc", "gen": "delta_log_gen"}
+
+
+def _scores(y_true, preds) -> dict:
+    return {
+        "mae": float(mean_absolute_error(y_true, preds)),
+        "rmse": float(sqrt(mean_squared_error(y_true, preds))),
+    }
+
+
+def _early_stop_split(X, y, years):
+    """
+    (X_fit, y_fit, X_stop, y_stop): the last EARLY_STOP_YEARS years of
+    the training rows become the early-stopping set.
+    """
+    stop = years > years.max() - EARLY_STOP_YEARS
+    return X[~stop], y[~stop], X[stop], y[stop]
+
+
+def _fit_rf(params, X_train, y_train, years, n_jobs):
+    X_fit, y_fit, X_val, y_val = _early_stop_split(X_train, y_train, years)
+    n_max = params.get("n_estimators", 100)
+    model = RandomForestRegressor(
+        **{**params, "n_estimators": min(RF_STEP, n_max)},
+        warm_start=True,
+        n_jobs=n_jobs,
+        random_state=42,
+    )
+    # running sum of per-tree validation predictions
+    val_sum = np.zeros(len(y_val))
+    best_rmse, best_n, stale = float("inf"), 0, 0
+    while True:
+        done = len(getattr(model, "estimators_", []))
+        model.fit(X_fit, y_fit)
+        for est in model.estimators_[done:]:
+            val_sum += est.predict(X_val)
+        n = len(model.estimators_)
+        rmse = sqrt(mean_squared_error(y_val, val_sum / n))
+        if rmse < best_rmse * (1 - RF_MIN_GAIN):
+            best_rmse, best_n, stale = rmse, n, 0
+        else:
+            stale += 1
+        if stale >= RF_PATIENCE or n >= n_max:
+            break
+        model.set_params(n_estimators=min(n + RF_STEP, n_max))
+
+    return RandomForestRegressor(
+        **{**params, "n_estimators": best_n}, n_jobs=n_jobs, random_state=42
+    ).fit(X_train, y_train)
+
+
+def _fit_xgb(params, X_train, y_train, years, n_jobs):
+    X_fit, y_fit, X_val, y_val = _early_stop_split(X_train, y_train, years)
+    base = {
+        "objective": "reg:squarederror",
+        "tree_method": "hist",
+        "eval_metric": "rmse",
+        "random_state": 42,
+        "n_jobs": n_jobs,
+        **params,
+    }
+    model = XGBRegressor(**base, early_stopping_rounds=XGB_EARLY_STOPPING)
+    model.fit(X_fit, y_fit, eval_set=[(X_val, y_val)], verbose=False)
+    n_rounds = model.best_iteration + 1
+    return XGBRegressor(**{**base, "n_estimators": n_rounds}).fit(X_train, y_train)
+
+
+def _n_estimators(model):
+    if hasattr(model, "estimators_"):
+        return len(model.estimators_)
+    if hasattr(model, "get_booster"):
+        return xgb_booster(model).num_boosted_rounds()
+    return None
+
+
+def fit_candidate(target, family, params, data, n_jobs=1):
+    """
+    Fit one candidate on the training years and score it on the
+    validation years. Returns (result, model).
+    """
+    X_train, X_val = data["scaled" if family in SCALED_FAMILIES else "raw"][:2]
+    y_train, y_val = data[target][:2]
+    years = data["train_years"]
+
+    t0 = time.perf_counter()
+    if family == "ridge":
+        model = Ridge(**{"random_state": 42, **params}).fit(X_train, y_train)
+    elif family == "rf":
+        model = _fit_rf(params, X_train, y_train, years, n_jobs)
+    elif family == "xgb":
+        model = _fit_xgb(params, X_train, y_train, years, n_jobs)
+    else:
+        raise ValueError(f"Unknown model family {family!r}")
+    fit_seconds = time.perf_counter() - t0
+
+    result = {
+        "target": TARGETS[target],
+        "family": family,
+        "params": params,
+        "n_estimators": _n_estimators(model),
+        "val": _scores(y_val, model.predict(X_val)),
+        "fit_seconds": round(fit_seconds, 3),
+    }
+    return result, model
+
 
 def main():
-    os.makedirs(MODELS_DIR, exist_ok=True)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=-1,
+                        help="parallel candidate fits (-1 = all cores)")
+    parser.add_argument("--grid", help="JSON file {family: [params, ...]}")
+    parser.add_argument("--families", default=",".join(SEARCH_GRID),
+                        help="comma-separated model families to search")
+    parser.add_argument("--models-dir", default=MODELS_DIR)
+    parser.add_argument("--no-backtest", action="store_true",
+                        help="skip the walk-forward backtest (ml/backtest.py)")
+    parser.add_argument("--publish", action="store_true",
+                        help="publish the models to the API's registry and make "
+                             "them CURRENT (ml/publish_models.py)")
+    args = parser.parse_args()
 
-    df = pd.read_csv(DATA_PATH)
+    grid = dict(SEARCH_GRID)
+    if args.grid:
+        with open(args.grid) as f:
+            grid.update(json.load(f))
+    families = [f for f in args.families.split(",") if f]
+    if "xgb" in families and not HAS_XGB:
+        print("xgboost not installed; skipping xgb candidates")
+        families.remove("xgb")
+    for family in list(families):
+        if not grid.get(family):
+            print(f"No {family} parameters in the grid; skipping {family}")
+            families.remove(family)
+    if not families:
+        parser.error("no model family has candidates to fit")
+
+    models_dir = args.models_dir
+    os.makedirs(models_dir, exist_ok=True)
 
     # --- targets: deltas instead of levels ---
-    target_lc = "delta_lc"
-    target_gen = "delta_log_gen"
+    target_lc = TARGETS["lc"]
+    target_gen = TARGETS["gen"]
+
+    # read only the columns training needs when the panel says which
+    meta = read_metadata(DATA_PATH)
+    if meta is not None:
+        df = read_panel(
+            DATA_PATH, ["year", target_lc, target_gen] + meta["feature_cols"]
+        )
+    else:
+        df = read_panel(DATA_PATH)
 
     # drop rows where targets are missing
     df = df[df[target_lc].notna() & df[target_gen].notna()].copy()
 
     # time-based split
-    train_df = df[df["year"] <= 2015].copy()
-    val_df   = df[(df["year"] > 2015) & (df["year"] <= 2020)].copy()
-    test_df  = df[df["year"] > 2020].copy()
-
-    # --- feature columns ---
-    drop_cols = [
-        "country_id", "iso3", "name", "year",
-        "region", "subregion", "income_group",
-        "low_carbon_share_pct", "electricity_generation_twh",
-        "log_gen",  # helper
-        "delta_lc", "delta_log_gen",
-    ]
-    candidate_cols = [c for c in df.columns if c not in drop_cols]
+    train_df = df[df["year"] <= TRAIN_YEAR_MAX].copy()
+    val_df   = df[(df["year"] > TRAIN_YEAR_MAX) & (df["year"] <= VAL_YEAR_MAX)].copy()
+    test_df  = df[df["year"] > VAL_YEAR_MAX].copy()
 
-    # keep only numeric columns
-    feature_cols = [c for c in candidate_cols if pd.api.types.is_numeric_dtype(df[c])]
+    # --- feature columns (numeric, minus ids/levels/targets) ---
+    feature_cols = meta["feature_cols"] if meta is not None else feature_columns(df)
 
     # extract feature frames
     X_train_df = train_df[feature_cols].copy()
@@ -62,21 +267,9 @@ def main():
 
     # simple imputation: fill NaN with column mean (computed on train)
     col_means = X_train_df.mean(numeric_only=True)
-    X_train_df = X_train_df.fillna(col_means)
-    X_val_df   = X_val_df.fillna(col_means)
-    X_test_df  = X_test_df.fillna(col_means)
-
-    X_train = X_train_df.values
-    X_val   = X_val_df.values
-    X_test  = X_test_df.values
-
-    y_train_lc = train_df[target_lc].values
-    y_val_lc   = val_df[target_lc].values
-    y_test_lc  = test_df[target_lc].values
-
-    y_train_gen = train_df[target_gen].values
-    y_val_gen   = val_df[target_gen].values
-    y_test_gen  = test_df[target_gen].values
+    X_train = X_train_df.fillna(col_means).values
+    X_val   = X_val_df.fillna(col_means).values
+    X_test  = X_test_df.fillna(col_means).values
 
     # --- scaling for linear models ---
     scaler = StandardScaler()
@@ -84,123 +277,110 @@ def main():
     X_val_scaled   = scaler.transform(X_val)
     X_test_scaled  = scaler.transform(X_test)
 
-    metrics = {}
+    # (train, val, test) per input kind and target
+    data = {
+        "raw": (X_train, X_val, X_test),
+        "scaled": (X_train_scaled, X_val_scaled, X_test_scaled),
+    }
+    for key, col in TARGETS.items():
+        data[key] = (train_df[col].values, val_df[col].values, test_df[col].values)
+    data["train_years"] = train_df["year"].values
 
-    # 1) Ridge for delta_lc
-    ridge_lc = Ridge(alpha=1.0, random_state=42)
-    ridge_lc, mae, rmse = train_and_eval(
-        X_train_scaled, y_train_lc, X_val_scaled, y_val_lc, ridge_lc
+    # --- parallel search: one job per (target, family, params) ---
+    candidates = [
+        (target, family, params)
+        for target in TARGETS
+        for family in families
+        for params in grid[family]
+    ]
+    # a single process may use every core per fit instead
+    n_jobs_fit = -1 if args.jobs == 1 else 1
+    print(f"Fitting {len(candidates)} candidates (jobs={args.jobs})")
+    t0 = time.perf_counter()
+    fitted = Parallel(n_jobs=args.jobs)(
+        delayed(fit_candidate)(target, family, params, data, n_jobs_fit)
+        for target, family, params in candidates
     )
-    metrics["ridge_delta_lc_val"] = {"mae": mae, "rmse": rmse}
+    wall_seconds = time.perf_counter() - t0
 
-    # 2) Ridge for delta_log_gen
-    ridge_gen = Ridge(alpha=1.0, random_state=42)
-    ridge_gen, mae, rmse = train_and_eval(
-        X_train_scaled, y_train_gen, X_val_scaled, y_val_gen, ridge_gen
-    )
-    metrics["ridge_delta_log_gen_val"] = {"mae": mae, "rmse": rmse}
-
-    # 3) RandomForest for delta_lc
-    rf_lc = RandomForestRegressor(
-        n_estimators=300,
-        max_depth=10,
-        n_jobs=-1,
-        random_state=42
-    )
-    rf_lc, mae, rmse = train_and_eval(
-        X_train, y_train_lc, X_val, y_val_lc, rf_lc
-    )
-    metrics["rf_delta_lc_val"] = {"mae": mae, "rmse": rmse}
-
-    # 4) RandomForest for delta_log_gen
-    rf_gen = RandomForestRegressor(
-        n_estimators=300,
-        max_depth=10,
-        n_jobs=-1,
-        random_state=42
-    )
-    rf_gen, mae, rmse = train_and_eval(
-        X_train, y_train_gen, X_val, y_val_gen, rf_gen
-    )
-    metrics["rf_delta_log_gen_val"] = {"mae": mae, "rmse": rmse}
-
-    # 5) XGBoost models (if available)
-    if HAS_XGB:
-        xgb_lc = XGBRegressor(
-            n_estimators=400,
-            max_depth=6,
-            learning_rate=0.05,
-            subsample=0.8,
-            colsample_bytree=0.8,
-            objective="reg:squarederror",
-            random_state=42,
-            tree_method="hist"
-        )
-        xgb_lc, mae, rmse = train_and_eval(
-            X_train, y_train_lc, X_val, y_val_lc, xgb_lc
-        )
-        metrics["xgb_delta_lc_val"] = {"mae": mae, "rmse": rmse}
-
-        xgb_gen = XGBRegressor(
-            n_estimators=400,
-            max_depth=6,
-            learning_rate=0.05,
-            subsample=0.8,
-            colsample_bytree=0.8,
-            objective="reg:squarederror",
-            random_state=42,
-            tree_method="hist"
-        )
-        xgb_gen, mae, rmse = train_and_eval(
-            X_train, y_train_gen, X_val, y_val_gen, xgb_gen
-        )
-        metrics["xgb_delta_log_gen_val"] = {"mae": mae, "rmse": rmse}
-    else:
-        xgb_lc = None
-        xgb_gen = None
-
-    # --- evaluate best models on test for info only ---
-    def eval_on_test(model, X_t, y_t):
-        preds = model.predict(X_t)
-        return {
-            "mae": float(mean_absolute_error(y_t, preds)),
-            "rmse": float(sqrt(mean_squared_error(y_t, preds))),
-        }
+    metrics = {}
+    selected = {}
+    for target, col in TARGETS.items():
+        runs = [(r, m) for r, m in fitted if r["target"] == col]
+        for family in families:
+            family_runs = [(r, m) for r, m in runs if r["family"] == family]
+            r, m = min(family_runs, key=lambda rm: rm[0]["val"]["rmse"])
+            X_t = data["scaled" if family in SCALED_FAMILIES else "raw"][2]
+            r["test"] = _scores(data[target][2], m.predict(X_t))
+            metrics[f"{family}_{col}_val"] = r["val"]
+            metrics[f"{family}_{col}_test"] = r["test"]
+        selected[target] = min(runs, key=lambda rm: rm[0]["val"]["rmse"])
 
-    metrics["rf_delta_lc_test"]  = eval_on_test(rf_lc,  X_test, y_test_lc)
-    metrics["rf_delta_log_gen_test"] = eval_on_test(rf_gen, X_test, y_test_gen)
-    if xgb_lc is not None:
-        metrics["xgb_delta_lc_test"]  = eval_on_test(xgb_lc,  X_test, y_test_lc)
-        metrics["xgb_delta_log_gen_test"] = eval_on_test(xgb_gen, X_test, y_test_gen)
+    for target, (r, _) in selected.items():
+        print(f"{TARGETS[target]}: {r['family']} {r['params']} "
+              f"val rmse {r['val']['rmse']:.4f}")
 
-    # --- choose best model types (prefer XGB if present, else RF) ---
-    best_lc_model  = xgb_lc if xgb_lc is not None else rf_lc
-    best_gen_model = xgb_gen if xgb_gen is not None else rf_gen
-    best_lc_name   = "xgb" if xgb_lc is not None else "rf"
-    best_gen_name  = "xgb" if xgb_gen is not None else "rf"
+    metrics["selected"] = {TARGETS[t]: r for t, (r, _) in selected.items()}
+    metrics["search"] = {
+        "jobs": args.jobs,
+        "wall_seconds": round(wall_seconds, 3),
+        "fit_seconds_total": round(sum(r["fit_seconds"] for r, _ in fitted), 3),
+        "candidates": [r for r, _ in fitted],
+    }
 
-    # --- save models and scaler/config ---
-    joblib.dump(scaler,        os.path.join(MODELS_DIR, "scaler.joblib"))
-    joblib.dump(best_lc_model, os.path.join(MODELS_DIR, f"{best_lc_name}_lc_model.joblib"))
-    joblib.dump(best_gen_model,os.path.join(MODELS_DIR, f"{best_gen_name}_gen_model.joblib"))
+    # --- save selected models and scaler/config ---
+    joblib.dump(scaler, os.path.join(models_dir, "scaler.joblib"))
+    for target, (r, model) in selected.items():
+        name = r["family"]
+        base = os.path.join(models_dir, f"{name}_{target}_model")
+        joblib.dump(model, f"{base}.joblib")
+        if name == "xgb":
+            # native booster format for the API's fast inference path
+            xgb_booster(model).save_model(f"{base}.ubj")
+        if name in TREE_MODEL_TYPES:
+            # flat node tables for the API's dependency-free NumPy evaluator
+            save_tree_table(model, name, f"{base}.trees.npz")
+        else:
+            save_linear(model, f"{base}.linear.npz")
 
     config = {
         "feature_cols": feature_cols,
         "target_lc": target_lc,
         "target_gen": target_gen,
-        "train_year_max": 2015,
-        "val_year_max": 2020,
-        "test_year_min": 2021,
-        "best_lc_model_type": best_lc_name,
-        "best_gen_model_type": best_gen_name,
+        "train_year_max": TRAIN_YEAR_MAX,
+        "val_year_max": VAL_YEAR_MAX,
+        "test_year_min": VAL_YEAR_MAX + 1,
+        "best_lc_model_type": selected["lc"][0]["family"],
+        "best_gen_model_type": selected["gen"][0]["family"],
+        # which features each model takes ("scaled" or "raw")
+        "lc_input": "scaled" if selected["lc"][0]["family"] in SCALED_FAMILIES else "raw",
+        "gen_input": "scaled" if selected["gen"][0]["family"] in SCALED_FAMILIES else "raw",
+        "scaler_mean": scaler.mean_.tolist(),
+        "scaler_scale": scaler.scale_.tolist(),
     }
-    with open(os.path.join(MODELS_DIR, "feature_config.json"), "w") as f:
+    with open(os.path.join(models_dir, "feature_config.json"), "w") as f:
         json.dump(config, f, indent=2)
 
-    with open(os.path.join(MODELS_DIR, "metrics.json"), "w") as f:
+    with open(os.path.join(models_dir, "metrics.json"), "w") as f:
         json.dump(metrics, f, indent=2)
 
-    print("Saved models and metrics to 'models/'")
+    print(f"Saved models and metrics to '{models_dir}/' "
+          f"(search {wall_seconds:.1f} s wall)")
+
+    # recursive multi-year errors of the saved models, into metrics.json
+    if not args.no_backtest:
+        import backtest
+
+        result = backtest.run(models_dir, DATA_PATH)
+        h1 = result["by_horizon"][0]
+        print(f"Backtest: {result['pairs']} pairs; horizon 1 LC MAE "
+              f"{h1['lc_mae']:.3f}, GEN MAE {h1['gen_mae']:.3f}")
+
+    if args.publish:
+        import publish_models
+
+        manifest = publish_models.publish(models_dir, publish_models.REGISTRY_DIR)
+        print(f"Published as model version {manifest['version']}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Regression check for api/enforecast/features.py.
+
+On the raw columns of data/ml_panel.csv:
+
+- build_features(df, "iso3") must equal the original groupby/shift code
+  from ml/build_dataset.py, column for column
+- append_year on each country's second-to-last row must reproduce the
+  batch features of its last row
+- feature_store.build_states must equal the EngineState the API builds
+  from each country's history (needs the model artifacts)
+
+Also prints the time of both batch implementations. Exits non-zero on
+any mismatch.
+
+    python notebooks/check_features.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "api"))
+
+from enforecast.feature_store import build_states  # noqa: E402
+from enforecast.features import (  # noqa: E402
+    LAG_COLS,
+    LAG_FEATURE_COLS,
+    N_LAGS,
+    SHARE_COLS,
+    SHARE_SOURCES,
+    append_year,
+    build_features,
+)
+
+DATA_PATH = os.path.join(PROJECT_ROOT, "data", "ml_panel.csv")
+RAW_COLS = [
+    "iso3", "year", "electricity_generation_twh",
+    "low_carbon_share_pct", "fossil_share_pct",
+] + [f"{src}_twh" for src in SHARE_SOURCES]
+
+
+def _groupby_reference(df: pd.DataFrame) -> pd.DataFrame:
+    # steps 2-3 of ml/build_dataset.py before the shared module
+    gen = df["electricity_generation_twh"].clip(lower=1e-9)
+    for src in SHARE_SOURCES:
+        df[f"{src}_share"] = df[f"{src}_twh"] / gen
+    df = df.sort_values(["iso3", "year"])
+    for col in LAG_COLS:
+        for lag in range(1, N_LAGS + 1):
+            df[f"{col}_lag{lag}"] = df.groupby("iso3")[col].shift(lag)
+    return df
+
+
+def _timed(fn, df, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn(df.copy())
+        best = min(best, time.perf_counter() - t0)
+    return out, best * 1000.0
+
+
+def _check_states():
+    from model_service import _get_engine, _initial_state
+
+    panel = pd.read_csv(DATA_PATH)
+    engine = _get_engine()
+    states = build_states(panel, engine.feature_cols)
+    failures = []
+    for iso3, hist in panel.groupby("iso3"):
+        try:
+            expected = _initial_state(engine, iso3, hist)
+        except ValueError:
+            expected = None
+        got = states.get(iso3)
+        if (expected is None) != (got is None):
+            failures.append(f"build_states {iso3}")
+            continue
+        if expected is None:
+            continue
+        same = expected.base_year == got.base_year and all(
+            np.array_equal(a, b, equal_nan=True)
+            for a, b in zip(expected[:3], got[:3])
+        )
+        if not same:
+            failures.append(f"build_states {iso3}")
+    print(f"build_states checked on {panel['iso3'].nunique()} countries")
+    return failures
+
+
+def main():
+    raw = pd.read_csv(DATA_PATH, usecols=RAW_COLS)[RAW_COLS]
+    # shuffled, so both implementations have to sort
+    raw = raw.sample(frac=1.0, random_state=0)
+
+    expected, ref_ms = _timed(_groupby_reference, raw)
+    got, new_ms = _timed(lambda d: build_features(d, group_col="iso3"), raw)
+    print(f"{len(raw)} rows: groupby/shift {ref_ms:.1f} ms, "
+          f"build_features {new_ms:.1f} ms")
+
+    failures = []
+    if list(got.columns) != list(expected.columns):
+        failures.append("column order")
+    if not got.index.equals(expected.index):
+        failures.append("row order")
+    for col in SHARE_COLS + LAG_FEATURE_COLS:
+        if not np.array_equal(got[col].to_numpy(float),
+                              expected[col].to_numpy(float), equal_nan=True):
+            failures.append(col)
+
+    last = got.groupby("iso3").tail(1)
+    prev = got.drop(index=last.index).groupby("iso3").tail(1)
+    appended = append_year(prev, raw.loc[last.index])
+    appended = appended[appended["iso3"].isin(prev["iso3"])]
+    last = last.loc[appended.index]
+    for col in SHARE_COLS + LAG_FEATURE_COLS:
+        if not np.array_equal(appended[col].to_numpy(float),
+                              last[col].to_numpy(float), equal_nan=True):
+            failures.append(f"append_year {col}")
+    print(f"append_year checked on {len(appended)} countries")
+
+    failures += _check_states()
+
+    if failures:
+        for name in failures:
+            print(f"MISMATCH {name}")
+        sys.exit(1)
+    print("features.py output identical to the groupby reference")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Check where the served models' prediction intervals lie relative to
+their point forecasts.
+
+Forecasts every country in data/ml_panel.csv at the maximum horizon
+with ?intervals=80,95 (predict_horizon_batch) and counts, for every
+year and both targets, bands without lower <= point <= upper.
+
+The bands are bootstrapped from the raw one-step residuals, so a model
+with a large bias (model_service.residual_bias, "bias" in
+/model-metrics) legitimately gets bands beside its point forecast: the
+point is then the unlikely outcome. Misses are reported; with --strict,
+meant for INTERVAL_CENTER_RESIDUALS=1, they exit non-zero.
+
+    python notebooks/check_intervals.py [--strict]
+"""
+import argparse
+import os
+import sys
+
+import pandas as pd
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "api"))
+
+from model_service import model_info, predict_horizon_batch  # noqa: E402
+
+DATA_PATH = os.path.join(PROJECT_ROOT, "data", "ml_panel.csv")
+HORIZON = 10
+LEVELS = [80, 95]
+TARGETS = ["low_carbon_share_pct", "electricity_generation_twh"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--strict", action="store_true",
+                        help="exit non-zero when a point lies outside its band")
+    args = parser.parse_args()
+
+    df = pd.read_csv(DATA_PATH)
+    histories = {iso3: hist for iso3, hist in df.groupby("iso3")}
+    out = predict_horizon_batch(histories, HORIZON, intervals=LEVELS)
+
+    misses = []
+    n_checked = 0
+    for result in out["results"]:
+        for row in result["forecasts"]:
+            for level, band in row["intervals"].items():
+                for target in TARGETS:
+                    lo, hi = band[target]
+                    n_checked += 1
+                    if not lo <= row[target] <= hi:
+                        misses.append((result["iso3"], row["year"], level, target,
+                                       row[target], lo, hi))
+
+    print(f"Checked {n_checked} bands over {len(out['results'])} countries "
+          f"(model {out['model_version']})")
+    print(f"Residual bias: {model_info()['residual_bias']}")
+    if misses:
+        for iso3, year, level, target, point, lo, hi in misses[:20]:
+            print(f"OUTSIDE {iso3} {year} {level}% {target}: "
+                  f"{point:.3f} not in [{lo:.3f}, {hi:.3f}]")
+        print(f"{len(misses)} points outside their band")
+        if args.strict:
+            sys.exit(1)
+        return
+    print("Every point forecast lies inside its bands")
+
+
+if __name__ == "__main__":
+    main()
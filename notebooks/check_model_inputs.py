@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Check that feature_config.json feeds each served model the inputs it
+was trained on.
+
+lc_input / gen_input say whether a model takes the raw feature columns
+or the StandardScaler'd ones. A wrong value does not fail anywhere: the
+model just predicts from inputs on the wrong scale. This scores the
+one-step predictions of the served LC and GEN models on the validation
+years of data/ml_panel.csv (train_year_max < year <= val_year_max,
+train-mean imputation as in ml/train_models.py) with both kinds of
+input and reports models whose configured kind is the worse one; with
+--strict it exits non-zero for them.
+
+The shipped LC model is such a case: it was trained on raw features but
+its config (no "lc_input", legacy default "scaled") feeds it scaled
+ones. Switching it changes served forecasts, so it is left to a
+separate change.
+
+Independent of the ForecastEngine/pandas comparison in
+check_forecast_engine.py, which reads the same setting on both sides.
+
+    python notebooks/check_model_inputs.py [--strict]
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "api"))
+
+from model_service import MODELS_DIR, _read_artifacts, _scaled_input  # noqa: E402
+
+DATA_PATH = os.path.join(PROJECT_ROOT, "data", "ml_panel.csv")
+
+
+def _rmse(y, pred) -> float:
+    return float(np.sqrt(np.mean((np.asarray(y) - np.asarray(pred)) ** 2)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--strict", action="store_true",
+                        help="exit non-zero when a model gets the wrong inputs")
+    args = parser.parse_args()
+
+    cfg, _, lc_model, gen_model = _read_artifacts(MODELS_DIR)
+    cols = cfg["feature_cols"]
+    targets = {"lc": cfg["target_lc"], "gen": cfg["target_gen"]}
+    models = {"lc": lc_model, "gen": gen_model}
+
+    df = pd.read_csv(DATA_PATH)
+    df = df[df[targets["lc"]].notna() & df[targets["gen"]].notna()]
+    train = df[df["year"] <= cfg["train_year_max"]]
+    val = df[(df["year"] > cfg["train_year_max"]) & (df["year"] <= cfg["val_year_max"])]
+
+    X = val[cols].fillna(train[cols].mean()).to_numpy(dtype=float)
+    inputs = {
+        "raw": X,
+        "scaled": (X - np.asarray(cfg["scaler_mean"])) / np.asarray(cfg["scaler_scale"]),
+    }
+
+    failures = []
+    print(f"One-step validation RMSE over {len(val)} rows "
+          f"({cfg['train_year_max'] + 1}-{cfg['val_year_max']})")
+    for target, model in models.items():
+        y = val[targets[target]].to_numpy()
+        scores = {kind: _rmse(y, model.predict(Xk)) for kind, Xk in inputs.items()}
+        configured = "scaled" if _scaled_input(cfg, target) else "raw"
+        best = min(scores, key=scores.get)
+        print(f"  {targets[target]:<14} raw {scores['raw']:.4f}  "
+              f"scaled {scores['scaled']:.4f}  configured {configured}")
+        if configured != best:
+            failures.append((target, configured, best))
+
+    if failures:
+        for target, configured, best in failures:
+            print(f"WRONG INPUT {target}: configured {configured}, model fits {best} "
+                  f"(set \"{target}_input\": \"{best}\" in feature_config.json)")
+        if args.strict:
+            sys.exit(1)
+        return
+    print("Every model gets the inputs it scores best on")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,89 +1,230 @@
 # -*- coding: utf-8 -*-
+"""
+Forecast report: history + forecast plots of every country in
+reports/plots (<ISO3>_low_carbon.png and <ISO3>_generation.png).
+
+All histories come from one query (or the ML panel file), all forecasts
+from one predict_horizon_batch call in-process, and the figures are
+rendered by a pool of worker processes with the Agg backend.
+
+Each country's plots are keyed by a hash of its inputs (history rows,
+model artifact hash, horizon), stored in reports/plots/manifest.json.
+Countries whose hash is unchanged and whose PNGs exist are skipped, so
+a rerun after a data load only redraws what changed.
+
+    python notebooks/validate_forecasts.py [--horizon 10] [--workers 4]
+                                           [--panel data/ml_panel.csv]
+                                           [--countries DEU,FRA] [--force]
+
+Without --panel, histories are read from DATABASE_URL.
+"""
+import argparse
+import hashlib
+import json
 import os
-import psycopg2
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 import pandas as pd
-import requests
 from dotenv import load_dotenv
-import matplotlib.pyplot as plt
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "api"))
+
+from enforecast.feature_store import HISTORY_COLS, HISTORY_SELECT  # noqa: E402
+from model_service import artifact_hash, predict_horizon_batch  # noqa: E402
 
 load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-API_BASE = "http://127.0.0.1:8000"
+OUT_DIR = os.path.join(PROJECT_ROOT, "reports", "plots")
+MANIFEST = "manifest.json"
+# bump when the figures change, so every plot is redrawn once
+REPORT_VERSION = 1
+
+PLOTS = [
+    # (file suffix, column, title, y label, history colour)
+    ("low_carbon", "low_carbon_share_pct", "Low-carbon share",
+     "Low-carbon share (%)", "tab:blue"),
+    ("generation", "electricity_generation_twh", "Electricity generation (TWh)",
+     "TWh", "tab:green"),
+]
+
+
+def load_histories(database_url: str = None, panel_path: str = None) -> dict:
+    """
+    iso3 -> history frame (HISTORY_COLS, sorted by year), from one query
+    or from the panel file.
+    """
+    if panel_path:
+        if panel_path.endswith(".csv"):
+            panel = pd.read_csv(panel_path, usecols=HISTORY_COLS)
+        else:
+            panel = pd.read_parquet(panel_path, columns=HISTORY_COLS)
+    else:
+        import psycopg2
+
+        conn = psycopg2.connect(database_url)
+        try:
+            with conn.cursor() as cur:
+                cur.execute(HISTORY_SELECT + "ORDER BY c.iso3, e.year;")
+                panel = pd.DataFrame(cur.fetchall(), columns=HISTORY_COLS)
+        finally:
+            conn.close()
+
+    panel = panel.assign(iso3=panel["iso3"].astype(str).str.strip())
+    panel = panel.sort_values(["iso3", "year"], kind="stable")
+    return {
+        iso3: hist[HISTORY_COLS].reset_index(drop=True)
+        for iso3, hist in panel.groupby("iso3", sort=True)
+    }
+
+
+def input_hash(hist: pd.DataFrame, model_hash: str, horizon: int) -> str:
+    h = hashlib.sha256()
+    h.update(f"{REPORT_VERSION}:{model_hash}:{horizon}\n".encode())
+    h.update(hist.to_csv(index=False).encode())
+    return h.hexdigest()
+
+
+def plot_paths(iso3: str, out_dir: str) -> list:
+    return [os.path.join(out_dir, f"{iso3}_{suffix}.png") for suffix, *_ in PLOTS]
+
+
+def _init_worker():
+    import matplotlib
 
-def fetch_history(iso3: str) -> pd.DataFrame:
-    conn = psycopg2.connect(DATABASE_URL)
-    q = """
-        SELECT e.year, e.low_carbon_share_pct, e.electricity_generation_twh
-        FROM energy_yearly e
-        JOIN countries c ON c.country_id = e.country_id
-        WHERE c.iso3 = %s
-        ORDER BY e.year;
+    matplotlib.use("Agg")
+
+
+def render_country(job: tuple) -> str:
+    """
+    Draw both figures of one country. `job` is (iso3, out_dir, history
+    columns, forecast columns) as plain lists, cheap to send to a worker.
     """
-    df = pd.read_sql(q, conn, params=[iso3])
-    conn.close()
-    return df
+    import matplotlib.pyplot as plt
+
+    iso3, out_dir, hist, fc = job
+    for (suffix, col, title, ylabel, color), path in zip(PLOTS, plot_paths(iso3, out_dir)):
+        fig, ax = plt.subplots(figsize=(7, 3.5))
+        ax.set_title(f"{iso3} – {title}")
+        ax.plot(hist["year"], hist[col], label="history", color=color)
+        ax.plot(fc["year"], fc[col], label="forecast", color="tab:red",
+                linestyle="--", marker="o")
+        ax.set_xlabel("Year")
+        ax.set_ylabel(ylabel)
+        ax.legend()
+        fig.tight_layout()
+        fig.savefig(path)
+        plt.close(fig)
+    return iso3
+
+
+def _read_manifest(out_dir: str) -> dict:
+    path = os.path.join(out_dir, MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
 
-def fetch_forecast(iso3: str, horizon: int = 10) -> dict:
-    url = f"{API_BASE}/forecast/{iso3}"
-    r = requests.get(url, params={"horizon": horizon}, timeout=10)
-    r.raise_for_status()
-    return r.json()
 
-def plot_country(iso3: str, out_dir="reports/plots", horizon: int = 10):
+def _write_manifest(out_dir: str, manifest: dict):
+    path = os.path.join(out_dir, MANIFEST)
+    with open(path + ".tmp", "w") as f:
+        json.dump(dict(sorted(manifest.items())), f, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+def run(histories: dict, horizon: int = 10, out_dir: str = OUT_DIR,
+        workers: int = None, force: bool = False) -> dict:
+    """
+    Redraw the plots of every country in `histories` whose inputs
+    changed since the last run. Returns counts and timings.
+    """
+    t0 = time.perf_counter()
     os.makedirs(out_dir, exist_ok=True)
+    manifest = {} if force else _read_manifest(out_dir)
+    model_hash = artifact_hash()
+
+    hashes, todo = {}, {}
+    for iso3, hist in histories.items():
+        hashes[iso3] = input_hash(hist, model_hash, horizon)
+        fresh = manifest.get(iso3) == hashes[iso3] and all(
+            os.path.exists(p) for p in plot_paths(iso3, out_dir)
+        )
+        if not fresh:
+            todo[iso3] = hist
+
+    batch = predict_horizon_batch(todo, horizon) if todo else {"results": [], "errors": {}}
+    t_forecast = time.perf_counter()
+
+    cols = ["year"] + [col for _, col, *_ in PLOTS]
+    jobs = []
+    for res in batch["results"]:
+        iso3 = res["iso3"]
+        hist = todo[iso3]
+        fc = pd.DataFrame(res["forecasts"])
+        jobs.append((
+            iso3,
+            out_dir,
+            {c: hist[c].astype(float).tolist() for c in cols},
+            {c: fc[c].astype(float).tolist() for c in cols},
+        ))
+
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            done = list(pool.map(render_country, jobs,
+                                 chunksize=max(1, len(jobs) // (4 * workers))))
+    else:
+        _init_worker()
+        done = [render_country(job) for job in jobs]
+
+    for iso3 in done:
+        manifest[iso3] = hashes[iso3]
+    _write_manifest(out_dir, manifest)
+
+    t_end = time.perf_counter()
+    return {
+        "countries": len(histories),
+        "rendered": len(done),
+        "skipped": len(histories) - len(todo),
+        "errors": batch["errors"],
+        "forecast_seconds": round(t_forecast - t0, 3),
+        "plot_seconds": round(t_end - t_forecast, 3),
+    }
 
-    hist = fetch_history(iso3)
-    if hist.empty:
-        raise ValueError("No history")
-
-    fc = fetch_forecast(iso3, horizon=horizon)
-    fc_df = pd.DataFrame(fc["forecasts"])
-
-    # 1) Low-carbon share
-    fig, ax1 = plt.subplots(figsize=(7, 3.5))
-    ax1.set_title(f"{iso3} – Low-carbon share")
-    ax1.plot(hist["year"], hist["low_carbon_share_pct"],
-             label="history", color="tab:blue")
-    ax1.plot(fc_df["year"], fc_df["low_carbon_share_pct"],
-             label="forecast", color="tab:red",
-             linestyle="--", marker="o")
-    ax1.set_xlabel("Year")
-    ax1.set_ylabel("Low-carbon share (%)")
-    ax1.legend()
-    plt.tight_layout()
-    fig.savefig(os.path.join(out_dir, f"{iso3}_low_carbon.png"))
-    plt.close(fig)
-
-    # 2) Electricity generation
-    fig, ax2 = plt.subplots(figsize=(7, 3.5))
-    ax2.set_title(f"{iso3} – Electricity generation (TWh)")
-    ax2.plot(hist["year"], hist["electricity_generation_twh"],
-             label="history", color="tab:green")
-    ax2.plot(fc_df["year"], fc_df["electricity_generation_twh"],
-             label="forecast", color="tab:red",
-             linestyle="--", marker="o")
-    ax2.set_xlabel("Year")
-    ax2.set_ylabel("TWh")
-    ax2.legend()
-    plt.tight_layout()
-    fig.savefig(os.path.join(out_dir, f"{iso3}_generation.png"))
-    plt.close(fig)
-
-def fetch_all_iso3():
-    conn = psycopg2.connect(DATABASE_URL)
-    df = pd.read_sql("SELECT DISTINCT iso3 FROM countries ORDER BY iso3", conn)
-    conn.close()
-    return df["iso3"].tolist()
 
 def main():
-    iso_list = fetch_all_iso3()
-    for iso3 in iso_list:
-        try:
-            print(f"Processing {iso3}...")
-            plot_country(iso3, horizon=10)
-        except Exception as e:
-            print(f"Skip {iso3}: {e}")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--horizon", type=int, default=10)
+    parser.add_argument("--workers", type=int,
+                        help="plotting processes (default: CPU count)")
+    parser.add_argument("--panel", help="read histories from this panel file "
+                                        "instead of DATABASE_URL")
+    parser.add_argument("--countries", help="comma-separated ISO3 codes")
+    parser.add_argument("--out-dir", default=OUT_DIR)
+    parser.add_argument("--force", action="store_true",
+                        help="redraw every plot, ignoring the manifest")
+    args = parser.parse_args()
+
+    if not args.panel and not DATABASE_URL:
+        parser.error("DATABASE_URL is not set; pass --panel to use a panel file")
+
+    histories = load_histories(DATABASE_URL, args.panel)
+    if args.countries:
+        wanted = {c.strip().upper() for c in args.countries.split(",")}
+        histories = {k: v for k, v in histories.items() if k in wanted}
+
+    result = run(histories, args.horizon, args.out_dir, args.workers, args.force)
+    for iso3, err in sorted(result["errors"].items()):
+        print(f"Skip {iso3}: {err}")
+    print(f"{result['rendered']} countries plotted, {result['skipped']} unchanged, "
+          f"{len(result['errors'])} skipped "
+          f"(forecasts {result['forecast_seconds']:.2f} s, "
+          f"plots {result['plot_seconds']:.2f} s)")
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()